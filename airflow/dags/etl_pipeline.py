@@ -0,0 +1,198 @@
+"""Airflow DAGs driving the extractor and transformer as partitioned, parallel tasks.
+
+Each source table (one per family, node and week) is a partition. Extraction and
+transformation run as dynamically mapped tasks, one instance per partition:
+
+    list_partitions -> extract_partition (mapped) -> transform_partition (mapped)
+
+`extract_partition` returns a watermark (table, offset, last_date) through XCom,
+and `transform_partition` only processes dates before that watermark: the slot
+at last_date may be only partly extracted (batches split slots, and the source
+may still be writing it). It is transformed once the table's week is over and
+an extraction found no new rows.
+
+`etl_pipeline` runs every 15 minutes over the current weekly tables.
+`etl_backfill` is triggered manually with a date range and reprocesses every
+table overlapping it, e.g. a whole year of weekly tables in parallel. Slots of
+the range that already have KPI results are replaced, not inserted again.
+
+Both mapped tasks run in the `source_mysql` pool, which caps concurrent queries
+against the company server. Create it once with:
+
+    airflow pools set source_mysql 4 "Concurrent queries on the source MySQL server"
+
+The service code is read from PIPELINE_ROOT (mount the repository there). The
+extractor and transformer both have `config` and `tools` modules, so each task
+imports only one of them, inside the task.
+"""
+import os
+import sys
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from airflow.decorators import dag, task
+from airflow.exceptions import AirflowSkipException
+from airflow.models import Variable
+from airflow.models.param import Param
+
+PIPELINE_ROOT = os.getenv("PIPELINE_ROOT", "/opt/pipeline")
+SOURCE_POOL = os.getenv("SOURCE_POOL", "source_mysql")
+EXTRACTOR_PATH = os.path.join(PIPELINE_ROOT, "extractor", "src", "utils")
+TRANSFORMER_PATH = os.path.join(PIPELINE_ROOT, "transformer", "src", "utils")
+
+default_args = {
+    "owner": "etl",
+    "retries": 2,
+    "retry_delay": timedelta(minutes=2),
+}
+
+
+def use_service(path: str):
+    """Make one service's flat modules importable and run from the repository root."""
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    os.chdir(PIPELINE_ROOT)
+
+
+def week_bounds(year: int, week: int) -> tuple:
+    """Return the [monday, next monday) dates of an ISO week."""
+    monday = date.fromisocalendar(year, week, 1)
+    return monday, monday + timedelta(days=7)
+
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+
+@task
+def list_partitions(start: Optional[str] = None, end: Optional[str] = None, families: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """List the weekly source tables overlapping [start, end] as partitions."""
+    use_service(EXTRACTOR_PATH)
+    from extractor import Extractor
+    from config import SOURCE_CONFIG, start_year
+
+    start_day, end_day = parse_day(start), parse_day(end)
+    extractor = Extractor(SOURCE_CONFIG)
+    extractor.extract_tables_names()
+
+    partitions = []
+    for descriptor in extractor.catalog.query(start_year=start_year):
+        if families and descriptor.family not in families:
+            continue
+        monday, next_monday = week_bounds(descriptor.year, descriptor.week)
+        if (start_day and next_monday <= start_day) or (end_day and monday > end_day):
+            continue
+        partitions.append({
+            "table": descriptor.name,
+            "family": descriptor.family,
+            "node": descriptor.node,
+            "year": descriptor.year,
+            "week": descriptor.week,
+        })
+    logging.info(f"Listed {len(partitions)} partitions between {start} and {end}")
+    return partitions
+
+
+@task(pool=SOURCE_POOL)
+def extract_partition(partition: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract new rows of one table and return its watermark."""
+    use_service(EXTRACTOR_PATH)
+    from orchestrator import Orchestrator
+    from tools import load_last_extracted
+
+    rows = Orchestrator().poll_table(partition["table"])
+    checkpoint = load_last_extracted().get(partition["table"], {})
+    return {
+        **partition,
+        "rows": rows,
+        "offset": checkpoint.get("offset", 0),
+        "last_date": checkpoint.get("last_date"),
+    }
+
+
+@task(pool=SOURCE_POOL)
+def transform_partition(watermark: Dict[str, Any], start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+    """Compute KPIs of one 5-minute table up to its extraction watermark.
+
+    Without an explicit [start, end] range, the task continues from the last
+    transformed date, kept per table in the `transform_watermark__<table>` Variable.
+    With a range (backfill), existing results of the range are replaced.
+    """
+    if watermark["family"] != "5min":
+        raise AirflowSkipException(f"No KPI formulas for {watermark['family']} tables")
+    if not watermark.get("last_date"):
+        raise AirflowSkipException(f"Nothing extracted yet from {watermark['table']}")
+
+    table = watermark["table"]
+    variable_key = f"transform_watermark__{table}"
+    end_date = watermark["last_date"]
+    _, next_monday = week_bounds(watermark["year"], watermark["week"])
+    if watermark.get("rows") or date.today() < next_monday:
+        # The slot at the watermark may still be incomplete; stop just before it
+        end_date = (datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S") - timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S")
+    if start or end:
+        start_date = f"{start} 00:00:00" if start else None
+        if end:
+            end_date = min(end_date, f"{end} 23:59:59")
+    else:
+        previous = Variable.get(variable_key, default_var=None)
+        start_date = None
+        if previous:
+            start_date = (datetime.strptime(previous, "%Y-%m-%d %H:%M:%S") + timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S")
+            if start_date > end_date:
+                raise AirflowSkipException(f"{table} already transformed up to {previous}")
+
+    use_service(TRANSFORMER_PATH)
+    from transformer import Transformer
+
+    transformer = Transformer()
+    transformer.create_tables()
+    slots = transformer.process_table(table, start_date, end_date, replace=bool(start or end))
+    if not (start or end):
+        Variable.set(variable_key, end_date)
+    return {"table": table, "slots": slots, "from": start_date, "until": end_date}
+
+
+@dag(
+    dag_id="etl_pipeline",
+    description="Incremental extract + transform of the current weekly tables",
+    schedule=timedelta(minutes=15),
+    start_date=datetime(2024, 1, 1),
+    catchup=False,
+    max_active_runs=1,
+    default_args=default_args,
+    tags=["etl"],
+)
+def etl_pipeline():
+    today = "{{ data_interval_end | ds }}"
+    partitions = list_partitions(start=today, end=today)
+    watermarks = extract_partition.expand(partition=partitions)
+    transform_partition.expand(watermark=watermarks)
+
+
+@dag(
+    dag_id="etl_backfill",
+    description="Reprocess every weekly table overlapping a date range in parallel",
+    schedule=None,
+    start_date=datetime(2024, 1, 1),
+    catchup=False,
+    default_args=default_args,
+    render_template_as_native_obj=True,
+    params={
+        "start": Param("2024-01-01", type="string", format="date"),
+        "end": Param("2024-12-31", type="string", format="date"),
+        "families": Param(["5min", "15min", "mgw"], type="array"),
+    },
+    tags=["etl", "backfill"],
+)
+def etl_backfill():
+    start = "{{ params.start }}"
+    end = "{{ params.end }}"
+    partitions = list_partitions(start=start, end=end, families="{{ params.families }}")
+    watermarks = extract_partition.expand(partition=partitions)
+    transform_partition.partial(start=start, end=end).expand(watermark=watermarks)
+
+
+etl_pipeline()
+etl_backfill()
@@ -0,0 +1,14 @@
+import os
+import sys
+import logging
+
+# Service modules use flat imports from the utils directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils"))
+
+from detection import run
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+if __name__ == "__main__":
+    run()
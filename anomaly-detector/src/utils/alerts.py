@@ -0,0 +1,230 @@
+import uuid
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from multivariate import SlotScore
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+AlertKey = Tuple[str, str, Optional[str]]  # (node, kpi, operator)
+
+# Suppressed alert keys remembered per incident, so each is counted once
+MAX_SUPPRESSED_KEYS = 1000
+
+
+@dataclass
+class Alert:
+    node: str
+    kpi: str
+    operator: Optional[str]
+    incident: str
+    opened: str
+    last_active: str
+    peak_z: float
+    state: str = 'open'  # open -> ongoing -> resolved
+    slots: int = 1  # active slots
+    clear_slots: int = 0  # consecutive slots without activity
+    suffixes: Set[str] = field(default_factory=set)
+    group: Optional[str] = None  # detector group the alert was raised with
+    resolved: Optional[str] = None
+
+
+@dataclass
+class Incident:
+    id: str
+    opened: str
+    nodes: Set[str] = field(default_factory=set)
+    kpis: Set[str] = field(default_factory=set)
+    groups: Set[str] = field(default_factory=set)
+    open_alerts: int = 0
+    total_alerts: int = 0
+    suppressed: int = 0  # alerts not tracked because the index was full
+    suppressed_keys: Set[AlertKey] = field(default_factory=set)  # at most MAX_SUPPRESSED_KEYS
+    peak_z: float = 0.0
+    notified_slot: int = 0
+    changed: bool = False
+
+    def summary(self) -> str:
+        return (f"{', '.join(sorted(self.kpis)[:10])} on {', '.join(sorted(self.nodes))} "
+                f"({self.open_alerts} open alerts of {self.total_alerts + self.suppressed}, peak z {self.peak_z:+.1f})")
+
+
+class AlertManager:
+    """Turns per-slot anomaly contributors into deduplicated alert events.
+
+    One alert is kept per (node, KPI, operator), whatever the number of suffixes
+    and slots it spans. An alert opens when a contributor reaches open_z (or
+    belongs to a flagged group), stays ongoing while it keeps reaching clear_z,
+    and resolves after resolve_slots slots in a row below it, so a value
+    hovering around the threshold does not flap.
+
+    Alerts sharing a node, a KPI or a detector group with an open incident join
+    it; events are emitted per incident: 'open' once, 'update' at most every
+    renotify_slots slots when alerts were added or the peak grew, and 'resolve'
+    when its last alert resolves. Only unresolved alerts are held in memory,
+    at most max_alerts; beyond that new alerts are only counted on their
+    incident, once per key (up to MAX_SUPPRESSED_KEYS keys per incident), and
+    a suppressed key tracked later moves to the incident's alerts. Alert
+    states, with their group, are written to kpi_alerts by persist().
+    """
+
+    def __init__(self, open_z: float = 4.0, clear_z: float = 2.0, resolve_slots: int = 3, renotify_slots: int = 6,
+                 max_alerts: int = 10000):
+        self.open_z = open_z
+        self.clear_z = clear_z
+        self.resolve_slots = resolve_slots
+        self.renotify_slots = renotify_slots
+        self.max_alerts = max_alerts
+        self.alerts: Dict[AlertKey, Alert] = {}
+        self.incidents: Dict[str, Incident] = {}
+        self.dirty: Dict[Tuple[AlertKey, str], Alert] = {}  # by (key, opened): a key may resolve and reopen between persists
+        self.slot = 0
+        self.stats = {'anomalies': 0, 'events': 0, 'suppressed': 0}
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> 'AlertManager':
+        return cls(settings['open_z'], settings['clear_z'], settings['resolve_slots'], settings['renotify_slots'],
+                   settings['max_alerts'])
+
+    def active(self, result: SlotScore) -> Dict[AlertKey, Tuple[float, Set[str], Optional[str]]]:
+        """Strongest z, suffixes and group per alert key among the slot's contributors still over clear_z."""
+        active: Dict[AlertKey, Tuple[float, Set[str], Optional[str]]] = {}
+        for c in result.contributors:
+            if abs(c['z']) < self.clear_z and not c['group']:
+                continue
+            key = (c['node'], c['kpi'], c['operator'])
+            z, suffixes, group = active.get(key, (0.0, set(), None))
+            suffixes.add(c['suffix'])
+            active[key] = (c['z'] if abs(c['z']) > abs(z) else z, suffixes, group or c['group'])
+        return active
+
+    def incident_for(self, key: AlertKey, group: Optional[str], date: str) -> Incident:
+        node, kpi, _ = key
+        for incident in self.incidents.values():
+            if node in incident.nodes or kpi in incident.kpis or (group and group in incident.groups):
+                return incident
+        # Derived from the opening alert, so slots scored again after a restart give the same incident
+        incident = Incident(str(uuid.uuid5(uuid.NAMESPACE_URL, f"{date}/{node}/{kpi}/{key[2]}")), date, notified_slot=self.slot)
+        self.incidents[incident.id] = incident
+        return incident
+
+    def update(self, result: SlotScore) -> List[Dict[str, Any]]:
+        """Advance every alert with one scored slot. Returns the incident events to emit."""
+        self.slot += 1
+        self.stats['anomalies'] += len(result.contributors)
+        active = self.active(result)
+        opened: Set[str] = set()
+
+        for key, alert in list(self.alerts.items()):
+            incident = self.incidents[alert.incident]
+            if key in active:
+                z, suffixes, group = active.pop(key)
+                alert.state, alert.last_active, alert.clear_slots = 'ongoing', result.date, 0
+                alert.slots += 1
+                alert.suffixes |= suffixes
+                if group and not alert.group:
+                    alert.group = group
+                    incident.groups.add(group)
+                if abs(z) > abs(alert.peak_z):
+                    alert.peak_z = z
+                    incident.changed |= abs(z) > abs(incident.peak_z)
+                    incident.peak_z = max(incident.peak_z, z, key=abs)
+            else:
+                alert.clear_slots += 1
+                if alert.clear_slots < self.resolve_slots:
+                    continue
+                alert.state, alert.resolved = 'resolved', result.date
+                del self.alerts[key]
+                incident.open_alerts -= 1
+            self.dirty[key, alert.opened] = alert
+
+        for key, (z, suffixes, group) in sorted(active.items(), key=lambda item: -abs(item[1][0])):
+            if abs(z) < self.open_z and not group:
+                continue
+            incident = self.incident_for(key, group, result.date)
+            if incident.total_alerts + incident.suppressed == 0:
+                opened.add(incident.id)
+            if abs(z) > abs(incident.peak_z):
+                incident.peak_z = z
+                incident.changed = True
+            if len(self.alerts) >= self.max_alerts:
+                # A key already counted stays active every slot; only a new one changes the incident
+                if key not in incident.suppressed_keys and len(incident.suppressed_keys) < MAX_SUPPRESSED_KEYS:
+                    incident.suppressed_keys.add(key)
+                    incident.suppressed += 1
+                    self.stats['suppressed'] += 1
+                    self.join(incident, key, group)
+                continue
+            if key in incident.suppressed_keys:
+                incident.suppressed_keys.discard(key)
+                incident.suppressed -= 1
+            alert = Alert(key[0], key[1], key[2], incident.id, result.date, result.date, z, suffixes=set(suffixes), group=group)
+            self.alerts[key] = self.dirty[key, alert.opened] = alert
+            self.join(incident, key, group)
+            incident.open_alerts += 1
+            incident.total_alerts += 1
+
+        events = []
+        for incident in list(self.incidents.values()):
+            if incident.id in opened:
+                events.append(self.event(incident, 'open', result.date))
+            elif incident.open_alerts <= 0:
+                events.append(self.event(incident, 'resolve', result.date))
+                del self.incidents[incident.id]
+            elif incident.changed and self.slot - incident.notified_slot >= self.renotify_slots:
+                events.append(self.event(incident, 'update', result.date))
+        self.stats['events'] += len(events)
+        return events
+
+    @staticmethod
+    def join(incident: Incident, key: AlertKey, group: Optional[str]):
+        node, kpi, _ = key
+        incident.nodes.add(node)
+        incident.kpis.add(kpi)
+        if group:
+            incident.groups.add(group)
+        incident.changed = True
+
+    def event(self, incident: Incident, kind: str, date: str) -> Dict[str, Any]:
+        incident.notified_slot = self.slot
+        incident.changed = False
+        return {'incident': incident.id, 'event': kind, 'date': date, 'alerts': incident.total_alerts + incident.suppressed,
+                'open_alerts': incident.open_alerts, 'nodes': ','.join(sorted(incident.nodes)),
+                'kpis': ','.join(sorted(incident.kpis)), 'peak_z': incident.peak_z, 'summary': incident.summary()}
+
+    def persist(self, cursor) -> int:
+        """Upsert the alerts changed since the last call (no commit). Returns their number."""
+        if not self.dirty:
+            return 0
+        cursor.executemany("""
+            INSERT INTO kpi_alerts (node, kpi, operator, incident_id, state, opened_at, last_active, resolved_at, slots, peak_z, suffixes, grp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE state = VALUES(state), last_active = VALUES(last_active), resolved_at = VALUES(resolved_at),
+                slots = VALUES(slots), peak_z = VALUES(peak_z), suffixes = VALUES(suffixes), grp = VALUES(grp)
+        """, [(a.node, a.kpi, a.operator or '', a.incident, a.state, a.opened, a.last_active, a.resolved, a.slots, a.peak_z,
+               ','.join(sorted(a.suffixes))[:1000], a.group or '') for a in self.dirty.values()])
+        count = len(self.dirty)
+        self.dirty = {}
+        return count
+
+    def restore(self, cursor) -> int:
+        """Reload the unresolved alerts and rebuild their incidents. Returns the number of alerts."""
+        cursor.execute("""
+            SELECT node, kpi, operator, incident_id, state, opened_at, last_active, slots, peak_z, suffixes, grp
+            FROM kpi_alerts WHERE state <> 'resolved' ORDER BY opened_at LIMIT %s
+        """, (self.max_alerts,))
+        for node, kpi, operator, incident_id, state, opened, last_active, slots, peak_z, suffixes, group in cursor.fetchall():
+            key = (node, kpi, operator or None)
+            self.alerts[key] = Alert(node, kpi, operator or None, incident_id, str(opened), str(last_active), peak_z,
+                                     state=state, slots=slots, suffixes=set(filter(None, (suffixes or '').split(','))),
+                                     group=group or None)
+            incident = self.incidents.setdefault(incident_id, Incident(incident_id, str(opened)))
+            self.join(incident, key, group or None)
+            incident.changed = False
+            incident.open_alerts += 1
+            incident.total_alerts += 1
+            incident.peak_z = max(incident.peak_z, peak_z, key=abs)
+        if self.alerts:
+            logging.info(f"Restored {len(self.alerts)} unresolved alerts in {len(self.incidents)} incidents")
+        return len(self.alerts)
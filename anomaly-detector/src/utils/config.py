@@ -0,0 +1,58 @@
+from dotenv import load_dotenv
+from typing import Dict, Any, List
+import os
+
+# Database connection parameters
+load_dotenv()
+
+# KPI database (the transformer's destination) connection parameters
+DEST_DB_HOST = os.getenv("DEST_MYSQL_HOST")
+DEST_DB_USER = os.getenv("DEST_MYSQL_USER")
+DEST_DB_PASSWORD = os.getenv("DEST_MYSQL_PASSWORD")
+DEST_DB_NAME = "5min_kpi"
+DEST_DB_PORT = int(os.getenv("DEST_MYSQL_PORT", default=3306))
+
+# KPI database config
+DEST_DB_CONFIG = {
+    'host': DEST_DB_HOST,
+    'user': DEST_DB_USER,
+    'password': DEST_DB_PASSWORD,
+    'port': DEST_DB_PORT,
+    'database': DEST_DB_NAME
+}
+
+# Storage layout written by the transformer: 'wide' (*_details tables) or 'long' (kpi_fact)
+STORAGE_LAYOUT = os.getenv("TRANSFORMER_STORAGE_LAYOUT", default="wide")
+
+# KPIs scored by the multivariate detector (comma-separated, empty for all)
+DETECTOR_KPIS: List[str] = [kpi.strip().lower() for kpi in os.getenv("DETECTOR_KPIS", default="").split(",") if kpi.strip()]
+
+# Multivariate detector: every 5-minute slot becomes one vector of all (node, KPI,
+# suffix) values, scored against a low-rank model of their correlations
+detector_settings: Dict[str, Any] = {
+    'name': os.getenv("DETECTOR_NAME", default="multivariate"),
+    'components': int(os.getenv("DETECTOR_COMPONENTS", default=8)),  # principal components kept
+    'alpha': float(os.getenv("DETECTOR_ALPHA", default=0.05)),  # weight of a new slot in each dimension's level and scale
+    'forgetting': float(os.getenv("DETECTOR_FORGETTING", default=0.995)),  # decay of older slots in the components
+    'clip': float(os.getenv("DETECTOR_CLIP", default=3.0)),  # standardized values are clipped here before updating
+    'threshold': float(os.getenv("DETECTOR_THRESHOLD", default=4.0)),  # z-score flagging a slot or a group
+    'warmup_slots': int(os.getenv("DETECTOR_WARMUP_SLOTS", default=48)),  # slots a dimension is learned before it is scored
+    'relearn_slots': int(os.getenv("DETECTOR_RELEARN_SLOTS", default=12)),  # flagged slots in a row after which they are learned again
+    'top_contributors': int(os.getenv("DETECTOR_TOP_CONTRIBUTORS", default=20)),
+    'poll_seconds': float(os.getenv("DETECTOR_POLL_SECONDS", default=5)),
+    'node_timeout_seconds': float(os.getenv("DETECTOR_NODE_TIMEOUT", default=900)),  # nodes lagging more are not waited for
+    'lookback_hours': float(os.getenv("DETECTOR_LOOKBACK_HOURS", default=24)),  # history learned on a first start
+    'state_path': os.getenv("DETECTOR_STATE_PATH", default="./data/state/detector_state.npz"),
+    'save_seconds': float(os.getenv("DETECTOR_SAVE_SECONDS", default=60))
+}
+
+# Alert deduplication of the detector's output: one alert per (node, KPI, operator),
+# correlated alerts grouped into incidents, events written to alert_events
+alert_settings: Dict[str, Any] = {
+    'open_z': float(os.getenv("ALERT_OPEN_Z", default=4.0)),  # contributor z opening an alert
+    'clear_z': float(os.getenv("ALERT_CLEAR_Z", default=2.0)),  # z below which an alert counts as clear
+    'resolve_slots': int(os.getenv("ALERT_RESOLVE_SLOTS", default=3)),  # clear slots in a row resolving an alert
+    'renotify_slots': int(os.getenv("ALERT_RENOTIFY_SLOTS", default=6)),  # minimum slots between updates of an incident
+    'max_alerts': int(os.getenv("ALERT_MAX_ALERTS", default=10000)),  # unresolved alerts held in memory
+    'persist_seconds': float(os.getenv("ALERT_PERSIST_SECONDS", default=30))
+}
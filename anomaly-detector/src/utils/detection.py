@@ -0,0 +1,159 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from config import DEST_DB_CONFIG, detector_settings, alert_settings
+from tools import connect_database, create_anomaly_tables, create_alert_tables
+from reader import SlotReader
+from multivariate import MultivariateDetector, SlotScore
+from alerts import AlertManager
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class DetectionService:
+    """Scores each new KPI slot of all nodes with the multivariate detector and stores the results.
+
+    A slot is scored once every node that is not lagging by more than
+    node_timeout_seconds has written it (kpi_watermarks), so the vector is
+    aligned across nodes. Results of a slot, its alert events and the detector's
+    watermark are committed together; the model is saved every save_seconds and
+    on exit, and a restart resumes after the model's last slot. Alert states are
+    written every persist_seconds.
+    """
+
+    def __init__(self, settings: Dict[str, Any] = detector_settings, alert_config: Dict[str, Any] = alert_settings):
+        self.settings = settings
+        self.alert_config = alert_config
+        self.conn = connect_database(DEST_DB_CONFIG)
+        cursor = self.conn.cursor()
+        create_anomaly_tables(cursor)
+        create_alert_tables(cursor)
+        self.conn.commit()
+        self.reader = SlotReader(self.conn)
+        self.detector = MultivariateDetector.from_settings(settings)
+        self.detector.load(settings['state_path'])
+        self.alerts = AlertManager.from_settings(alert_config)
+        self.alerts.restore(cursor)
+        self.conn.commit()
+        cursor.close()
+        self.saved_at = self.persisted_at = time.monotonic()
+
+    def ready_until(self) -> Optional[str]:
+        """Newest slot every live node has written."""
+        marks = {node: datetime.strptime(date, DATE_FORMAT) for node, date in self.reader.watermarks().items()}
+        if not marks:
+            return None
+        cutoff = max(marks.values()) - timedelta(seconds=self.settings['node_timeout_seconds'])
+        return min(date for date in marks.values() if date >= cutoff).strftime(DATE_FORMAT)
+
+    def write(self, result: SlotScore, events: List[Dict[str, Any]]):
+        """Store a slot's score, its anomalies, alert events and the detector watermark in one commit."""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO kpi_anomaly_slots (Date, score, spe_z, t2_z, dimensions, flagged) VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE score = VALUES(score), spe_z = VALUES(spe_z), t2_z = VALUES(t2_z),
+                    dimensions = VALUES(dimensions), flagged = VALUES(flagged)
+            """, (result.date, result.score, result.spe_z, result.t2_z, result.dimensions, result.flagged))
+            cursor.execute("DELETE FROM kpi_anomalies WHERE Date = %s", (result.date,))
+            if result.contributors:
+                cursor.executemany("""
+                    INSERT INTO kpi_anomalies (Date, node, kpi, suffix, operator, value, expected, z, grp)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, [(result.date, c['node'], c['kpi'], c['suffix'], c['operator'], c['value'], c['expected'], c['z'], c['group'])
+                      for c in result.contributors])
+            if events:
+                # A slot scored again after a restart emits the same events; the unique key drops them
+                cursor.executemany("""
+                    INSERT IGNORE INTO alert_events (incident_id, event, Date, alerts, open_alerts, nodes, kpis, peak_z, summary)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, [(e['incident'], e['event'], e['date'], e['alerts'], e['open_alerts'], e['nodes'][:255], e['kpis'][:1000],
+                       e['peak_z'], e['summary'][:1000]) for e in events])
+            cursor.execute("""
+                INSERT INTO anomaly_watermarks (detector, last_date) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE last_date = GREATEST(last_date, VALUES(last_date))
+            """, (self.settings['name'], result.date))
+            self.conn.commit()
+        except Exception as e:
+            logging.error(f"Error storing anomaly results of {result.date}: {e}")
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def save(self):
+        self.detector.save(self.settings['state_path'])
+        self.saved_at = time.monotonic()
+
+    def persist_alerts(self):
+        cursor = self.conn.cursor()
+        try:
+            count = self.alerts.persist(cursor)
+            self.conn.commit()
+            if count:
+                logging.info(f"Persisted {count} alert states ({len(self.alerts.alerts)} unresolved)")
+        except Exception as e:
+            logging.error(f"Error persisting alert states: {e}")
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.persisted_at = time.monotonic()
+
+    def run_once(self) -> int:
+        """Score every slot that became ready. Returns the number of slots scored."""
+        until = self.ready_until()
+        if until is None:
+            return 0
+        after = self.detector.last_date or (
+            datetime.strptime(until, DATE_FORMAT) - timedelta(hours=self.settings['lookback_hours'])
+        ).strftime(DATE_FORMAT)
+        dates = self.reader.slots_after(after, until)
+        flagged = 0
+        for date in dates:
+            start = time.perf_counter()
+            rows = self.reader.slot_rows(date)
+            read = time.perf_counter()
+            result = self.detector.score(date, rows)
+            events = self.alerts.update(result)
+            scored = time.perf_counter()
+            self.write(result, events)
+            for event in events:
+                logging.warning(f"Incident {event['incident'][:8]} {event['event']} at {date}: {event['summary']}")
+            if result.flagged:
+                flagged += 1
+                groups = ', '.join(f"{name} ({z:+.1f})" for name, z in result.groups[:5])
+                logging.warning(f"Anomaly at {date}: score {result.score:.1f} (spe {result.spe_z:.1f}, t2 {result.t2_z:.1f})"
+                                + (f", groups {groups}" if groups else ""))
+            logging.debug(f"Slot {date}: {len(rows)} values, read {(read - start) * 1000:.1f} ms, scored {(scored - read) * 1000:.1f} ms")
+            if time.monotonic() - self.saved_at >= self.settings['save_seconds']:
+                self.save()
+            if time.monotonic() - self.persisted_at >= self.alert_config['persist_seconds']:
+                self.persist_alerts()
+        if dates:
+            stats = self.alerts.stats
+            logging.info(f"Scored {len(dates)} slots up to {dates[-1]} ({flagged} flagged, {len(self.detector.keys)} dimensions); "
+                         f"alerts: {stats['events']} events from {stats['anomalies']} anomalies, {stats['suppressed']} suppressed")
+        return len(dates)
+
+    def run(self):
+        logging.info(f"Starting multivariate anomaly detector '{self.settings['name']}'")
+        try:
+            while True:
+                try:
+                    if not self.run_once():
+                        time.sleep(self.settings['poll_seconds'])
+                except Exception as e:
+                    logging.error(f"Error in detection cycle: {e}")
+                    time.sleep(self.settings['poll_seconds'])
+        finally:
+            self.save()
+            self.persist_alerts()
+
+
+def run():
+    DetectionService().run()
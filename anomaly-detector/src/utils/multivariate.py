@@ -0,0 +1,265 @@
+import os
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+Key = Tuple[str, str, str]  # (node, kpi, suffix)
+
+# E[min(z^2, c^2)] of a standard normal for c = 3: rescales variances of clipped values
+CLIP_CONSISTENCY = 0.9707
+
+# Model arrays written by save()
+STATE_ARRAYS = ('kpi_group', 'node_group', 'group_var', 'level', 'scale', 'residual_var', 'seen', 'basis', 'singular', 'baseline')
+
+
+class SlotScore(NamedTuple):
+    date: str
+    score: float  # largest of the z-scores below
+    spe_z: float  # residual energy outside the components (broken correlations)
+    t2_z: float  # Mahalanobis distance inside the components (unusual common move)
+    dimensions: int  # dimensions scored in this slot
+    flagged: bool
+    groups: List[Tuple[str, float]]  # ("kpi:<name>" or "node:<name>", z) of groups over the threshold
+    contributors: List[Dict[str, Any]]  # dimensions with the largest residuals of a flagged slot
+
+
+class MultivariateDetector:
+    """Scores whole 5-minute slots of (node, KPI, suffix) values against their usual correlations.
+
+    Each slot is one vector. Every dimension is standardized by a robust running
+    level and scale (Huber-clipped exponential updates), and the standardized
+    vector is projected on a low-rank principal subspace kept up to date by an
+    incremental SVD with forgetting (by least squares over the dimensions
+    present, when part of the slot is missing). The slot is scored on:
+
+    - spe_z: the residual outside the subspace, normalized per dimension;
+      large when KPIs that usually move together stop doing so;
+    - t2_z: the Mahalanobis distance of the projection; large when the usual
+      common modes move by an unusual amount;
+    - group z-scores: per-dimension residuals summed per KPI (across nodes and
+      suffixes) and per node (across KPIs), so small drops that happen together,
+      each too small to flag alone, add up.
+
+    Flagged slots do not update the model, so an incident is not learned as
+    normal while it lasts. Everything is vectorized over the dimensions; a slot
+    costs O(dimensions x components^2).
+    """
+
+    def __init__(self, components: int = 8, alpha: float = 0.05, forgetting: float = 0.995, clip: float = 3.0,
+                 threshold: float = 4.0, warmup_slots: int = 48, relearn_slots: int = 12, top_contributors: int = 20):
+        self.components = components
+        self.alpha = alpha
+        self.forgetting = forgetting
+        self.clip = clip
+        self.threshold = threshold
+        self.warmup_slots = warmup_slots
+        self.relearn_slots = relearn_slots
+        self.top_contributors = top_contributors
+
+        self.keys: List[Key] = []
+        self.index: Dict[Key, int] = {}
+        self.groups: Dict[str, int] = {}
+        self.kpi_group = np.zeros(0, dtype=np.int64)
+        self.node_group = np.zeros(0, dtype=np.int64)
+        self.group_var = np.ones(0)
+        self.level = np.zeros(0)
+        self.scale = np.ones(0)
+        self.residual_var = np.ones(0)
+        self.seen = np.zeros(0, dtype=np.int64)
+        self.basis = np.zeros((0, 0))  # dimensions x components, orthonormal columns
+        self.singular = np.zeros(0)
+        self.weight = 0.0  # forgetting-weighted number of slots in the components
+        self.baseline = np.array([[0.0, 1.0], [0.0, 1.0]])  # running (mean, variance) of the SPE and T2 statistics
+        self.updates = 0  # slots learned
+        self.fitted = 0  # of which with scored dimensions, i.e. updating the components
+        self.flagged_run = 0
+        self.last_date: Optional[str] = None
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> 'MultivariateDetector':
+        return cls(settings['components'], settings['alpha'], settings['forgetting'], settings['clip'], settings['threshold'],
+                   settings['warmup_slots'], settings['relearn_slots'], settings['top_contributors'])
+
+    def group(self, name: str) -> int:
+        if name not in self.groups:
+            self.groups[name] = len(self.groups)
+            self.group_var = np.append(self.group_var, 1.0)
+        return self.groups[name]
+
+    def columns(self, keys: List[Key], values: np.ndarray) -> np.ndarray:
+        """Column of each key, adding unseen dimensions (initialized from their first value)."""
+        columns = np.fromiter((self.index.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        new = np.flatnonzero(columns < 0)
+        if len(new):
+            added = []
+            for i in new:
+                key = keys[i]
+                if key not in self.index:  # a key repeated within the slot
+                    self.index[key] = len(self.keys)
+                    self.keys.append(key)
+                    added.append(i)
+                columns[i] = self.index[key]
+            first = np.nan_to_num(values[added])
+            self.kpi_group = np.concatenate([self.kpi_group, [self.group(f"kpi:{keys[i][1]}") for i in added]]).astype(np.int64)
+            self.node_group = np.concatenate([self.node_group, [self.group(f"node:{keys[i][0]}") for i in added]]).astype(np.int64)
+            self.level = np.concatenate([self.level, first])
+            self.scale = np.concatenate([self.scale, np.maximum(0.1 * np.abs(first), 1e-6)])
+            self.residual_var = np.concatenate([self.residual_var, np.ones(len(added))])
+            self.seen = np.concatenate([self.seen, np.zeros(len(added), dtype=np.int64)])
+            self.basis = np.vstack([self.basis, np.zeros((len(added), self.basis.shape[1]))])
+        return columns
+
+    def score(self, date: str, rows: List[Tuple[str, str, str, Optional[str], Optional[float]]]) -> SlotScore:
+        """Score one slot of (node, kpi, suffix, operator, value) rows, then learn from it unless flagged."""
+        keys = [(node, kpi, suffix or '') for node, kpi, suffix, _, _ in rows]
+        raw = np.fromiter((np.nan if row[4] is None else row[4] for row in rows), dtype=float, count=len(rows))
+        columns = self.columns(keys, raw)
+        dimensions = len(self.keys)
+
+        x = np.full(dimensions, np.nan)
+        x[columns] = raw
+        present = ~np.isnan(x)
+        z = np.zeros(dimensions)
+        z[present] = (x[present] - self.level[present]) / self.scale[present]
+        scored = present & (self.seen >= self.warmup_slots)
+        n = int(scored.sum())
+
+        # Project on the components by least squares over the scored dimensions only: counting
+        # missing ones as 0 would bias the projection and the residuals of every present dimension.
+        # Missing dimensions are then filled in with their projection (no residual).
+        k = self.basis.shape[1]
+        if not k or n <= k:
+            projection = np.zeros(k)
+        elif n == dimensions:
+            projection = self.basis.T @ z
+        else:
+            projection = np.linalg.lstsq(self.basis[scored], z[scored], rcond=None)[0]
+        reconstruction = self.basis @ projection
+        zs = np.where(scored, z, reconstruction)
+        residual = zs - reconstruction
+        normalized = np.where(scored, residual / np.sqrt(self.residual_var), 0.0)
+
+        # Slot statistics, each standardized by its own running baseline
+        stats = np.zeros(2)
+        if n:
+            stats[0] = np.square(normalized).sum() / n
+        if k and self.weight:
+            eigen = np.maximum(np.square(self.singular) / self.weight, 1e-9)
+            stats[1] = np.sum(np.square(projection) / eigen) / k
+        stats = np.log(stats + 1e-3)  # both are skewed like chi-square; their logs are close to normal
+        spe_z, t2_z = (stats - self.baseline[:, 0]) / np.sqrt(self.baseline[:, 1])
+
+        sums = np.bincount(self.kpi_group, normalized, len(self.groups)) + np.bincount(self.node_group, normalized, len(self.groups))
+        counts = np.bincount(self.kpi_group, scored, len(self.groups)) + np.bincount(self.node_group, scored, len(self.groups))
+        group_raw = np.divide(sums, np.sqrt(counts), out=np.zeros_like(sums), where=counts > 1)
+        group_z = group_raw / np.sqrt(self.group_var)
+        if (counts > 1).sum() >= 30:
+            # Residual variances lag behind daily swings; a slot where every group is wider is not an incident
+            group_z /= max(1.0, 1.4826 * float(np.median(np.abs(group_z[counts > 1]))))
+
+        active = n > k and self.fitted >= self.warmup_slots  # fewer dimensions than components: nothing to test
+        group_scores: List[Tuple[str, float]] = []
+        if active:
+            names = {index: name for name, index in self.groups.items()}
+            # Hundreds of groups are tested per slot: raise their threshold for the number of tests
+            over = np.flatnonzero(np.abs(group_z) > np.sqrt(self.threshold ** 2 + 2 * np.log(max(len(self.groups), 1))))
+            group_scores = sorted(((names[i], float(group_z[i])) for i in over), key=lambda item: -abs(item[1]))
+        score = float(max([spe_z, t2_z] + [abs(z_g) for _, z_g in group_scores])) if active else 0.0
+        flagged = score > self.threshold
+        self.flagged_run = self.flagged_run + 1 if flagged else 0
+
+        contributors = []
+        if flagged:
+            order = np.argsort(-np.abs(normalized))[:self.top_contributors]
+            expected = self.level + self.scale * reconstruction
+            operators = dict(zip(columns.tolist(), (row[3] for row in rows)))
+            flagged_groups = dict(group_scores)
+            for i in order:
+                if not scored[i] or abs(normalized[i]) < 1:
+                    break
+                node, kpi, suffix = self.keys[i]
+                # The strongest flagged group the dimension belongs to (group_scores is sorted)
+                grp = next((g for g in flagged_groups if g in (f"kpi:{kpi}", f"node:{node}")), None)
+                contributors.append({'node': node, 'kpi': kpi, 'suffix': suffix, 'operator': operators.get(i),
+                                     'value': float(x[i]), 'expected': float(expected[i]), 'z': float(normalized[i]), 'group': grp})
+        # A condition lasting longer than relearn_slots is the new normal
+        if not flagged or self.flagged_run > self.relearn_slots:
+            self.learn(z, present, scored, zs, residual, stats, group_raw)
+        self.last_date = date
+        return SlotScore(date, score, float(spe_z), float(t2_z), n, flagged, group_scores, contributors)
+
+    def learn(self, z: np.ndarray, present: np.ndarray, scored: np.ndarray, zs: np.ndarray, residual: np.ndarray,
+              stats: np.ndarray, group_raw: np.ndarray):
+        """Update levels, scales, residual and group variances, baselines and the components with a slot."""
+        a = self.alpha
+        clipped = np.clip(z, -self.clip, self.clip)
+        self.level[present] += a * self.scale[present] * clipped[present]
+        variance = (1 - a) * np.square(self.scale[present]) + a * np.square(self.scale[present] * clipped[present]) / CLIP_CONSISTENCY
+        self.scale[present] = np.maximum(np.sqrt(variance), 1e-6 + 1e-3 * np.abs(self.level[present]))
+        self.seen[present] += 1
+        self.updates += 1
+        if not scored.any():
+            return
+
+        limit = self.clip ** 2
+        self.residual_var[scored] = (1 - a) * self.residual_var[scored] + a * np.minimum(np.square(residual[scored]) / self.residual_var[scored], limit) * self.residual_var[scored] / CLIP_CONSISTENCY
+        self.residual_var = np.maximum(self.residual_var, 1e-3)
+        self.group_var = (1 - a) * self.group_var + a * np.minimum(np.square(group_raw) / self.group_var, limit) * self.group_var / CLIP_CONSISTENCY
+        if self.fitted:
+            mean, var = self.baseline[:, 0], self.baseline[:, 1]
+            deviation = np.clip(stats - mean, -self.clip * np.sqrt(var), self.clip * np.sqrt(var))
+            self.baseline[:, 0] = mean + a * deviation
+            self.baseline[:, 1] = np.maximum((1 - a) * var + a * np.square(deviation) / CLIP_CONSISTENCY, 1e-6)
+        else:
+            self.baseline[:, 0] = stats
+
+        # Incremental SVD (Brand): append the slot to the forgetting-weighted basis and truncate
+        update = np.clip(zs, -self.clip, self.clip)
+        k = self.basis.shape[1]
+        p = self.basis.T @ update
+        r = update - self.basis @ p
+        norm = float(np.linalg.norm(r))
+        middle = np.zeros((k + 1, k + 1))
+        middle[:k, :k] = np.diag(np.sqrt(self.forgetting) * self.singular)
+        middle[:k, k] = p
+        middle[k, k] = norm
+        u, s, _ = np.linalg.svd(middle)
+        keep = min(self.components, k + 1, max(1, int(scored.sum()) // 2))  # leave room for a residual
+        extended = np.hstack([self.basis, (r / norm if norm >= 1e-9 else np.zeros_like(r))[:, None]])
+        self.basis = extended @ u[:, :keep]
+        self.singular = s[:keep]
+        self.weight = self.forgetting * self.weight + 1
+        self.fitted += 1
+        if self.fitted % 100 == 0:
+            self.basis, _ = np.linalg.qr(self.basis)  # undo numerical drift from orthonormality
+
+    def save(self, path: str):
+        """Write the model atomically (npz with the keys as JSON)."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        arrays = {name: getattr(self, name) for name in STATE_ARRAYS}
+        meta = {'keys': self.keys, 'groups': self.groups, 'weight': self.weight, 'updates': self.updates,
+                'fitted': self.fitted, 'flagged_run': self.flagged_run, 'last_date': self.last_date}
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> bool:
+        """Restore a saved model. Returns False if there is none."""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as state:
+            meta = json.loads(str(state['meta']))
+            for name in STATE_ARRAYS:
+                setattr(self, name, state[name])
+        self.keys = [tuple(key) for key in meta['keys']]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        for name in ('groups', 'weight', 'updates', 'fitted', 'flagged_run', 'last_date'):
+            setattr(self, name, meta[name])
+        if self.basis.shape[1] > self.components:
+            self.basis, self.singular = self.basis[:, :self.components], self.singular[:self.components]
+        logging.info(f"Restored detector state: {len(self.keys)} dimensions, {self.updates} slots learned, last slot {self.last_date}")
+        return True
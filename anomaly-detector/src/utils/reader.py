@@ -0,0 +1,103 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from config import STORAGE_LAYOUT, DETECTOR_KPIS
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class SlotReader:
+    """Reads every node's KPI values of one timestamp from the transformer's tables, for either storage layout."""
+
+    def __init__(self, conn, layout: str = STORAGE_LAYOUT, kpis: List[str] = DETECTOR_KPIS):
+        self.conn = conn
+        self.layout = layout
+        self.kpis = set(kpis)
+        self.suffixes: Dict[int, Tuple[str, Optional[str]]] = {}
+        self.dimensions: Dict[str, Dict[int, str]] = {}
+        self.detail_tables: Dict[str, Dict[str, Any]] = {}
+        self.refresh()
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return list(cursor.fetchall())
+        finally:
+            cursor.close()
+            self.conn.commit()  # end the snapshot so the next read sees new slots
+
+    def refresh(self):
+        """Reload the schema: kpi/node codes of the long layout, or the *_details tables."""
+        if self.layout == 'long':
+            self.dimensions = {
+                'kpi': {code: kpi for code, kpi in self.query("SELECT code, kpi FROM kpi_dim")},
+                'node': {code: node for code, node in self.query("SELECT code, node FROM node_dim")}
+            }
+            return
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table, column in self.query("""
+            SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s
+        """, ('%\\_details',)):
+            tables.setdefault(table, {'columns': set()})['columns'].add(column)
+        for table, info in tables.items():
+            info['family'] = 'kpi' in info['columns']
+            if not info['family'] and self.kpis and table[:-len('_details')] not in self.kpis:
+                info['skip'] = True
+        self.detail_tables = tables
+        logging.info(f"Discovered {len(tables)} KPI detail tables")
+
+    def suffix(self, suffix_id: Optional[int]) -> Tuple[str, Optional[str]]:
+        """(suffix, operator) of a suffix_dim ID, loading unseen IDs on demand."""
+        if not suffix_id:
+            return '', None
+        if suffix_id not in self.suffixes:
+            for sid, suffix, operator in self.query("SELECT id, suffix, operator FROM suffix_dim WHERE id >= %s", (suffix_id,)):
+                self.suffixes[sid] = (suffix, operator)
+        return self.suffixes.get(suffix_id, ('', None))
+
+    def detail_select(self, table: str) -> str:
+        """Columns and joins giving (Node, kpi, suffix, operator, value) rows of a detail table."""
+        columns = self.detail_tables[table]['columns']
+        kpi = "d.kpi" if self.detail_tables[table]['family'] else f"'{table[:-len('_details')]}'"
+        if 'suffix_id' in columns:
+            return (f"SELECT s.Node, {kpi}, COALESCE(sd.suffix, ''), sd.operator, d.value FROM kpi_summary s "
+                    f"JOIN {table} d ON d.kpi_id = s.Id LEFT JOIN suffix_dim sd ON sd.id = d.suffix_id")
+        suffix = "d.suffix" if 'suffix' in columns else "''"
+        operator = "d.operator" if 'operator' in columns else "NULL"
+        return f"SELECT s.Node, {kpi}, {suffix}, {operator}, d.value FROM kpi_summary s JOIN {table} d ON d.kpi_id = s.Id"
+
+    def slots_after(self, after: str, until: str, limit: int = 288) -> List[str]:
+        """Timestamps with KPI results in (after, until], oldest first."""
+        if self.layout == 'long':
+            sql = "SELECT DISTINCT ts FROM kpi_fact WHERE ts > %s AND ts <= %s ORDER BY ts LIMIT %s"
+        else:
+            sql = "SELECT DISTINCT Date FROM kpi_summary WHERE Date > %s AND Date <= %s ORDER BY Date LIMIT %s"
+        return [str(row[0]) for row in self.query(sql, (after, until, limit))]
+
+    def slot_rows(self, date: str) -> List[Tuple[str, str, str, Optional[str], Optional[float]]]:
+        """(node, kpi, suffix, operator, value) of every node at one timestamp."""
+        if self.layout == 'long':
+            rows = []
+            for node_code, kpi_code, suffix_id, value in self.query(
+                "SELECT node, kpi_code, suffix_id, value FROM kpi_fact WHERE ts = %s", (date,)
+            ):
+                kpi = self.dimensions['kpi'].get(kpi_code)
+                node = self.dimensions['node'].get(node_code)
+                if kpi is None or node is None:
+                    self.refresh()  # written after the last schema load
+                    kpi, node = self.dimensions['kpi'].get(kpi_code), self.dimensions['node'].get(node_code)
+                rows.append((node, kpi, *self.suffix(suffix_id), value))
+        else:
+            rows = []
+            for table, info in self.detail_tables.items():
+                if not info.get('skip'):
+                    rows.extend(self.query(f"{self.detail_select(table)} WHERE s.Date = %s", (date,)))
+        if self.kpis:
+            rows = [row for row in rows if row[1] and row[1].lower() in self.kpis]
+        return rows
+
+    def watermarks(self) -> Dict[str, str]:
+        """Newest date written per node, from kpi_watermarks."""
+        return {node: str(last_date) for node, last_date in self.query("SELECT node, last_date FROM kpi_watermarks")}
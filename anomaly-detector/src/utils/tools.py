@@ -0,0 +1,107 @@
+import MySQLdb
+import logging
+from typing import Dict, Any
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def connect_database(config: Dict[str, Any]):
+    """Connect to the database using mysqlclient with retries."""
+    try:
+        conn = MySQLdb.connect(
+            host=config['host'],
+            user=config['user'],
+            passwd=config['password'],
+            port=config['port'],
+            db=config['database']
+        )
+        logging.info(f"Successfully connected to database: {config['database']} on {config['host']}")
+        return conn
+    except MySQLdb.Error as e:
+        logging.error(f"Database connection error: {e}")
+        raise
+
+def create_anomaly_tables(cursor):
+    """Create the detector's output tables if they don't exist."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_anomaly_slots (
+            Date DATETIME NOT NULL PRIMARY KEY,
+            score DOUBLE NOT NULL,
+            spe_z DOUBLE NOT NULL,
+            t2_z DOUBLE NOT NULL,
+            dimensions INT NOT NULL,
+            flagged BOOLEAN NOT NULL,
+            detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_anomalies (
+            id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            Date DATETIME NOT NULL,
+            node VARCHAR(50) NOT NULL,
+            kpi VARCHAR(100) NOT NULL,
+            suffix VARCHAR(255) NOT NULL DEFAULT '',
+            operator VARCHAR(100) NULL,
+            value DOUBLE NULL,
+            expected DOUBLE NULL,
+            z DOUBLE NOT NULL,
+            grp VARCHAR(160) NULL,
+            detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_date (Date),
+            KEY idx_node_kpi (node, kpi)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS anomaly_watermarks (
+            detector VARCHAR(100) NOT NULL PRIMARY KEY,
+            last_date DATETIME NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    logging.info("✅ Anomaly tables created or already exist.")
+
+def create_alert_tables(cursor):
+    """Create the alert state table and the alert event outbox if they don't exist."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_alerts (
+            node VARCHAR(50) NOT NULL,
+            kpi VARCHAR(100) NOT NULL,
+            operator VARCHAR(100) NOT NULL DEFAULT '',
+            opened_at DATETIME NOT NULL,
+            incident_id VARCHAR(36) NOT NULL,
+            state VARCHAR(10) NOT NULL,
+            last_active DATETIME NOT NULL,
+            resolved_at DATETIME NULL,
+            slots INT NOT NULL,
+            peak_z DOUBLE NOT NULL,
+            suffixes VARCHAR(1000) NOT NULL DEFAULT '',
+            grp VARCHAR(160) NOT NULL DEFAULT '',
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (node, kpi, operator, opened_at),
+            KEY idx_state (state),
+            KEY idx_incident (incident_id)
+        )
+    """)
+    # Tables created before alerts kept their detector group
+    cursor.execute("SHOW COLUMNS FROM kpi_alerts LIKE 'grp'")
+    if not cursor.fetchall():
+        cursor.execute("ALTER TABLE kpi_alerts ADD COLUMN grp VARCHAR(160) NOT NULL DEFAULT '' AFTER suffixes")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            incident_id VARCHAR(36) NOT NULL,
+            event VARCHAR(10) NOT NULL,
+            Date DATETIME NOT NULL,
+            alerts INT NOT NULL,
+            open_alerts INT NOT NULL,
+            nodes VARCHAR(255) NOT NULL,
+            kpis VARCHAR(1000) NOT NULL,
+            peak_z DOUBLE NOT NULL,
+            summary VARCHAR(1000) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_incident_event (incident_id, event, Date)
+        )
+    """)
+    logging.info("✅ Alert tables created or already exist.")
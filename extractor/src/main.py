@@ -1,39 +1,42 @@
-import time
 import os
-from utils.db_utils import get_table_names, fetch_new_data, bulk_insert_into_destination, load_last_dates, save_last_dates
-from utils.kafka_utils import send_to_kafka
-from utils.config import FIRST_MYSQL_DB, SECOND_MYSQL_DB
+import sys
+import logging
 
-# Initialize last extracted timestamps
-last_dates = load_last_dates()
+# Service modules use flat imports from the utils directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils"))
 
-def extract_and_load():
-    databases = [FIRST_MYSQL_DB, SECOND_MYSQL_DB]
+from config import EXTRACTOR_MODE, EXTRACTOR_IO, source_configs
 
-    for db_name in databases:
-        tables = get_table_names(db_name)
-
-        for table in tables:
-            last_date = last_dates.get(table, "2000-01-01")  # Default to old date
-
-            while True:
-                data, last_date = fetch_new_data(db_name, table, last_date)
-                if not data:
-                    break  # No more data, exit loop
-
-                bulk_insert_into_destination(table, data)
-
-                # Send to Kafka
-                for record in data:
-                    send_to_kafka(db_name, table, record)
-
-                last_dates[table] = last_date  # Update last processed date
-                save_last_dates(last_dates)  # Save progress
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Each mode imports only the modules it runs, to keep startup short
 def main():
-    while True:
-        extract_and_load()
-        time.sleep(30)  # Poll every 30 seconds
+    if EXTRACTOR_MODE == "cdc":
+        import cdc
+        logging.info("Starting extractor in binlog CDC mode")
+        cdc.main([])
+        return
+
+    if source_configs or EXTRACTOR_IO == "async":
+        # Several sources always run on the async core, one pool per source
+        import asyncio
+        from async_orchestrator import AsyncOrchestrator, FanInOrchestrator
+        orchestrator = FanInOrchestrator(source_configs) if source_configs else AsyncOrchestrator()
+        if EXTRACTOR_MODE == "backfill":
+            asyncio.run(orchestrator.process_orchestration())
+            return
+        logging.info("Starting extractor in async daemon mode")
+        asyncio.run(orchestrator.run_daemon())
+        return
+
+    from orchestrator import Orchestrator
+    orchestrator = Orchestrator()
+    if EXTRACTOR_MODE == "backfill":
+        orchestrator.process_orchestration()
+        return
+    logging.info("Starting extractor in daemon mode")
+    orchestrator.run_daemon()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,455 @@
+import time
+import asyncio
+import logging
+import MySQLdb
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from catalog import TableCatalog
+from scheduler import PollSchedule
+from batching import AdaptiveBatchSizer
+from validation import BatchValidator
+from profiling import profile_run, log_report
+from config import SOURCE_CONFIG, DESTINATION_CONFIG, start_year, daemon_settings, batch_settings, async_settings, validation_settings, lease_settings
+from tools import (
+    connect_database, extract_table_data, load_batch_into_database, create_checkpoint_table, create_slot_changes_table, create_quarantine_table, load_checkpoint, load_incomplete_checkpoints,
+    save_checkpoint, load_last_extracted, update_last_extracted, process_catalog_tables, store_catalog_tables, store_txt, is_timeout_error
+)
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+# Blocking helpers executed on a pooled connection's thread
+
+def show_tables(conn) -> List[str]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SHOW TABLES")
+        return [table[0] for table in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def fetch_batch(conn, table: str, offset: int, batch_size: int) -> Optional[List[tuple]]:
+    cursor = conn.cursor()
+    try:
+        return extract_table_data(table, cursor, offset, batch_size, batch_settings['query_timeout_ms'])
+    finally:
+        cursor.close()
+
+def load_batch(conn, table: str, data: List[tuple], offset: int, checkpoint_key: str, validator: Optional[BatchValidator] = None):
+    quarantine = None
+    if validator is not None:
+        data, quarantine, _ = validator.validate(table, data)
+    load_batch_into_database(data, conn, table, offset, checkpoint_key=checkpoint_key, quarantine=quarantine)
+
+def prepare_destination(conn):
+    cursor = conn.cursor()
+    try:
+        create_checkpoint_table(cursor)
+        create_slot_changes_table(cursor)
+        create_quarantine_table(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+
+def complete_checkpoint(conn, table: str, offset: int):
+    cursor = conn.cursor()
+    try:
+        save_checkpoint(cursor, table, offset, completed=True)
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+class AsyncConnectionPool:
+    """Fixed set of MySQLdb connections shared by coroutines.
+
+    MySQLdb calls block, so they run on an executor with one thread per
+    connection. Coroutines wait for a free connection rather than owning a
+    thread, so any number of tables can be in progress over `size` connections.
+    Connections that fail with a timeout or any other operational error (such
+    as a lost server) are closed and reopened on demand.
+    """
+
+    def __init__(self, config: Dict[str, Any], size: int):
+        self.config = config
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"mysql-{config['database']}")
+        self.idle: List[Any] = []
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    async def call(self, func: Callable, *args) -> Any:
+        """Run a blocking function on the pool's executor."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def acquire(self):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.size)
+        await self.slots.acquire()
+        if self.idle:
+            return self.idle.pop()
+        try:
+            return await self.call(connect_database, self.config)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn, broken: bool = False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self.idle.append(conn)
+        self.slots.release()
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run `func(conn, *args)` on a pooled connection."""
+        conn = await self.acquire()
+        try:
+            result = await self.call(func, conn, *args)
+        except Exception as e:
+            self.release(conn, broken=is_timeout_error(e) or isinstance(e, MySQLdb.OperationalError))
+            raise
+        self.release(conn)
+        return result
+
+    def close(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+        self.executor.shutdown(wait=True)
+
+
+class AsyncOrchestrator:
+    """Asyncio counterpart of Orchestrator driving many tables from one event loop.
+
+    Each table is a coroutine; the next batch of a table is fetched while its
+    previous batch is loaded, and at most `max_tables` tables are in progress.
+    Checkpoints, batch sizing and polling intervals work as in Orchestrator.
+
+    A named source (see FanInOrchestrator) keeps its checkpoints under
+    '<name>/<table>' and may share the destination pool with other sources.
+    Table leases (EXTRACTOR_LEASES=1) are not supported: replicas would
+    extract the same tables, so the combination is refused.
+    """
+
+    def __init__(self, name: Optional[str] = None, source_config: Dict[str, Any] = SOURCE_CONFIG,
+                 destination: Optional[AsyncConnectionPool] = None,
+                 source_connections: int = async_settings['source_connections'],
+                 max_tables: int = async_settings['max_tables']):
+        if lease_settings['enabled']:
+            raise ValueError("EXTRACTOR_LEASES=1 needs the threaded extractor (EXTRACTOR_IO=sync, no SOURCE_NAMES)")
+        self.name = name
+        self.source = AsyncConnectionPool(source_config, source_connections)
+        self.owns_destination = destination is None
+        self.destination = destination or AsyncConnectionPool(DESTINATION_CONFIG, async_settings['destination_connections'])
+        self.max_tables = max_tables
+        self.sizer = AdaptiveBatchSizer(
+            initial=batch_settings['initial'],
+            min_size=batch_settings['min_size'],
+            max_size=batch_settings['max_size'],
+            target_seconds=batch_settings['target_seconds'],
+            max_bytes=batch_settings['max_bytes'],
+            adaptive=batch_settings['adaptive']
+        )
+        self.validator = BatchValidator.from_settings(validation_settings) if validation_settings['enabled'] else None
+        self.catalog = TableCatalog()
+        self.peers: List['AsyncOrchestrator'] = [self]  # sources whose tables share the result_*.txt files
+        self.table_slots: Optional[asyncio.Semaphore] = None
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.max_retries = 3
+        self.retry_delay = 4
+
+    async def start(self):
+        self.table_slots = asyncio.Semaphore(self.max_tables)
+        await self.destination.run(prepare_destination)
+
+    def close(self):
+        self.source.close()
+        if self.owns_destination:
+            self.destination.close()
+
+    def checkpoint_key(self, table: str) -> str:
+        return f"{self.name}/{table}" if self.name else table
+
+    async def refresh_catalog(self) -> List[str]:
+        """List source tables, refresh the catalog and return this source's filtered, sorted names.
+
+        The shared result_*.txt files are rewritten with the tables of every
+        peer source, so one source's refresh never hides the others' tables.
+        """
+        tables = await self.source.run(show_tables)
+        store_txt(tables, f"./data/our_tables/tables_{self.name}.txt" if self.name else "./data/our_tables/tables.txt")
+        self.catalog.refresh(tables)
+        store_catalog_tables([peer.catalog for peer in self.peers], start_year)
+        return self.catalog.names(start_year=start_year)
+
+    async def get_resume_offset(self, table: str) -> int:
+        key = self.checkpoint_key(table)
+        checkpoint = await self.destination.run(load_checkpoint, key)
+        if checkpoint is not None:
+            return checkpoint["offset"]
+        return load_last_extracted().get(key, {}).get("offset", 0)
+
+    async def fetch(self, table: str, offset: int) -> tuple:
+        """Fetch one batch with retries, halving the batch size on timeouts.
+
+        Returns:
+            (rows or None, batch size requested)
+        """
+        batch_size = self.sizer.size_for(table)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                data = await self.source.run(fetch_batch, table, offset, batch_size)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    logging.error(f"Max retries ({self.max_retries}) reached for table '{table}': {e}")
+                    raise
+                if is_timeout_error(e):
+                    batch_size = self.sizer.shrink(table)
+                wait_time = self.retry_delay * (2 ** attempt)
+                logging.warning(f"Retry {attempt + 1}/{self.max_retries} for table '{table}' after error: {e}. Waiting {wait_time}s...")
+                await asyncio.sleep(wait_time)
+                continue
+            self.sizer.observe_fetch(table, data, time.perf_counter() - start)
+            return data, batch_size
+
+    async def load(self, table: str, data: List[tuple], offset: int):
+        """Validate and load one batch (checkpointed in the same transaction), then update the JSON progress."""
+        start = time.perf_counter()
+        await self.destination.run(load_batch, table, data, offset, self.checkpoint_key(table), self.validator)
+        self.sizer.observe_load(table, len(data), time.perf_counter() - start)
+        await asyncio.get_running_loop().run_in_executor(None, update_last_extracted, self.checkpoint_key(table), {
+            "offset": offset,
+            "total_extracted": offset,
+            "last_date": str(data[-1][0])
+        })
+
+    async def poll_table(self, table: str) -> int:
+        """Extract the rows appended to a table since its checkpoint.
+
+        Returns:
+            Number of new rows extracted.
+        """
+        offset = await self.get_resume_offset(table)
+        extracted = 0
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                data, batch_size = await self.fetch(table, offset)
+                if not data:
+                    break
+                offset += len(data)
+                extracted += len(data)
+                if pending is not None:
+                    await pending  # at most one batch per table waits to be loaded
+                pending = asyncio.ensure_future(self.load(table, data, offset))
+                if len(data) < batch_size:
+                    break
+        finally:
+            if pending is not None:
+                await pending
+        if extracted:
+            logging.info(f"Polled {extracted} new rows from '{table}' (offset {offset}, batch size {self.sizer.size_for(table)})")
+        return extracted
+
+    async def mark_completed(self, table: str):
+        key = self.checkpoint_key(table)
+        entry = await asyncio.get_running_loop().run_in_executor(None, update_last_extracted, key, {"completed": True})
+        await self.destination.run(complete_checkpoint, key, entry.get("offset", 0))
+
+    async def extract_completely(self, table: str):
+        async with self.table_slots:
+            logging.info(f"Starting full extraction for table '{table}'")
+            await self.poll_table(table)
+            await self.mark_completed(table)
+
+    async def backfill(self):
+        """Extract every selected table that isn't complete yet, concurrently."""
+        await self.start()
+        try:
+            tables = await self.refresh_catalog()
+            last_extracted_info = load_last_extracted()
+            pending = [t for t in tables if not last_extracted_info.get(self.checkpoint_key(t), {}).get("completed", False)]
+            logging.info(f"Backfilling {len(pending)} tables from {self.name or 'source'} ({len(tables) - len(pending)} already complete)")
+            results = await asyncio.gather(*(self.extract_completely(t) for t in pending), return_exceptions=True)
+            failed = [(t, r) for t, r in zip(pending, results) if isinstance(r, Exception)]
+            for table, error in failed:
+                logging.error(f"Error extracting table '{table}': {error}")
+            if failed:
+                raise RuntimeError(f"{len(failed)} tables failed during orchestration")
+        finally:
+            self.close()
+
+    async def process_orchestration(self):
+        """Backfill every selected table concurrently."""
+        start = time.perf_counter()
+        try:
+            with profile_run("async_orchestration"):
+                await self.backfill()
+        finally:
+            if self.validator is not None:
+                self.validator.log_metrics()
+            log_report("Async orchestration", time.perf_counter() - start)
+
+    async def poll_and_record(self, table: str, schedule: PollSchedule):
+        async with self.table_slots:
+            try:
+                rows = await self.poll_table(table)
+            except Exception as e:
+                logging.error(f"Error polling table '{table}': {e}")
+                rows = 0
+        if table in schedule.state:
+            schedule.record(table, rows)
+
+    async def retire(self, table: str, schedule: PollSchedule):
+        """Drain a rolled-over table once its running poll (if any) finishes, then unschedule it.
+
+        A table that fails to drain stays scheduled and is retried on the next refresh.
+        """
+        if table in self.in_flight:
+            await asyncio.wait([self.in_flight[table]])
+        try:
+            async with self.table_slots:
+                await self.poll_table(table)
+                await self.mark_completed(table)
+        except Exception as e:
+            logging.error(f"Error draining table '{table}', retrying on the next refresh: {e}")
+            return
+        schedule.remove(table)
+
+    async def refresh_active_tables(self, schedule: PollSchedule, drain_stale: bool = False):
+        """Track the current week's tables and retire rolled-over ones.
+
+        With drain_stale=True (first refresh after a start), older tables whose
+        checkpoint is not completed are scheduled too, so they are drained.
+        """
+        await self.refresh_catalog()
+        active = {d.name: d for d in self.catalog.latest(start_year)}
+        if drain_stale:
+            incomplete = await self.destination.run(load_incomplete_checkpoints)
+            for d in self.catalog.query(start_year=start_year):
+                if d.name not in active and self.checkpoint_key(d.name) in incomplete:
+                    logging.info(f"Table '{d.name}' has an incomplete checkpoint from before the restart")
+                    schedule.add(d.name, d.granularity)
+
+        retired = [table for table in schedule.state if table not in active]
+        for table in retired:
+            logging.info(f"Table '{table}' rolled over, draining and retiring it")
+        await asyncio.gather(*(self.retire(table, schedule) for table in retired))
+
+        for table, descriptor in active.items():
+            schedule.add(table, descriptor.granularity)
+
+    async def run_daemon(self, max_cycles: Optional[int] = None):
+        """Poll the active weekly tables concurrently with adaptive intervals.
+
+        Args:
+            max_cycles: Stop after this many scheduling cycles (None runs forever).
+        """
+        await self.start()
+        schedule = PollSchedule(
+            settle_seconds=daemon_settings['settle_seconds'],
+            retry_seconds=daemon_settings['retry_seconds'],
+            max_backoff_seconds=daemon_settings['max_backoff_seconds']
+        )
+        refresh_interval = daemon_settings['catalog_refresh_seconds']
+        next_refresh = 0.0
+        refreshed = False
+        cycles = 0
+
+        try:
+            while max_cycles is None or cycles < max_cycles:
+                now = time.time()
+                if now >= next_refresh:
+                    try:
+                        await self.refresh_active_tables(schedule, drain_stale=not refreshed)
+                        refreshed = True
+                        next_refresh = now + refresh_interval
+                    except Exception as e:
+                        # Keep polling the scheduled tables and retry the refresh shortly
+                        logging.error(f"Error refreshing the tables of {self.name or 'source'}, retrying in {daemon_settings['retry_seconds']}s: {e}")
+                        next_refresh = now + daemon_settings['retry_seconds']
+                    logging.info(f"{len(self.in_flight)} tables in flight, {len(schedule.state)} scheduled")
+
+                for table in schedule.due():
+                    if table in self.in_flight:
+                        continue
+                    task = asyncio.ensure_future(self.poll_and_record(table, schedule))
+                    self.in_flight[table] = task
+                    task.add_done_callback(lambda _, table=table: self.in_flight.pop(table, None))
+
+                cycles += 1
+                sleep_for = min(schedule.seconds_until_next(), max(0.0, next_refresh - time.time()))
+                if sleep_for <= 0 and self.in_flight:
+                    # Every due table is already being polled: wait for one to finish
+                    await asyncio.wait(set(self.in_flight.values()), timeout=max(0.0, next_refresh - time.time()),
+                                       return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(max(0.0, sleep_for))
+        finally:
+            if self.in_flight:
+                await asyncio.wait(set(self.in_flight.values()))
+            self.close()
+
+
+class FanInOrchestrator:
+    """Runs one AsyncOrchestrator per source database into the shared destination.
+
+    Every source has its own connection pool, catalog, batch sizer, checkpoint
+    namespace and table concurrency, so a slow or failing source never holds
+    back the others; only the destination pool is shared.
+    """
+
+    def __init__(self, sources: Dict[str, Dict[str, Any]]):
+        self.destination = AsyncConnectionPool(DESTINATION_CONFIG, async_settings['destination_connections'])
+        self.orchestrators = [
+            AsyncOrchestrator(name, settings['config'], self.destination, settings['connections'], settings['max_tables'])
+            for name, settings in sources.items()
+        ]
+        for orchestrator in self.orchestrators:
+            orchestrator.peers = self.orchestrators
+
+    async def gather(self, runs) -> List[Any]:
+        try:
+            results = await asyncio.gather(*runs, return_exceptions=True)
+        finally:
+            self.destination.close()
+        for orchestrator, result in zip(self.orchestrators, results):
+            if isinstance(result, Exception):
+                logging.error(f"Source '{orchestrator.name}' failed: {result}")
+        return results
+
+    async def process_orchestration(self):
+        """Backfill all sources concurrently."""
+        start = time.perf_counter()
+        try:
+            with profile_run("fan_in_orchestration"):
+                results = await self.gather(o.backfill() for o in self.orchestrators)
+            failed = [r for r in results if isinstance(r, Exception)]
+            if failed:
+                raise RuntimeError(f"{len(failed)} of {len(self.orchestrators)} sources failed during orchestration")
+        finally:
+            for orchestrator in self.orchestrators:
+                if orchestrator.validator is not None:
+                    orchestrator.validator.log_metrics()
+            log_report("Fan-in orchestration", time.perf_counter() - start)
+
+    async def supervise(self, orchestrator: AsyncOrchestrator, max_cycles: Optional[int] = None):
+        """Run one source's daemon, restarting it after a failure while the other sources keep running."""
+        while True:
+            try:
+                return await orchestrator.run_daemon(max_cycles)
+            except Exception as e:
+                logging.error(f"Source '{orchestrator.name}' failed, restarting it in {daemon_settings['retry_seconds']}s: {e}")
+                await asyncio.sleep(daemon_settings['retry_seconds'])
+                # run_daemon closed the source pool on its way out
+                orchestrator.source = AsyncConnectionPool(orchestrator.source.config, orchestrator.source.size)
+
+    async def run_daemon(self, max_cycles: Optional[int] = None):
+        """Poll the active tables of every source concurrently."""
+        logging.info(f"Polling {len(self.orchestrators)} sources: {', '.join(o.name for o in self.orchestrators)}")
+        await self.gather(self.supervise(o, max_cycles) for o in self.orchestrators)
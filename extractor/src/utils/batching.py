@@ -0,0 +1,87 @@
+import sys
+import logging
+from typing import Dict, List
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def estimate_row_bytes(row: tuple) -> int:
+    """Approximate in-memory size of one fetched row."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class AdaptiveBatchSizer:
+    """Per-table batch size tuned from observed fetch and insert latencies.
+
+    Every table keeps a smoothed seconds-per-row estimate for fetching and for
+    inserting. The next batch size is chosen so that the slower of the two takes
+    about `target_seconds`, limited to twice the previous size per step and to
+    `max_bytes` of fetched rows, and clamped to [min_size, max_size].
+    A timeout halves the table's size immediately.
+
+    With adaptive=False, size_for() always returns `initial`.
+    """
+
+    def __init__(self, initial: int = 5000, min_size: int = 500, max_size: int = 50000,
+                 target_seconds: float = 2.0, max_bytes: int = 64 * 1024 * 1024,
+                 adaptive: bool = True, smoothing: float = 0.3):
+        self.initial = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.adaptive = adaptive
+        self.smoothing = smoothing
+        self.sizes: Dict[str, int] = {}
+        self.fetch_per_row: Dict[str, float] = {}
+        self.load_per_row: Dict[str, float] = {}
+        self.row_bytes: Dict[str, int] = {}
+
+    def clamp(self, size: int) -> int:
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def size_for(self, table: str) -> int:
+        """Batch size to request next for a table."""
+        if not self.adaptive:
+            return self.initial
+        return self.sizes.get(table, self.clamp(self.initial))
+
+    def observe_fetch(self, table: str, data: List[tuple], seconds: float):
+        """Record how long fetching a batch took."""
+        if data:
+            self.row_bytes[table] = estimate_row_bytes(data[0])
+            self._observe(self.fetch_per_row, table, len(data), seconds)
+
+    def observe_load(self, table: str, rows: int, seconds: float):
+        """Record how long inserting a batch took."""
+        self._observe(self.load_per_row, table, rows, seconds)
+
+    def shrink(self, table: str) -> int:
+        """Halve a table's batch size after a timeout and return the new size."""
+        previous = self.size_for(table)
+        size = self.clamp(previous // 2)
+        if self.adaptive:
+            self.sizes[table] = size
+        logging.warning(f"Batch size for '{table}' reduced from {previous} to {size} after a timeout")
+        return size
+
+    def _observe(self, estimates: Dict[str, float], table: str, rows: int, seconds: float):
+        if not self.adaptive or rows <= 0:
+            return
+        per_row = seconds / rows
+        previous = estimates.get(table)
+        estimates[table] = per_row if previous is None else previous + self.smoothing * (per_row - previous)
+        self._resize(table)
+
+    def _resize(self, table: str):
+        per_row = max(self.fetch_per_row.get(table, 0.0), self.load_per_row.get(table, 0.0))
+        current = self.size_for(table)
+        size = self.target_seconds / per_row if per_row > 0 else self.max_size
+        size = min(size, current * 2)
+        if table in self.row_bytes:
+            size = min(size, self.max_bytes / self.row_bytes[table])
+        size = self.clamp(size)
+        if size != current:
+            logging.debug(f"Batch size for '{table}': {current} -> {size} ({per_row * 1000:.3f} ms/row)")
+        self.sizes[table] = size
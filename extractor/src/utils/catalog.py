@@ -0,0 +1,142 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from config import TABLE_NAME_PATTERN
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Order in which families are listed for the same (year, week)
+FAMILY_ORDER: Dict[str, int] = {'5min': 0, '15min': 1, 'mgw': 2}
+
+
+@dataclass(frozen=True)
+class TableDescriptor:
+    """Metadata parsed once from a source table name."""
+    name: str
+    family: str
+    node: str
+    week: int
+    year: int
+    granularity: Optional[int]
+
+    @property
+    def sort_key(self) -> tuple:
+        return (self.year, self.week, FAMILY_ORDER[self.family])
+
+
+def parse_table_name(table: str) -> Optional[TableDescriptor]:
+    """Parse a table name with the combined pattern.
+
+    Args:
+        table: Table name as returned by SHOW TABLES.
+
+    Returns:
+        TableDescriptor, or None if the name matches no known family.
+    """
+    match = TABLE_NAME_PATTERN.match(table)
+    if not match:
+        return None
+    if match.group('node'):
+        granularity = int(match.group('granularity'))
+        family = f"{granularity}min"
+        node = match.group('node').upper()
+    else:
+        granularity = None
+        family = 'mgw'
+        node = match.group('mgw_node').upper()
+    return TableDescriptor(
+        name=table,
+        family=family,
+        node=node,
+        week=int(match.group('week')),
+        year=int(match.group('year')),
+        granularity=granularity
+    )
+
+
+class TableCatalog:
+    """In-memory catalog of parsed table names, refreshed incrementally."""
+
+    def __init__(self, table_names: Iterable[str] = ()):
+        self.descriptors: Dict[str, TableDescriptor] = {}
+        self.ignored: set = set()
+        self.refresh(table_names)
+
+    def refresh(self, table_names: Iterable[str]) -> List[TableDescriptor]:
+        """Diff a fresh table listing against the catalog and parse only new names.
+
+        Args:
+            table_names: Complete list of table names currently in the database.
+
+        Returns:
+            Descriptors of tables that were not in the catalog before.
+        """
+        names = set(table_names)
+        known = self.descriptors.keys() | self.ignored
+
+        for removed in known - names:
+            self.descriptors.pop(removed, None)
+            self.ignored.discard(removed)
+
+        added = []
+        for table in names - known:
+            descriptor = parse_table_name(table)
+            if descriptor is None:
+                self.ignored.add(table)
+                continue
+            self.descriptors[table] = descriptor
+            added.append(descriptor)
+
+        added.sort(key=lambda d: (d.sort_key, d.name))
+        logging.info(f"Catalog refreshed: {len(added)} new tables, {len(self.descriptors)} tracked, {len(self.ignored)} ignored")
+        return added
+
+    def get(self, table: str) -> Optional[TableDescriptor]:
+        """Return the descriptor for a table, parsing it on the fly if unknown."""
+        descriptor = self.descriptors.get(table)
+        if descriptor is None and table not in self.ignored:
+            descriptor = parse_table_name(table)
+            if descriptor is not None:
+                self.descriptors[table] = descriptor
+        return descriptor
+
+    def query(self, family: Optional[str] = None, node: Optional[str] = None,
+              start_year: Optional[int] = None, year: Optional[int] = None,
+              week: Optional[int] = None) -> List[TableDescriptor]:
+        """Select descriptors matching all given filters, sorted by year, week and family.
+
+        Args:
+            family: '5min', '15min' or 'mgw'.
+            node: Node name (e.g. 'CALIS').
+            start_year: Minimum year to include.
+            year: Exact year.
+            week: Exact week number.
+
+        Returns:
+            Sorted list of matching descriptors.
+        """
+        result = [
+            d for d in self.descriptors.values()
+            if (family is None or d.family == family)
+            and (node is None or d.node == node.upper())
+            and (start_year is None or d.year >= start_year)
+            and (year is None or d.year == year)
+            and (week is None or d.week == week)
+        ]
+        result.sort(key=lambda d: (d.sort_key, d.name))
+        return result
+
+    def names(self, **filters) -> List[str]:
+        """Same as query() but returns table names only."""
+        return [d.name for d in self.query(**filters)]
+
+    def latest(self, start_year: Optional[int] = None) -> List[TableDescriptor]:
+        """Return the most recent (year, week) table of each (family, node) pair.
+
+        These are the tables still being written to by the source.
+        """
+        newest: Dict[tuple, TableDescriptor] = {}
+        for d in self.query(start_year=start_year):
+            newest[(d.family, d.node)] = d  # query() is sorted, so the last one wins
+        return sorted(newest.values(), key=lambda d: (d.sort_key, d.name))
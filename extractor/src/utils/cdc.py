@@ -0,0 +1,312 @@
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+from catalog import parse_table_name
+from profiling import timed
+from config import SOURCE_CONFIG, DESTINATION_CONFIG, patterns, start_year, cdc_settings, lease_settings
+from tools import connect_database, map_indicators, load_binlog_positions, save_checkpoint, update_last_extracted
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Source columns, in the order of the polled SELECT
+SOURCE_COLUMNS = ('date_heure', 'ID_indicateur', 'valeur')
+
+# etl_checkpoints row holding the position up to which every event was handled
+STREAM_CHECKPOINT = '__binlog_stream__'
+
+# Seconds before rows of a table without indicator mapping are tried again
+UNMAPPED_RETRY_SECONDS = 30
+
+
+class BinlogEvent(NamedTuple):
+    """Inserted rows of one row-based binlog event.
+
+    `log_pos` is the end position of the event, i.e. where to resume after it.
+    Heartbeats are events without a table: they only move the position past
+    events the stream filtered out.
+    """
+    log_file: str
+    log_pos: int
+    schema: str
+    table: str
+    rows: List[Dict[str, Any]]
+
+    @property
+    def position(self) -> tuple:
+        return (self.log_file, self.log_pos)
+
+
+def is_tracked_table(table: str) -> bool:
+    """True for source tables of a known family from `start_year` onwards."""
+    if not any(pattern.match(table) for pattern in patterns.values()):
+        return False
+    descriptor = parse_table_name(table)
+    return descriptor is not None and descriptor.year >= start_year
+
+
+def current_binlog_position(config: Dict[str, Any]) -> tuple:
+    """(file, position) of the end of the source binlog."""
+    conn = connect_database(config)
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute("SHOW BINARY LOG STATUS")  # MySQL 8.4+
+        except Exception:
+            cursor.execute("SHOW MASTER STATUS")
+        row = cursor.fetchone()
+        if not row:
+            raise RuntimeError("Binary logging is not enabled on the source server")
+        return (row[0], int(row[1]))
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def stream_binlog(config: Dict[str, Any], server_id: int, position: Optional[tuple] = None,
+                  blocking: bool = False, heartbeat_seconds: Optional[float] = None) -> Iterator[BinlogEvent]:
+    """Yield the insert events of the source schema from the binlog.
+
+    Args:
+        config: Source connection settings.
+        server_id: Replica id announced to the server.
+        position: (file, position) to resume from; None starts at the current end.
+        blocking: Wait for new events instead of returning once caught up.
+        heartbeat_seconds: Ask the server for a heartbeat after this much idle
+            time; heartbeats are yielded as events without a table.
+    """
+    try:
+        from pymysqlreplication import BinLogStreamReader
+        from pymysqlreplication.event import HeartbeatLogEvent
+        from pymysqlreplication.row_event import WriteRowsEvent
+    except ImportError as e:
+        raise RuntimeError("CDC mode needs the mysql-replication package (pip install mysql-replication)") from e
+
+    stream = BinLogStreamReader(
+        connection_settings={
+            'host': config['host'],
+            'port': config['port'],
+            'user': config['user'],
+            'passwd': config['password']
+        },
+        server_id=server_id,
+        only_events=[WriteRowsEvent, HeartbeatLogEvent] if heartbeat_seconds else [WriteRowsEvent],
+        only_schemas=[config['database']],
+        resume_stream=True,
+        log_file=position[0] if position else None,
+        log_pos=position[1] if position else None,
+        blocking=blocking,
+        slave_heartbeat=heartbeat_seconds
+    )
+    try:
+        for event in stream:
+            if isinstance(event, HeartbeatLogEvent):
+                yield BinlogEvent(stream.log_file, stream.log_pos, '', '', [])
+            else:
+                yield BinlogEvent(stream.log_file, stream.log_pos, event.schema, event.table,
+                                  [row['values'] for row in event.rows])
+    finally:
+        stream.close()
+
+
+def read_fixture(path: str) -> Iterator[BinlogEvent]:
+    """Replay events recorded with record_fixture() (one JSON object per line)."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield BinlogEvent(record['log_file'], record['log_pos'], record['schema'], record['table'], record['rows'])
+
+
+def record_fixture(events: Iterable[BinlogEvent], path: str, limit: Optional[int] = None) -> int:
+    """Write events to a JSON-lines fixture; datetimes are stored as strings."""
+    count = 0
+    with open(path, 'w') as f:
+        for event in events:
+            f.write(json.dumps(event._asdict(), default=str) + "\n")
+            count += 1
+            if limit is not None and count >= limit:
+                break
+    logging.info(f"Recorded {count} binlog events to {path}")
+    return count
+
+
+class CdcReader:
+    """Turns binlog insert events into the batches loaded by the polling path.
+
+    Rows are buffered per table and loaded once `flush_rows` are pending, once the
+    oldest pending row is `flush_seconds` old, or when the stream is caught up.
+    Each load stores the binlog position of its last event in the table's
+    checkpoint, in the same transaction as the rows. The stream position saved
+    in STREAM_CHECKPOINT never passes a row still pending: it is the position
+    just before the oldest pending event, or the last event read when nothing
+    is pending. On restart the stream resumes from that position (or the
+    oldest table position) and events at or before a table's own position are
+    skipped, so no row is loaded twice or lost.
+
+    Rows of a table without indicator mapping stay pending and are tried again
+    every UNMAPPED_RETRY_SECONDS, holding the saved stream position back until
+    the mapping appears. The table's row offset is advanced too, so polling can
+    take over again.
+    """
+
+    def __init__(self, loader, flush_rows: int = 5000, flush_seconds: float = 0.5):
+        self.loader = loader
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.positions: Dict[str, tuple] = load_binlog_positions(loader.db)
+        self.offsets: Dict[str, int] = {}
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.position: Optional[tuple] = self.positions.pop(STREAM_CHECKPOINT, None)
+        if self.position is None and self.positions:
+            self.position = min(self.positions.values())
+        self.saved_position = self.position
+        self.saved_at = time.monotonic()
+        self.stats = {'events': 0, 'rows': 0, 'skipped': 0, 'batches': 0, 'unmapped': 0}
+
+    def handle(self, event: BinlogEvent):
+        """Buffer the rows of one event, flushing its table when the batch is full."""
+        previous, self.position = self.position, event.position
+        table = event.table
+        if not table:  # heartbeat
+            return
+        self.stats['events'] += 1
+        if not is_tracked_table(table):
+            return
+        loaded = self.positions.get(table)
+        if loaded is not None and event.position <= loaded:
+            self.stats['skipped'] += 1
+            return
+
+        entry = self.pending.get(table)
+        if entry is None:
+            # Resuming from `previous` replays this event, so it is safe to save while the rows wait
+            entry = self.pending[table] = {'rows': [], 'since': time.monotonic(), 'resume': previous}
+        entry['rows'].extend(tuple(row[column] for column in SOURCE_COLUMNS) for row in event.rows)
+        entry['position'] = event.position
+        if len(entry['rows']) >= self.flush_rows and 'retry_at' not in entry:
+            self.flush_table(table)
+
+    def flush_due(self):
+        """Flush tables whose oldest pending row has waited `flush_seconds`."""
+        now = time.monotonic()
+        for table in [t for t, entry in self.pending.items() if now >= entry.get('retry_at', entry['since'] + self.flush_seconds)]:
+            self.flush_table(table)
+
+    def flush(self):
+        now = time.monotonic()
+        for table in [t for t, entry in self.pending.items() if now >= entry.get('retry_at', 0)]:
+            self.flush_table(table)
+
+    @timed('cdc_flush')
+    def flush_table(self, table: str):
+        entry = self.pending[table]
+        raw_data = entry['rows']
+        data = map_indicators(table, raw_data)
+        if not data:
+            # Keep the rows: the stream position stays before them until the mapping appears
+            if 'retry_at' not in entry:
+                self.stats['unmapped'] += 1
+                logging.error(f"Holding {len(raw_data)} binlog rows of '{table}' until its indicator mapping is available")
+            entry['retry_at'] = time.monotonic() + UNMAPPED_RETRY_SECONDS
+            return
+        del self.pending[table]
+
+        if table not in self.offsets:
+            checkpoint = self.loader.get_checkpoint(table)
+            self.offsets[table] = checkpoint["offset"] if checkpoint else 0
+        offset = self.offsets[table] + len(data)
+        self.loader.load_batch_into_database(table, data, offset, entry['position'])
+        self.offsets[table] = offset
+        self.positions[table] = entry['position']
+        self.stats['rows'] += len(data)
+        self.stats['batches'] += 1
+        update_last_extracted(table, {
+            "offset": offset,
+            "total_extracted": offset,
+            "last_date": str(data[-1][0])
+        })
+
+    def safe_position(self) -> Optional[tuple]:
+        """Position to resume from without losing a pending row."""
+        held = [entry['resume'] for entry in self.pending.values() if entry['resume'] is not None]
+        if held:
+            return min(held)
+        if self.pending:
+            return None  # pending rows read before any known position: keep the saved one
+        return self.position
+
+    def save_position(self):
+        """Persist the stream position, held back before any pending row."""
+        position = self.safe_position()
+        self.saved_at = time.monotonic()
+        if position is None or position == self.saved_position:
+            return
+        save_checkpoint(self.loader.cursor, STREAM_CHECKPOINT, 0, binlog=position)
+        self.loader.db.commit()
+        self.saved_position = position
+
+    def run(self, events: Iterable[BinlogEvent], log_seconds: float = 60):
+        """Consume a stream of events (a fixture, or the live blocking stream) and flush.
+
+        The stream position is saved at most every `flush_seconds` while
+        events arrive, and once more when a finite stream ends.
+        """
+        logged_at = time.monotonic()
+        for event in events:
+            self.handle(event)
+            self.flush_due()
+            now = time.monotonic()
+            if now - self.saved_at >= self.flush_seconds:
+                self.save_position()
+            if now - logged_at >= log_seconds:
+                logging.info(f"CDC at {self.position}: {self.stats}, {len(self.pending)} tables pending")
+                logged_at = now
+        self.flush()
+        self.save_position()
+
+    def run_live(self, config: Dict[str, Any], server_id: int, heartbeat_seconds: float = 1.0):
+        """Tail the source binlog through one blocking replication connection.
+
+        The start position is pinned (and saved) before the stream opens, so
+        events written while the reader starts are not skipped. The server
+        sends a heartbeat after `heartbeat_seconds` without events, which lets
+        pending rows be flushed on time while the source is idle.
+        """
+        if self.position is None and cdc_settings['start_file']:
+            self.position = (cdc_settings['start_file'], cdc_settings['start_pos'])
+        if self.position is None:
+            self.position = current_binlog_position(config)
+            self.save_position()
+        logging.info(f"Starting binlog CDC from {self.position}")
+        self.run(stream_binlog(config, server_id, self.position, blocking=True, heartbeat_seconds=heartbeat_seconds))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Binlog change-data-capture reader")
+    parser.add_argument("--fixture", help="Load events from a recorded JSON-lines fixture instead of the binlog")
+    parser.add_argument("--record", help="Record live binlog events to this fixture file and exit")
+    parser.add_argument("--limit", type=int, help="Number of events to record")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record_fixture(stream_binlog(SOURCE_CONFIG, cdc_settings['server_id'], blocking=True), args.record, args.limit)
+        return
+
+    if lease_settings['enabled']:
+        # One binlog reader loads every table; replicas would each load all of them
+        raise ValueError("EXTRACTOR_LEASES=1 is not supported in CDC mode; run a single CDC reader")
+    from loader import Loader
+    reader = CdcReader(Loader(DESTINATION_CONFIG), cdc_settings['flush_rows'], cdc_settings['flush_seconds'])
+    if args.fixture:
+        reader.run(read_fixture(args.fixture))
+        logging.info(f"Replayed fixture {args.fixture}: {reader.stats}")
+        return
+    reader.run_live(SOURCE_CONFIG, cdc_settings['server_id'], cdc_settings['heartbeat_seconds'])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
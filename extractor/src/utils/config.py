@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 import re
-from typing import Dict, Pattern
+from typing import Any, Dict, Pattern
 
 # Load environment variables
 load_dotenv()
@@ -50,6 +50,26 @@ patterns: Dict[str, Pattern] = {
     'mgw': re.compile(r'^([A-Za-z0-9]+)MGW_S\d+_A\d{4}$', re.IGNORECASE)
 }
 
+# Single combined pattern used by the table catalog (same families as `patterns`)
+TABLE_NAME_PATTERN: Pattern = re.compile(
+    r'^(?:(?P<node>CALIS|MEIND|RAIND)[-_]APG43[_-](?P<granularity>5|15)'
+    r'|(?P<mgw_node>[A-Za-z0-9]+)MGW)'
+    r'_S(?P<week>\d+)_A(?P<year>\d{4})$',
+    re.IGNORECASE
+)
+
+# Create a (Date, indicateur) index on destination tables when they are created
+CREATE_DATE_INDEX: bool = os.getenv("CREATE_DATE_INDEX", "1") == "1"
+
+# Add a UNIQUE (Date, indicateur) key to destination tables and upsert on it; rows whose
+# indicator is "Unknown" would collapse into one per slot, so they always go to etl_quarantine
+LOAD_UNIQUE_KEY: bool = os.getenv("LOAD_UNIQUE_KEY", "0") == "1"
+
+# Record the (table, Date) slots touched by each load in etl_slot_changes. Off by default like its consumer:
+# turn it on together with the transformer's TRANSFORMER_INCREMENTAL=1, or for the streaming transformer
+# to see rows rewritten under LOAD_UNIQUE_KEY
+TRACK_SLOT_CHANGES: bool = os.getenv("EXTRACTOR_TRACK_CHANGES", "0") == "1"
+
 # The year to start extracting data
 start_year: int = 2024
 
@@ -60,3 +80,138 @@ files_paths: Dict[str, str] = {
     'mgw': './data/our_data/result_mgw.txt',
     'last_extracted': './data/last_extracted.json'
 }
+
+# Daemon (continuous polling) settings
+EXTRACTOR_MODE: str = os.getenv("EXTRACTOR_MODE", "daemon")  # 'daemon', 'backfill' or 'cdc'
+daemon_settings: Dict[str, int] = {
+    'settle_seconds': int(os.getenv("POLL_SETTLE_SECONDS", 15)),
+    'retry_seconds': int(os.getenv("POLL_RETRY_SECONDS", 5)),
+    'max_backoff_seconds': int(os.getenv("POLL_MAX_BACKOFF_SECONDS", 900)),
+    'catalog_refresh_seconds': int(os.getenv("CATALOG_REFRESH_SECONDS", 60))
+}
+
+# Bounded queue between extraction and loading. Each batch carries the offset its
+# load checkpoints, so a dropped batch would be skipped for good: only the lossless
+# policies are accepted.
+load_stage_settings: Dict[str, Any] = {
+    'maxsize': int(os.getenv("LOAD_QUEUE_SIZE", 4)),
+    'policy': os.getenv("LOAD_QUEUE_POLICY", "block"),  # block or spill
+    'spill_dir': os.getenv("LOAD_SPILL_DIR", "./data/spill/load")
+}
+if load_stage_settings['policy'] not in ('block', 'spill'):
+    raise ValueError(f"LOAD_QUEUE_POLICY must be 'block' or 'spill', got '{load_stage_settings['policy']}'")
+
+# Adaptive batch sizing: each table's batch size is tuned between min and max so
+# the slower of fetch/insert takes about target_seconds, within max_bytes of memory
+batch_settings: Dict[str, Any] = {
+    'adaptive': os.getenv("BATCH_ADAPTIVE", "1") == "1",
+    'initial': int(os.getenv("BATCH_SIZE", 5000)),
+    'min_size': int(os.getenv("BATCH_SIZE_MIN", 500)),
+    'max_size': int(os.getenv("BATCH_SIZE_MAX", 50000)),
+    'target_seconds': float(os.getenv("BATCH_TARGET_SECONDS", 2.0)),
+    'max_bytes': int(os.getenv("BATCH_MAX_BYTES", 64 * 1024 * 1024)),
+    'query_timeout_ms': int(os.getenv("BATCH_QUERY_TIMEOUT_MS", 0))  # 0 disables the per-query limit
+}
+
+# I/O mode: 'sync' (Orchestrator) or 'async' (AsyncOrchestrator driving tables
+# concurrently over small connection pools from one event loop)
+EXTRACTOR_IO: str = os.getenv("EXTRACTOR_IO", "sync")
+async_settings: Dict[str, int] = {
+    'source_connections': int(os.getenv("ASYNC_SOURCE_CONNECTIONS", 4)),
+    'destination_connections': int(os.getenv("ASYNC_DEST_CONNECTIONS", 4)),
+    'max_tables': int(os.getenv("ASYNC_MAX_TABLES", 32))
+}
+
+# Change data capture (EXTRACTOR_MODE=cdc): tail the source binlog instead of polling.
+# The source user needs REPLICATION SLAVE and REPLICATION CLIENT privileges.
+cdc_settings: Dict[str, Any] = {
+    'server_id': int(os.getenv("CDC_SERVER_ID", 4242)),  # must be unique among the source's replicas
+    'flush_rows': int(os.getenv("CDC_FLUSH_ROWS", 5000)),
+    'flush_seconds': float(os.getenv("CDC_FLUSH_SECONDS", 0.5)),
+    'heartbeat_seconds': float(os.getenv("CDC_HEARTBEAT_SECONDS", 1)),  # server heartbeat while the binlog is idle
+    'start_file': os.getenv("CDC_START_FILE"),  # default: resume from checkpoints, else the current binlog end
+    'start_pos': int(os.getenv("CDC_START_POS", 4))
+}
+
+# Multiple source databases fanned into the same destination. SOURCE_NAMES lists
+# them (e.g. "casa,fes"); each reads SOURCE_<NAME>_MYSQL_HOST/_USER/_PASSWORD/_PORT/_DB,
+# falling back to the SOURCE_MYSQL_* values, and gets its own connection pool
+# (SOURCE_<NAME>_CONNECTIONS) and table concurrency (SOURCE_<NAME>_MAX_TABLES).
+SOURCE_NAMES = [name.strip() for name in os.getenv("SOURCE_NAMES", "").split(",") if name.strip()]
+
+def source_env(name: str, key: str, default: Any) -> Any:
+    return os.getenv(f"SOURCE_{name.upper()}_{key}", default)
+
+source_configs: Dict[str, Dict[str, Any]] = {
+    name: {
+        'config': {
+            'host': source_env(name, "MYSQL_HOST", SOURCE_MYSQL_HOST),
+            'user': source_env(name, "MYSQL_USER", SOURCE_MYSQL_USER),
+            'password': source_env(name, "MYSQL_PASSWORD", SOURCE_MYSQL_PASSWORD),
+            'port': int(source_env(name, "MYSQL_PORT", SOURCE_MYSQL_PORT)),
+            'database': source_env(name, "MYSQL_DB", SOURCE_MYSQL_DB)
+        },
+        'connections': int(source_env(name, "CONNECTIONS", async_settings['source_connections'])),
+        'max_tables': int(source_env(name, "MAX_TABLES", async_settings['max_tables']))
+    }
+    for name in SOURCE_NAMES
+}
+
+# Several extractor replicas split the tables through leases (EXTRACTOR_LEASES=1).
+# Leases live in the destination database, or in SQLite for local runs. Only the
+# threaded daemon/backfill extractor supports them; the async, fan-in and CDC modes
+# refuse to start with EXTRACTOR_LEASES=1.
+lease_settings: Dict[str, Any] = {
+    'enabled': os.getenv("EXTRACTOR_LEASES", "0") == "1",
+    'backend': os.getenv("LEASE_BACKEND", "mysql"),  # 'mysql' or 'sqlite'
+    'sqlite_path': os.getenv("LEASE_SQLITE_PATH", "./data/leases.sqlite"),
+    'replica_id': os.getenv("EXTRACTOR_REPLICA_ID"),  # default: hostname-pid
+    'ttl_seconds': float(os.getenv("LEASE_TTL_SECONDS", 60)),
+    'heartbeat_seconds': float(os.getenv("LEASE_HEARTBEAT_SECONDS", 15))
+}
+
+# Indicator dictionaries: binary indexes in INDICATORS_DIR, kept current from the
+# source's indicator tables (INDICATOR_SOURCE_TABLE, formatted with the base name)
+indicator_settings: Dict[str, Any] = {
+    'directory': os.getenv("INDICATORS_DIR", "./data/indicators"),
+    'sync': os.getenv("INDICATOR_SYNC", "0") == "1",
+    'source_table': os.getenv("INDICATOR_SOURCE_TABLE", "indicateur_{base}"),
+    'sync_seconds': int(os.getenv("INDICATOR_SYNC_SECONDS", 60)),
+    'reload_seconds': float(os.getenv("INDICATOR_RELOAD_SECONDS", 5))
+}
+
+# Data-quality validation of each batch before it is loaded. Policy: 'report'
+# (metrics only), 'quarantine' (bad rows go to etl_quarantine, the rest loads)
+# or 'reject' (the whole batch is quarantined once its bad-row ratio exceeds
+# max_bad_ratio). Ranges: JSON file of {counter prefix: [min, max]}.
+validation_settings: Dict[str, Any] = {
+    'enabled': os.getenv("VALIDATION", "1") == "1",
+    'policy': os.getenv("VALIDATION_POLICY", "quarantine"),
+    'max_bad_ratio': float(os.getenv("VALIDATION_MAX_BAD_RATIO", 0.2)),
+    'max_unknown_rate': float(os.getenv("VALIDATION_MAX_UNKNOWN_RATE", 0.01)),
+    # Slot interval of tables whose name carries no granularity (MGW); 5/15-minute tables use their own
+    'mgw_slot_seconds': int(os.getenv("VALIDATION_MGW_SLOT_SECONDS", 900)),
+    'ranges_path': os.getenv("VALIDATION_RANGES", "./data/validation_ranges.json")
+}
+
+# Load-test replay (replay.py): historical rows are read from REPLAY_HISTORY_MYSQL_*
+# and written to REPLAY_TARGET_MYSQL_* (both default to the source); stage progress
+# is read from the destination and from KPI_MYSQL_* (the transformer's output
+# database, 5min_kpi on the destination server by default).
+def database_env(prefix: str, fallback: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'host': os.getenv(f"{prefix}_MYSQL_HOST", fallback['host']),
+        'user': os.getenv(f"{prefix}_MYSQL_USER", fallback['user']),
+        'password': os.getenv(f"{prefix}_MYSQL_PASSWORD", fallback['password']),
+        'port': int(os.getenv(f"{prefix}_MYSQL_PORT", fallback['port'])),
+        'database': os.getenv(f"{prefix}_MYSQL_DB", fallback['database'])
+    }
+
+replay_settings: Dict[str, Any] = {
+    'history_config': database_env("REPLAY_HISTORY", SOURCE_CONFIG),
+    'target_config': database_env("REPLAY_TARGET", SOURCE_CONFIG),
+    'kpi_config': database_env("KPI", {**DESTINATION_CONFIG, 'database': "5min_kpi"}),
+    'speed': float(os.getenv("REPLAY_SPEED", 60)),  # 0 replays as fast as possible
+    'poll_seconds': float(os.getenv("REPLAY_POLL_SECONDS", 0.5)),
+    'drain_seconds': float(os.getenv("REPLAY_DRAIN_SECONDS", 300))
+}
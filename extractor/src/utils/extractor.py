@@ -1,17 +1,22 @@
 import time
 import logging
-from tools import connect_database, process_tables_names, store_txt, extract_table_data
-from config import patterns, start_year
+from tools import connect_database, process_catalog_tables, store_txt, extract_table_data, is_timeout_error
+from catalog import TableCatalog
+from profiling import timed
+from config import start_year, batch_settings
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 class Extractor:
-    def __init__(self, config):
+    def __init__(self, config, sizer=None):
         self.config = config
         self.db = None
         self.cursor = None
         self.tables = None
+        self.catalog = TableCatalog()
+        self.sizer = sizer
+        self.last_batch_size = None
         self.connect()
 
     def connect(self):
@@ -19,6 +24,7 @@ class Extractor:
         self.db = connect_database(self.config)  # Retries handled in tools.py
         self.cursor = self.db.cursor()
 
+    @timed('show_tables')
     def extract_tables_names(self):
         """Extract all table names from the database and store them in a file."""
         try:
@@ -27,6 +33,7 @@ class Extractor:
             tables_file_path = "./data/our_tables/tables.txt"
             store_txt(tables, tables_file_path)
             self.tables = tables
+            self.catalog.refresh(tables)
             logging.info(f"Extracted {len(tables)} table names")
         except Exception as e:
             logging.error(f"Error extracting table names: {e}")
@@ -36,27 +43,40 @@ class Extractor:
         """Process table names by filtering and sorting them."""
         try:
             self.extract_tables_names()
-            tables_names = process_tables_names(self.tables, patterns, start_year)
-            logging.info(f"Processed table names: {tables_names}")
+            tables_names = process_catalog_tables(self.catalog, start_year)
+            logging.info(f"Processed {len(tables_names)} table names")
             return tables_names
         except Exception as e:
             logging.error(f"Error processing table names: {e}")
             raise
 
+    @timed('extract_table_data')
     def extract_table_data(self, table_name, offset, batch_size=5000):
-        """Extract data from a specific table in batches with retries."""
+        """Extract data from a specific table in batches with retries.
+
+        On a timeout the batch size is shrunk through the sizer (when one is set)
+        before retrying, and `last_batch_size` holds the size actually fetched.
+        """
         max_retries = 3
         retry_delay = 4
 
         for attempt in range(max_retries + 1):
             try:
-                data = extract_table_data(table_name, self.cursor, offset, batch_size)
+                start = time.perf_counter()
+                data = extract_table_data(table_name, self.cursor, offset, batch_size, batch_settings['query_timeout_ms'])
+                self.last_batch_size = batch_size
+                if self.sizer is not None:
+                    self.sizer.observe_fetch(table_name, data, time.perf_counter() - start)
                 return data
             except Exception as e:
                 if attempt < max_retries:
+                    if is_timeout_error(e):
+                        if self.sizer is not None:
+                            batch_size = self.sizer.shrink(table_name)
+                        self.connect()
                     wait_time = retry_delay * (2 ** attempt)
                     logging.warning(f"Retry {attempt + 1}/{max_retries} for table '{table_name}' after error: {e}. Waiting {wait_time}s...")
                     time.sleep(wait_time)
                 else:
                     logging.error(f"Max retries ({max_retries}) reached for table '{table_name}': {e}")
-                    raise
\ No newline at end of file
+                    raise
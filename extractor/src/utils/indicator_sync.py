@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import MySQLdb
+from typing import Dict, Iterable, List, Optional
+from indicators import base_name, index_path, csv_path, read_csv, write_index, IndicatorIndex
+from config import SOURCE_CONFIG, indicator_settings, start_year
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# MySQL error raised for a table that doesn't exist
+NO_SUCH_TABLE = 1146
+
+
+class IndicatorSync:
+    """Incrementally copies the source's indicator tables into binary indexes.
+
+    Each sync only asks the source for IDs above the index's current max ID, and
+    rewrites the index (atomically) when new counters appeared; readers pick
+    the new file up on their next reload check.
+    """
+
+    def __init__(self, directory: str = indicator_settings['directory'],
+                 source_table: str = indicator_settings['source_table']):
+        self.directory = directory
+        self.source_table = source_table
+        self.max_ids: Dict[str, int] = {}
+        self.missing: set = set()
+
+    def current(self, base: str) -> Dict[int, tuple]:
+        """Entries of a base's existing index (or its CSV export), empty if neither exists."""
+        path = index_path(self.directory, base)
+        if os.path.exists(path):
+            index = IndicatorIndex(path)
+            try:
+                return index.to_dict()
+            finally:
+                index.close()
+        if os.path.exists(csv_path(self.directory, base)):
+            return read_csv(csv_path(self.directory, base))
+        return {}
+
+    def sync_base(self, cursor, base: str) -> int:
+        """Fetch new IDs of one base. Returns the number of indicators added."""
+        table = self.source_table.format(base=base)
+        if table in self.missing:
+            return 0
+        max_id = self.max_ids.get(base)
+        if max_id is None:
+            max_id = max(self.current(base), default=0)
+        try:
+            cursor.execute(f"SELECT ID_indicateur, indicateur, type FROM {table} WHERE ID_indicateur > %s ORDER BY ID_indicateur", (max_id,))
+            rows = cursor.fetchall()
+        except Exception as e:
+            if isinstance(e, MySQLdb.Error) and e.args and e.args[0] == NO_SUCH_TABLE:
+                logging.warning(f"Indicator table {table} does not exist, not syncing {base}")
+                self.missing.add(table)
+            else:
+                logging.warning(f"Cannot read indicator table {table}, retrying on the next sync: {e}")
+            return 0
+
+        if rows:
+            entries = self.current(base)
+            for indicator_id, name, kind in rows:
+                entries[int(indicator_id)] = (name, kind or '')
+            write_index(index_path(self.directory, base), entries)
+            max_id = int(rows[-1][0])
+            logging.info(f"Synced {len(rows)} new indicators for {base} (max ID {max_id})")
+        self.max_ids[base] = max_id
+        return len(rows)
+
+    def sync(self, cursor, tables: Iterable[str]) -> int:
+        """Sync the indicator dictionaries of every base used by `tables`."""
+        bases = sorted({base_name(t) for t in tables})
+        return sum(self.sync_base(cursor, base) for base in bases)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Sync indicator dictionaries from the source database")
+    parser.add_argument("--once", action="store_true", help="Sync once and exit")
+    args = parser.parse_args(argv)
+
+    from extractor import Extractor
+    extractor = Extractor(SOURCE_CONFIG)
+    syncer = IndicatorSync()
+    while True:
+        extractor.extract_tables_names()
+        added = syncer.sync(extractor.cursor, extractor.catalog.names(start_year=start_year))
+        logging.info(f"Indicator sync added {added} indicators")
+        if args.once:
+            return
+        time.sleep(indicator_settings['sync_seconds'])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,221 @@
+import os
+import re
+import csv
+import mmap
+import time
+import struct
+import logging
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Binary indicator index: header, then sorted IDs, name offsets, type codes and
+# the UTF-8 name blob. Arrays use native byte order (files are shared between
+# processes of one host, not across architectures).
+MAGIC = b'IND1'
+HEADER = struct.Struct('=4sIQI')  # magic, count, max ID, blob length
+TABLE_SUFFIX = re.compile(r'_s\d+_a\d{4}$', re.IGNORECASE)
+
+
+def base_name(table: str) -> str:
+    """Indicator dictionary name of a source table (table name without _S<week>_A<year>)."""
+    return TABLE_SUFFIX.sub('', table).upper()
+
+
+def index_path(directory: str, base: str) -> str:
+    return os.path.join(directory, f"indicateur_{base}.idx")
+
+
+def csv_path(directory: str, base: str) -> str:
+    return os.path.join(directory, f"indicateur_{base}.csv")
+
+
+def read_csv(path: str) -> Dict[int, Tuple[str, str]]:
+    """Read an exported indicator CSV (ID_indicateur, indicateur, type)."""
+    with open(path, newline='') as f:
+        return {int(row['ID_indicateur']): (row['indicateur'], row.get('type') or '') for row in csv.DictReader(f)}
+
+
+def write_index(path: str, entries: Dict[int, Tuple[str, str]]):
+    """Atomically write entries {ID: (name, type)} as a binary index."""
+    ids = sorted(entries)
+    offsets = array('I', [0])
+    types = bytearray()
+    blob = bytearray()
+    for indicator_id in ids:
+        name, kind = entries[indicator_id]
+        blob += name.encode('utf-8')
+        offsets.append(len(blob))
+        types += (kind or ' ')[:1].encode('ascii', 'replace')
+    # A unique temp file per writer, so concurrent rebuilds never write into each other's file
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(ids), ids[-1] if ids else 0, len(blob)))
+            f.write(array('I', ids).tobytes())
+            f.write(offsets.tobytes())
+            f.write(bytes(types))
+            f.write(bytes(blob))
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; the index is read by other processes
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class IndicatorIndex:
+    """Read-only memory-mapped view of one binary indicator index.
+
+    The pages are shared by every process mapping the same file, and lookups
+    binary-search the ID array without building Python objects per entry.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.max_id, blob_length = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an indicator index")
+        view = memoryview(self.mm)
+        start = HEADER.size
+        self.ids = view[start:start + 4 * self.count].cast('I')
+        start += 4 * self.count
+        self.offsets = view[start:start + 4 * (self.count + 1)].cast('I')
+        start += 4 * (self.count + 1)
+        self.types = view[start:start + self.count]
+        start += self.count
+        self.blob = view[start:start + blob_length]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def position(self, indicator_id: int) -> Optional[int]:
+        i = bisect_left(self.ids, indicator_id)
+        return i if i < self.count and self.ids[i] == indicator_id else None
+
+    def get(self, indicator_id: int) -> Optional[str]:
+        i = self.position(indicator_id)
+        if i is None:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def items(self) -> Iterator[Tuple[int, str, str]]:
+        """Yield (ID, name, type) in ID order."""
+        for i in range(self.count):
+            name = bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+            yield self.ids[i], name, chr(self.types[i]).strip()
+
+    def to_dict(self) -> Dict[int, Tuple[str, str]]:
+        return {indicator_id: (name, kind) for indicator_id, name, kind in self.items()}
+
+    def changed_on_disk(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != (self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def close(self):
+        for view in (self.ids, self.offsets, self.types, self.blob):
+            view.release()
+        self.mm.close()
+
+
+class IndicatorCatalog:
+    """Indicator name lookups backed by the shared binary indexes, with metrics.
+
+    A base without an index is converted once from its CSV export. Indexes
+    rewritten by the sync are re-mapped at most every `reload_seconds`.
+    Recently decoded names are cached per base.
+    """
+
+    def __init__(self, directory: str = './data/indicators', reload_seconds: float = 5.0):
+        self.directory = directory
+        self.reload_seconds = reload_seconds
+        self.indexes: Dict[str, Optional[IndicatorIndex]] = {}
+        self.names: Dict[str, Dict[int, str]] = {}
+        self.checked: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def open(self, base: str) -> Optional[IndicatorIndex]:
+        path = index_path(self.directory, base)
+        if not os.path.exists(path):
+            source = csv_path(self.directory, base)
+            if not os.path.exists(source):
+                logging.warning(f"No indicator index or CSV for {base} in {self.directory}")
+                return None
+            write_index(path, read_csv(source))
+            logging.info(f"Converted {source} to binary index {path}")
+        index = IndicatorIndex(path)
+        logging.info(f"Mapped indicator index {path} ({len(index)} entries, max ID {index.max_id})")
+        return index
+
+    def index(self, base: str) -> Optional[IndicatorIndex]:
+        """Current index of a base, re-mapped when the file was replaced."""
+        now = time.monotonic()
+        with self.lock:
+            index = self.indexes.get(base)
+            due = now - self.checked.get(base, 0.0) >= self.reload_seconds
+            if base not in self.indexes or (due and (index is None or index.changed_on_disk())):
+                # The previous mapping is released once no caller still uses it
+                index = self.indexes[base] = self.open(base)
+                self.names[base] = {}
+                self.checked[base] = now
+            elif due:
+                self.checked[base] = now
+            return index
+
+    def map_rows(self, table: str, raw_data: List[tuple]) -> Optional[List[tuple]]:
+        """Replace indicator IDs by names in (date_heure, ID_indicateur, valeur) rows.
+
+        Unknown IDs become "Unknown" and are counted as misses.
+
+        Returns:
+            Mapped rows, or None if the table has no indicator dictionary.
+        """
+        base = base_name(table)
+        index = self.index(base)
+        if index is None:
+            return None
+        cache = self.names[base]
+        stats = self.stats.setdefault(base, {'lookups': 0, 'hits': 0, 'misses': 0})
+        result = []
+        misses = 0
+        for date_heure, id_indicateur, valeur in raw_data:
+            name = cache.get(id_indicateur)
+            if name is None:
+                name = index.get(id_indicateur)
+                if name is None:
+                    misses += 1
+                    name = "Unknown"
+                else:
+                    cache[id_indicateur] = name
+            result.append((date_heure, name, valeur))
+        stats['lookups'] += len(raw_data)
+        stats['hits'] += len(raw_data) - misses
+        stats['misses'] += misses
+        if misses:
+            logging.warning(f"{misses}/{len(raw_data)} rows of {table} have indicator IDs missing from {base}")
+        return result
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per-base lookups, hits, misses and Unknown rate."""
+        return {
+            base: {**stats, 'unknown_rate': stats['misses'] / stats['lookups'] if stats['lookups'] else 0.0}
+            for base, stats in self.stats.items()
+        }
+
+    def log_metrics(self):
+        for base, m in sorted(self.metrics().items()):
+            logging.info(f"Indicators {base}: lookups={m['lookups']}, hits={m['hits']}, misses={m['misses']}, unknown_rate={m['unknown_rate']:.4%}")
@@ -0,0 +1,176 @@
+import os
+import time
+import math
+import socket
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class LeaseManager:
+    """Table ownership leases shared by several extractor replicas.
+
+    Leases live in `etl_leases` (destination MySQL, or SQLite for local runs)
+    and expire `ttl_seconds` after their last renewal. Replicas register a
+    heartbeat in `etl_replicas`; balance() spreads the candidate tables evenly
+    over the live replicas: a replica claims free or expired leases up to its
+    fair share and releases the surplus, so the tables of a dead replica are
+    picked up once its leases expire.
+
+    Every takeover increments the lease's `token`. Leases only decide who works
+    on a table; the compare-and-set on the checkpoint offset at load time
+    (see load_batch_into_database) guarantees a batch is never loaded twice.
+    """
+
+    def __init__(self, conn, replica_id: Optional[str] = None, ttl_seconds: float = 60,
+                 heartbeat_seconds: float = 15, dialect: str = 'mysql'):
+        self.conn = conn
+        self.replica_id = replica_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl_seconds = ttl_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.dialect = dialect
+        self.owned: Set[str] = set()
+        self.last_heartbeat = 0.0
+        self.create_tables()
+
+    def sql(self, query: str) -> str:
+        """Adapt %s placeholders and INSERT IGNORE to the backend."""
+        if self.dialect == 'sqlite':
+            return query.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+        return query
+
+    def execute(self, query: str, params: tuple = ()) -> int:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(self.sql(query), params)
+            self.conn.commit()
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def fetchall(self, query: str, params: tuple = ()) -> List[tuple]:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(self.sql(query), params)
+            rows = cursor.fetchall()
+            self.conn.commit()  # end the snapshot so the next read sees other replicas
+            return list(rows)
+        finally:
+            cursor.close()
+
+    def create_tables(self):
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS etl_leases (
+                table_name VARCHAR(255) NOT NULL PRIMARY KEY,
+                owner VARCHAR(255) NULL,
+                expires_at DOUBLE NOT NULL DEFAULT 0,
+                token BIGINT NOT NULL DEFAULT 0
+            )
+        """)
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS etl_replicas (
+                replica_id VARCHAR(255) NOT NULL PRIMARY KEY,
+                heartbeat_at DOUBLE NOT NULL
+            )
+        """)
+
+    def heartbeat(self, now: Optional[float] = None):
+        """Register this replica as alive and renew every lease it holds."""
+        now = time.time() if now is None else now
+        if self.execute("UPDATE etl_replicas SET heartbeat_at = %s WHERE replica_id = %s", (now, self.replica_id)) == 0:
+            self.execute("INSERT IGNORE INTO etl_replicas (replica_id, heartbeat_at) VALUES (%s, %s)", (self.replica_id, now))
+        self.execute("UPDATE etl_leases SET expires_at = %s WHERE owner = %s AND expires_at >= %s",
+                     (now + self.ttl_seconds, self.replica_id, now))
+        held = {row[0] for row in self.fetchall("SELECT table_name FROM etl_leases WHERE owner = %s AND expires_at >= %s",
+                                                (self.replica_id, now))}
+        lost = self.owned - held
+        if lost:
+            logging.warning(f"Replica {self.replica_id} lost {len(lost)} leases: {sorted(lost)}")
+        self.owned = held
+        self.last_heartbeat = now
+
+    def heartbeat_if_due(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if now - self.last_heartbeat >= self.heartbeat_seconds:
+            self.heartbeat(now)
+
+    def holds(self, table: str) -> bool:
+        """True while this replica's lease on `table` is valid (renewing when due)."""
+        self.heartbeat_if_due()
+        return table in self.owned
+
+    def live_replicas(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        rows = self.fetchall("SELECT COUNT(*) FROM etl_replicas WHERE heartbeat_at >= %s", (now - self.ttl_seconds,))
+        return max(1, rows[0][0])
+
+    def acquire(self, table: str, now: Optional[float] = None) -> bool:
+        """Take the lease on a table if it is free, expired or already ours."""
+        now = time.time() if now is None else now
+        self.execute("INSERT IGNORE INTO etl_leases (table_name, owner, expires_at, token) VALUES (%s, NULL, 0, 0)", (table,))
+        acquired = self.execute("""
+            UPDATE etl_leases SET owner = %s, expires_at = %s, token = token + 1
+            WHERE table_name = %s AND (owner IS NULL OR expires_at < %s)
+        """, (self.replica_id, now + self.ttl_seconds, table, now)) == 1
+        if acquired:
+            self.owned.add(table)
+            logging.info(f"Replica {self.replica_id} acquired lease on '{table}'")
+        return acquired or table in self.owned
+
+    def release(self, table: str):
+        self.execute("UPDATE etl_leases SET owner = NULL, expires_at = 0 WHERE table_name = %s AND owner = %s",
+                     (table, self.replica_id))
+        self.owned.discard(table)
+
+    def release_all(self):
+        for table in list(self.owned):
+            self.release(table)
+        self.execute("DELETE FROM etl_replicas WHERE replica_id = %s", (self.replica_id,))
+
+    def balance(self, candidates: Iterable[str], now: Optional[float] = None) -> Set[str]:
+        """Claim or release leases so this replica holds its fair share of `candidates`.
+
+        Returns:
+            The candidate tables this replica owns afterwards.
+        """
+        now = time.time() if now is None else now
+        candidates = list(candidates)
+        self.heartbeat(now)
+        share = math.ceil(len(candidates) / self.live_replicas(now)) if candidates else 0
+
+        mine = [t for t in candidates if t in self.owned]
+        for table in mine[share:]:
+            logging.info(f"Replica {self.replica_id} releasing '{table}' to rebalance")
+            self.release(table)
+        mine = mine[:share]
+
+        if len(mine) < share:
+            leases: Dict[str, tuple] = {
+                row[0]: (row[1], row[2])
+                for row in self.fetchall("SELECT table_name, owner, expires_at FROM etl_leases")
+            }
+            for table in candidates:
+                if len(mine) >= share:
+                    break
+                owner, expires_at = leases.get(table, (None, 0))
+                if table in self.owned or (owner is not None and expires_at >= now):
+                    continue
+                if self.acquire(table, now):
+                    mine.append(table)
+        return set(mine)
+
+
+def connect_leases(settings: Dict, destination_config: Dict) -> LeaseManager:
+    """Open the lease store: a dedicated destination connection, or SQLite locally."""
+    if settings['backend'] == 'sqlite':
+        import sqlite3
+        conn = sqlite3.connect(settings['sqlite_path'], timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        dialect = 'sqlite'
+    else:
+        from tools import connect_database
+        conn = connect_database(destination_config)
+        dialect = 'mysql'
+    return LeaseManager(conn, settings['replica_id'], settings['ttl_seconds'], settings['heartbeat_seconds'], dialect)
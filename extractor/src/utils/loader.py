@@ -1,5 +1,6 @@
 import logging
-from tools import connect_database, load_batch_into_database
+from tools import connect_database, load_batch_into_database, create_checkpoint_table, create_slot_changes_table, create_quarantine_table, load_checkpoint, save_checkpoint, load_completed_checkpoints, load_incomplete_checkpoints
+from profiling import timed
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -15,11 +16,33 @@ class Loader:
         """Connect to the database."""
         self.db = connect_database(self.config)  # Retries handled in tools.py
         self.cursor = self.db.cursor()
+        create_checkpoint_table(self.cursor)
+        create_slot_changes_table(self.cursor)
+        create_quarantine_table(self.cursor)
+        self.db.commit()
 
-    def load_batch_into_database(self, table_name, data):
-        """Load a batch of data into the database."""
+    @timed('load_batch_into_database')
+    def load_batch_into_database(self, table_name, data, offset=None, binlog=None, expected_offset=None, quarantine=None):
+        """Load a batch of data into the database, checkpointing `offset` in the same commit."""
         try:
-            load_batch_into_database(data, self.db, table_name)
+            load_batch_into_database(data, self.db, table_name, offset, binlog, expected_offset=expected_offset, quarantine=quarantine)
         except Exception as e:
             logging.error(f"Error loading batch into table {table_name}: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def get_checkpoint(self, table_name):
+        """Return the checkpoint committed with the last loaded batch, or None."""
+        return load_checkpoint(self.db, table_name)
+
+    def mark_completed(self, table_name, offset):
+        """Record in the destination that a table has been fully extracted."""
+        save_checkpoint(self.cursor, table_name, offset, completed=True)
+        self.db.commit()
+
+    def completed_tables(self):
+        """Tables marked completed in the destination checkpoints."""
+        return load_completed_checkpoints(self.db)
+
+    def incomplete_tables(self):
+        """Tables with a checkpoint not marked completed in the destination."""
+        return load_incomplete_checkpoints(self.db)
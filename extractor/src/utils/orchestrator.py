@@ -1,18 +1,39 @@
+import os
+import time
 import logging
 from extractor import Extractor
 from loader import Loader
-from config import SOURCE_CONFIG, DESTINATION_CONFIG
-from tools import load_last_extracted, save_last_extracted, connect_database
+from scheduler import PollSchedule
+from batching import AdaptiveBatchSizer
+from stage import BoundedStage
+from leases import connect_leases
+from indicator_sync import IndicatorSync
+from validation import BatchValidator
+from profiling import timed, profile_run, log_report
+from config import SOURCE_CONFIG, DESTINATION_CONFIG, start_year, daemon_settings, load_stage_settings, batch_settings, lease_settings, indicator_settings, validation_settings
+from tools import load_last_extracted, save_last_extracted, update_last_extracted, connect_database, CheckpointConflict, INDICATORS
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 class Orchestrator:
     def __init__(self):
-        self.extractor = Extractor(SOURCE_CONFIG)
+        self.sizer = AdaptiveBatchSizer(
+            initial=batch_settings['initial'],
+            min_size=batch_settings['min_size'],
+            max_size=batch_settings['max_size'],
+            target_seconds=batch_settings['target_seconds'],
+            max_bytes=batch_settings['max_bytes'],
+            adaptive=batch_settings['adaptive']
+        )
+        self.extractor = Extractor(SOURCE_CONFIG, self.sizer)
         self.loader = Loader(DESTINATION_CONFIG)
-        self.batch_size = 5000
+        self.load_stage = None
+        self.leases = connect_leases(lease_settings, DESTINATION_CONFIG) if lease_settings['enabled'] else None
+        self.indicator_sync = IndicatorSync() if indicator_settings['sync'] else None
+        self.validator = BatchValidator.from_settings(validation_settings) if validation_settings['enabled'] else None
 
+    @timed('count_rows')
     def get_total_rows(self, table, db_connection):
         """Get the total number of rows in the source table."""
         cursor = db_connection.cursor()
@@ -27,29 +48,56 @@ class Orchestrator:
         finally:
             cursor.close()
 
+    def get_resume_offset(self, table, last_extracted_info=None):
+        """Offset to resume a table from.
+
+        The checkpoint committed together with the loaded rows is authoritative;
+        the JSON file is only used for tables loaded before it existed.
+        """
+        checkpoint = self.loader.get_checkpoint(table)
+        if checkpoint is not None:
+            return checkpoint["offset"]
+        if last_extracted_info is None:
+            last_extracted_info = load_last_extracted()
+        return last_extracted_info.get(table, {}).get("offset", 0)
+
     def process_table_completely(self, table):
-        """Process a single table completely before moving to the next."""
-        offset = 0
-        total_extracted = 0
+        """Process a single table completely before moving to the next.
+
+        With leases, stops early (returning False) once this replica no longer
+        holds the table or another replica loaded past its checkpoint.
+
+        Returns:
+            True if the table was fully extracted.
+        """
         last_extracted_info = load_last_extracted()
-        
-        if table in last_extracted_info and "offset" in last_extracted_info[table]:
-            offset = last_extracted_info[table]["offset"]
-            total_extracted = offset
+        offset = self.get_resume_offset(table, last_extracted_info)
+        total_extracted = offset
+        if offset:
             logging.info(f"Resuming extraction for '{table}' from offset {offset}")
 
         source_db = connect_database(SOURCE_CONFIG)
         total_rows = self.get_total_rows(table, source_db)
 
         while True:
-            data = self.extractor.extract_table_data(table, offset, self.batch_size)
+            if self.leases is not None and not self.leases.holds(table):
+                logging.warning(f"Lease on '{table}' lost at offset {offset}, leaving it to its new owner")
+                source_db.close()
+                return False
+
+            data = self.extractor.extract_table_data(table, offset, self.sizer.size_for(table))
             logging.info(f"Processing table '{table}' at offset {offset}")
             
             if not data:
                 logging.info(f"No more data to process for table '{table}'")
                 break
 
-            self.loader.load_batch_into_database(table, data)
+            try:
+                self.load_batch(table, data, offset + len(data), expected_offset=offset)
+            except CheckpointConflict as e:
+                logging.warning(f"Stopping '{table}': {e}")
+                source_db.close()
+                return False
             offset += len(data)
             total_extracted += len(data)
 
@@ -67,27 +115,247 @@ class Orchestrator:
                 logging.info(f"Table '{table}' fully extracted ({total_extracted}/{total_rows} rows)")
                 break
 
-        last_extracted_info[table]["completed"] = True
+        last_extracted_info.setdefault(table, {})["completed"] = True
         save_last_extracted(last_extracted_info)
+        self.loader.mark_completed(table, offset)
         source_db.close()
+        return True
 
     def process_orchestration(self):
         """Orchestrate the extraction and loading process."""
+        start = time.perf_counter()
         try:
-            tables = self.extractor.process_tables_names()
-            last_extracted_info = load_last_extracted()
+            with profile_run("orchestration"):
+                tables = self.extractor.process_tables_names()
+                self.sync_indicators(tables)
+                if self.leases is not None:
+                    self.process_leased_tables(tables)
+                    return
+                last_extracted_info = load_last_extracted()
+
+                for table in tables:
+                    if table in last_extracted_info and last_extracted_info[table].get("completed", False):
+                        logging.info(f"Skipping table '{table}' - already fully processed")
+                        continue
+
+                    logging.info(f"Starting full extraction for table '{table}'")
+                    self.process_table_completely(table)
 
-            for table in tables:
-                if table in last_extracted_info and last_extracted_info[table].get("completed", False):
-                    logging.info(f"Skipping table '{table}' - already fully processed")
-                    continue
-                
-                logging.info(f"Starting full extraction for table '{table}'")
-                self.process_table_completely(table)
-        
         except Exception as e:
             logging.error(f"Error during orchestration: {e}")
             raise
+        finally:
+            INDICATORS.log_metrics()
+            if self.validator is not None:
+                self.validator.log_metrics()
+            log_report("Orchestration", time.perf_counter() - start)
+
+    def process_leased_tables(self, tables):
+        """Backfill shared with other replicas: only extract tables leased to this one.
+
+        Leases are rebalanced before every table, so replicas joining or dying
+        redistribute the remaining work; returns when every table is completed.
+        """
+        try:
+            while True:
+                completed = self.loader.completed_tables()
+                pending = [t for t in tables if t not in completed]
+                if not pending:
+                    logging.info("All tables completed")
+                    return
+                owned = self.leases.balance(pending)
+                table = next((t for t in pending if t in owned), None)
+                if table is None:
+                    logging.info(f"No table leased to this replica ({len(pending)} pending), waiting")
+                    time.sleep(self.leases.heartbeat_seconds)
+                    continue
+                logging.info(f"Starting full extraction for table '{table}'")
+                if self.process_table_completely(table):
+                    self.leases.release(table)
+        finally:
+            self.leases.release_all()
+
+    def sync_indicators(self, tables):
+        """Pull indicator IDs added on the source since the last sync (when enabled)."""
+        if self.indicator_sync is None:
+            return
+        try:
+            self.indicator_sync.sync(self.extractor.cursor, tables)
+        except Exception as e:
+            logging.error(f"Indicator sync failed: {e}")
+
+    def get_load_stage(self):
+        """Bounded queue feeding the loader thread; created on first use."""
+        if self.load_stage is not None and self.load_stage.error is not None:
+            logging.warning(f"Restarting load stage after failure: {self.load_stage.error}")
+            self.load_stage = None
+        if self.load_stage is None:
+            os.makedirs(load_stage_settings['spill_dir'], exist_ok=True)
+            self.load_stage = BoundedStage('load', self.load_and_checkpoint, **load_stage_settings)
+            self.load_stage.start()
+        return self.load_stage
+
+    def load_batch(self, table, data, offset, expected_offset=None):
+        """Validate and load one batch, and feed its insert latency to the batch sizer.
+
+        `expected_offset` is only enforced with leases, where another replica
+        may have taken the table over.
+        """
+        if self.leases is None:
+            expected_offset = None
+        quarantine = None
+        if self.validator is not None:
+            data, quarantine, _ = self.validator.validate(table, data)
+        start = time.perf_counter()
+        self.loader.load_batch_into_database(table, data, offset, expected_offset=expected_offset, quarantine=quarantine)
+        self.sizer.observe_load(table, len(data), time.perf_counter() - start)
+
+    def load_and_checkpoint(self, item):
+        """Stage handler: load one extracted batch, then advance its checkpoint."""
+        table, data, offset = item
+        self.load_batch(table, data, offset, expected_offset=offset - len(data))
+        update_last_extracted(table, {
+            "offset": offset,
+            "total_extracted": offset,
+            "last_date": str(data[-1][0])
+        })
+
+    def poll_table(self, table):
+        """Extract only the rows appended to a table since its last checkpoint.
+
+        Extraction of the next batch overlaps with loading of the previous one
+        through the bounded load stage; the call returns once every batch is
+        loaded and checkpointed.
+
+        Returns:
+            Number of new rows extracted.
+        """
+        stage = self.get_load_stage()
+        offset = self.get_resume_offset(table)
+        extracted = 0
+
+        while True:
+            data = self.extractor.extract_table_data(table, offset, self.sizer.size_for(table))
+            if not data:
+                break
+
+            if not stage.put((table, data, offset + len(data))):
+                # Never advance past a batch that will not be loaded
+                raise RuntimeError(f"Load stage dropped a batch of '{table}' at offset {offset}")
+            offset += len(data)
+            extracted += len(data)
+
+            if len(data) < self.extractor.last_batch_size:
+                break
+
+        stage.join()
+        if extracted:
+            logging.info(f"Polled {extracted} new rows from '{table}' (offset {offset}, batch size {self.sizer.size_for(table)}, load queue max depth {stage.stats['max_depth']})")
+        return extracted
+
+    def mark_completed(self, table):
+        """Mark a table as fully extracted so backfill runs skip it."""
+        entry = update_last_extracted(table, {"completed": True})
+        self.loader.mark_completed(table, entry.get("offset", 0))
+
+    def refresh_active_tables(self, schedule, drain_stale=False):
+        """Track the current week's table of each family/node and retire rolled-over ones.
+
+        With drain_stale=True (first refresh after a start), older tables whose
+        checkpoint is not completed are scheduled too, so a table that rolled
+        over while the daemon was down is drained like any other. A table that
+        fails to drain stays scheduled and is retried on the next refresh.
+        """
+        self.extractor.process_tables_names()
+        active = {d.name: d for d in self.extractor.catalog.latest(start_year)}
+        stale = {}
+        if drain_stale:
+            incomplete = self.loader.incomplete_tables()
+            stale = {d.name: d for d in self.extractor.catalog.query(start_year=start_year)
+                     if d.name not in active and d.name in incomplete}
+        self.sync_indicators(active)
+        if self.leases is not None:
+            owned = self.leases.balance(list(active) + list(stale))
+            for table in [t for t in schedule.state if t in active and t not in owned]:
+                logging.info(f"Table '{table}' handed over to another replica")
+                schedule.remove(table)
+            active = {name: d for name, d in active.items() if name in owned}
+            stale = {name: d for name, d in stale.items() if name in owned}
+        for table, descriptor in stale.items():
+            logging.info(f"Table '{table}' has an incomplete checkpoint from before the restart")
+            schedule.add(table, descriptor.granularity)
+
+        for table in list(schedule.state):
+            if table not in active:
+                logging.info(f"Table '{table}' rolled over, draining and retiring it")
+                try:
+                    self.poll_table(table)
+                    self.mark_completed(table)
+                except Exception as e:
+                    logging.error(f"Error draining table '{table}', retrying on the next refresh: {e}")
+                    continue
+                schedule.remove(table)
+                if self.leases is not None:
+                    self.leases.release(table)
+
+        for table, descriptor in active.items():
+            schedule.add(table, descriptor.granularity)
+
+    def run_daemon(self, max_cycles=None):
+        """Continuously poll the active weekly tables with adaptive intervals.
+
+        Args:
+            max_cycles: Stop after this many scheduling cycles (None runs forever).
+        """
+        schedule = PollSchedule(
+            settle_seconds=daemon_settings['settle_seconds'],
+            retry_seconds=daemon_settings['retry_seconds'],
+            max_backoff_seconds=daemon_settings['max_backoff_seconds']
+        )
+        refresh_interval = daemon_settings['catalog_refresh_seconds']
+        next_refresh = 0.0
+        refreshed = failed = False
+        cycles = 0
+
+        while max_cycles is None or cycles < max_cycles:
+            now = time.time()
+            if now >= next_refresh:
+                try:
+                    if failed:
+                        self.extractor.connect()
+                        self.loader.connect()
+                    self.refresh_active_tables(schedule, drain_stale=not refreshed)
+                    refreshed, failed = True, False
+                    next_refresh = now + refresh_interval
+                except Exception as e:
+                    # Keep polling the scheduled tables; the refresh is retried with fresh connections
+                    logging.error(f"Error refreshing the active tables, retrying in {daemon_settings['retry_seconds']}s: {e}")
+                    failed = True
+                    next_refresh = now + daemon_settings['retry_seconds']
+                if self.load_stage is not None:
+                    self.load_stage.log_metrics()
+                INDICATORS.log_metrics()
+                if self.validator is not None:
+                    self.validator.log_metrics()
+
+            for table in schedule.due():
+                if self.leases is not None and not self.leases.holds(table):
+                    logging.warning(f"Lease on '{table}' lost, unscheduling it")
+                    schedule.remove(table)
+                    continue
+                try:
+                    rows = self.poll_table(table)
+                except Exception as e:
+                    logging.error(f"Error polling table '{table}': {e}")
+                    rows = 0
+                schedule.record(table, rows)
+
+            cycles += 1
+            sleep_for = min(schedule.seconds_until_next(), max(0.0, next_refresh - time.time()))
+            if self.leases is not None:
+                self.leases.heartbeat_if_due()
+                sleep_for = min(sleep_for, self.leases.heartbeat_seconds)
+            time.sleep(sleep_for)
 
 if __name__ == "__main__":
     orchestrator = Orchestrator()
@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Opt-in instrumentation: ETL_PROFILE=1 enables stage timers, ETL_PROFILER adds a
+# whole-run profiler ('cprofile' or 'pyinstrument') written to ETL_PROFILE_OUTPUT.
+PROFILE_ENABLED: bool = os.getenv("ETL_PROFILE", "0") == "1"
+PROFILER: str = os.getenv("ETL_PROFILER", "")
+PROFILE_OUTPUT: str = os.getenv("ETL_PROFILE_OUTPUT", "./data/profiles/run")
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def record(stage: str, seconds: float, items: int = 1):
+    """Add one timing sample for a stage."""
+    with _lock:
+        entry = _stats.get(stage)
+        if entry is None:
+            entry = _stats[stage] = {'calls': 0, 'items': 0, 'seconds': 0.0, 'max': 0.0}
+        entry['calls'] += 1
+        entry['items'] += items
+        entry['seconds'] += seconds
+        if seconds > entry['max']:
+            entry['max'] = seconds
+
+
+def timed(stage: str) -> Callable:
+    """Decorator timing every call of a function under `stage`.
+
+    When profiling is disabled the function is returned unchanged, so the
+    decorator costs nothing in normal runs.
+    """
+    def decorator(func: Callable) -> Callable:
+        if not PROFILE_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage_timer(stage: str, items: int = 1):
+    """Context-manager form of timed() for code blocks."""
+    if not PROFILE_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, items)
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Copy of the current per-stage counters."""
+    with _lock:
+        return {stage: dict(entry) for stage, entry in _stats.items()}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def format_report(total_seconds: Optional[float] = None) -> str:
+    """Per-stage breakdown sorted by total time."""
+    stats = snapshot()
+    if not stats:
+        return "No stage timings recorded (set ETL_PROFILE=1)"
+    lines = [f"{'stage':<32} {'calls':>8} {'total s':>10} {'avg ms':>10} {'max ms':>10} {'share':>7}"]
+    for stage, entry in sorted(stats.items(), key=lambda kv: kv[1]['seconds'], reverse=True):
+        share = f"{entry['seconds'] / total_seconds * 100:6.1f}%" if total_seconds else "      -"
+        lines.append(
+            f"{stage:<32} {entry['calls']:>8} {entry['seconds']:>10.3f} "
+            f"{entry['seconds'] / entry['calls'] * 1000:>10.2f} {entry['max'] * 1000:>10.2f} {share:>7}"
+        )
+    if total_seconds:
+        lines.append(f"{'wall time':<32} {'':>8} {total_seconds:>10.3f}")
+    return "\n".join(lines)
+
+
+def log_report(title: str, total_seconds: Optional[float] = None):
+    """Log the per-stage breakdown when profiling is enabled."""
+    if PROFILE_ENABLED:
+        logging.info(f"{title} stage timings:\n{format_report(total_seconds)}")
+
+
+@contextmanager
+def profile_run(name: str):
+    """Run a block under the configured sampling/deterministic profiler.
+
+    Output goes to `<ETL_PROFILE_OUTPUT>-<name>.prof` (cProfile, readable with
+    pstats/snakeviz) or `.html` (pyinstrument). No-op when ETL_PROFILER is unset.
+    """
+    if not PROFILER:
+        yield
+        return
+
+    os.makedirs(os.path.dirname(PROFILE_OUTPUT) or '.', exist_ok=True)
+    if PROFILER == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logging.warning("pyinstrument is not installed, falling back to cProfile")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path = f"{PROFILE_OUTPUT}-{name}.html"
+                with open(path, 'w') as f:
+                    f.write(profiler.output_html())
+                logging.info(f"Profile written to {path}")
+            return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = f"{PROFILE_OUTPUT}-{name}.prof"
+        profiler.dump_stats(path)
+        logging.info(f"Profile written to {path}")
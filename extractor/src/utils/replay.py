@@ -0,0 +1,337 @@
+"""Replay historical counter rows into the pipeline at N x real time, for load tests.
+
+Rows of source tables (date_heure, ID_indicateur, valeur) are read from a history
+database an hour at a time, shifted to the present by a whole number of slots
+and inserted slot by slot into source-layout tables of a target database, which
+the extractor then picks up like production tables. Slots are emitted with their
+original spacing divided by --speed.
+
+Every emitted slot is traced with its emission time (replay_trace, committed
+with its rows), and a tracker polls each downstream stage's watermark, stamping
+the slot when the stage covers it:
+
+    loaded       etl_checkpoints.last_date of the table (extractor, destination)
+    transformed  kpi_watermarks.last_date of the table's node (transformer)
+    detected     anomaly_watermarks.last_date (anomaly detector, all nodes)
+
+At the end, emission-to-stage latency percentiles and throughput are printed per
+stage; raising --speed until a stage's latency keeps growing gives its
+saturation throughput. Latencies are observed at --poll resolution.
+
+    python src/utils/replay.py CALIS_APG43_5_S01_A2024 --speed 120 --start "2024-01-08" --end "2024-01-09" --target-week 42 --target-year 2026
+"""
+import re
+import sys
+import time
+import heapq
+import uuid
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import DESTINATION_CONFIG, replay_settings
+from catalog import parse_table_name
+from tools import connect_database
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+STAGES = ('loaded', 'transformed', 'detected')
+SLOT_SECONDS = 300
+TABLE_SUFFIX = re.compile(r'_S\d+_A\d{4}$', re.IGNORECASE)
+
+
+def target_name(table: str, week: Optional[int], year: Optional[int]) -> str:
+    """Name of the replayed table, with its week and year replaced when given."""
+    if week is None and year is None:
+        return table
+    descriptor = parse_table_name(table)
+    return TABLE_SUFFIX.sub(f"_S{week if week is not None else descriptor.week:02d}_A{year if year is not None else descriptor.year}", table)
+
+
+def create_trace_table(cursor):
+    """Create the table recording when each replayed slot was emitted."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS replay_trace (
+            run_id VARCHAR(36) NOT NULL,
+            table_name VARCHAR(255) NOT NULL,
+            slot DATETIME NOT NULL,
+            row_count INT NOT NULL,
+            emitted_at DOUBLE NOT NULL,
+            PRIMARY KEY (run_id, table_name, slot)
+        )
+    """)
+
+
+def percentiles(samples) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {'count': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 3)}
+
+
+class StageTracker:
+    """Polls the stage watermarks and records when each emitted slot reached each stage."""
+
+    def __init__(self, dest_config: Dict[str, Any], kpi_config: Dict[str, Any], poll_seconds: float):
+        self.dest_conn = connect_database(dest_config)
+        self.kpi_conn = self.dest_conn if kpi_config == dest_config else connect_database(kpi_config)
+        self.poll_seconds = poll_seconds
+        self.pending: Dict[str, List[Tuple[str, datetime, float, int]]] = {stage: [] for stage in STAGES}
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.rows: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.last_reached: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='replay-tracker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def emitted(self, table: str, node: str, slot: datetime, emitted_at: float, rows: int):
+        with self.lock:
+            self.pending['loaded'].append((table, slot, emitted_at, rows))
+            self.pending['transformed'].append((node, slot, emitted_at, rows))
+            self.pending['detected'].append(('*', slot, emitted_at, rows))
+
+    def watermarks(self) -> Dict[str, Dict[str, datetime]]:
+        """Current {stage: {table or node: last date}} of every stage."""
+        marks = {}
+        for stage, conn, query in (
+            ('loaded', self.dest_conn, "SELECT table_name, last_date FROM etl_checkpoints WHERE last_date IS NOT NULL"),
+            ('transformed', self.kpi_conn, "SELECT node, last_date FROM kpi_watermarks"),
+            ('detected', self.kpi_conn, "SELECT '*', MIN(last_date) FROM anomaly_watermarks")
+        ):
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query)
+                marks[stage] = {key: last_date for key, last_date in cursor.fetchall()}
+            except Exception as e:
+                # The stage's table appears with its first write
+                logging.debug(f"No watermark for stage {stage} yet: {e}")
+                marks[stage] = {}
+            finally:
+                cursor.close()
+            conn.commit()  # end the snapshot so the next poll sees new commits
+        return marks
+
+    def poll(self):
+        marks = self.watermarks()
+        now = time.time()
+        with self.lock:
+            for stage, entries in self.pending.items():
+                waiting = []
+                for entry in entries:
+                    key, slot, emitted_at, rows = entry
+                    mark = marks[stage].get(key)
+                    if mark is not None and mark >= slot:
+                        self.latencies[stage].append(now - emitted_at)
+                        self.rows[stage] += rows
+                        self.last_reached[stage] = now
+                    else:
+                        waiting.append(entry)
+                self.pending[stage] = waiting
+
+    def run(self):
+        while not self.stop_event.wait(self.poll_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Error polling stage watermarks: {e}")
+
+    def drain(self, timeout: float) -> bool:
+        """Wait until every emitted slot reached every stage. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not any(self.pending.values()):
+                    return True
+            time.sleep(self.poll_seconds)
+        return False
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def report(self, started_at: float) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {
+                stage: {
+                    'latency_s': percentiles(self.latencies[stage]),
+                    'rows_per_s': round(self.rows[stage] / max(self.last_reached.get(stage, started_at) - started_at, 1e-9), 1),
+                    'not_reached': len(self.pending[stage])
+                }
+                for stage in STAGES
+            }
+
+
+class Replay:
+    """Emits the slots of history tables into target tables, paced by the speed factor."""
+
+    def __init__(self, tables: Dict[str, str], start: Optional[str], end: Optional[str], speed: float,
+                 history_config: Dict[str, Any], target_config: Dict[str, Any]):
+        self.tables = tables  # {history table: target table}
+        self.start = start
+        self.end = end
+        self.speed = speed
+        self.history_conn = connect_database(history_config)
+        self.target_conn = connect_database(target_config)
+        self.run_id = str(uuid.uuid4())
+        self.nodes = {table: parse_table_name(table).node for table in tables}
+        self.stats = {'slots': 0, 'rows': 0, 'max_behind_s': 0.0}
+
+    def prepare(self):
+        """Create missing target tables with their history table's definition, and the trace table."""
+        history, target = self.history_conn.cursor(), self.target_conn.cursor()
+        for table, replayed in self.tables.items():
+            target.execute(f"SHOW TABLES LIKE '{replayed}'")
+            if target.fetchone():
+                continue
+            history.execute(f"SHOW CREATE TABLE {table}")
+            ddl = history.fetchone()[1].replace(f"CREATE TABLE `{table}`", f"CREATE TABLE IF NOT EXISTS `{replayed}`", 1)
+            target.execute(ddl)
+            logging.info(f"Created replay table {replayed} like {table}")
+        create_trace_table(target)
+        self.target_conn.commit()
+        history.close()
+        target.close()
+
+    def bounds(self, table: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+        cursor = self.history_conn.cursor()
+        conditions, params = [], []
+        if self.start:
+            conditions.append("date_heure >= %s")
+            params.append(self.start)
+        if self.end:
+            conditions.append("date_heure < %s")
+            params.append(self.end)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor.execute(f"SELECT MIN(date_heure), MAX(date_heure) FROM {table}{where}", params)
+        first, last = cursor.fetchone()
+        cursor.close()
+        self.history_conn.commit()
+        return first, last
+
+    def slots(self, table: str, first: datetime, last: datetime) -> Iterator[Tuple[datetime, str, List[tuple]]]:
+        """Yield (date, table, rows) per slot, reading the history an hour at a time."""
+        cursor = self.history_conn.cursor()
+        window = first
+        while window <= last:
+            cursor.execute(
+                f"SELECT date_heure, ID_indicateur, valeur FROM {table} WHERE date_heure >= %s AND date_heure < %s ORDER BY date_heure",
+                (window, min(window + timedelta(hours=1), last + timedelta(seconds=1)))
+            )
+            rows = cursor.fetchall()
+            self.history_conn.commit()
+            start = 0
+            for i in range(1, len(rows) + 1):
+                if i == len(rows) or rows[i][0] != rows[start][0]:
+                    yield rows[start][0], table, rows[start:i]
+                    start = i
+            window += timedelta(hours=1)
+        cursor.close()
+
+    def emit(self, table: str, slot: datetime, rows: List[tuple]) -> float:
+        """Insert one shifted slot and its trace in one commit. Returns the emission time."""
+        replayed = self.tables[table]
+        cursor = self.target_conn.cursor()
+        try:
+            cursor.executemany(
+                f"INSERT INTO {replayed} (date_heure, ID_indicateur, valeur) VALUES (%s, %s, %s)",
+                [(slot, indicator, value) for _, indicator, value in rows]
+            )
+            emitted_at = time.time()
+            cursor.execute("INSERT INTO replay_trace (run_id, table_name, slot, row_count, emitted_at) VALUES (%s, %s, %s, %s, %s)",
+                           (self.run_id, replayed, slot, len(rows), emitted_at))
+            self.target_conn.commit()
+        except Exception as e:
+            logging.error(f"Error emitting slot {slot} of {replayed}: {e}")
+            self.target_conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return emitted_at
+
+    def run(self, tracker: Optional[StageTracker] = None) -> float:
+        """Emit every slot in time order across the tables. Returns the replay start time."""
+        self.prepare()
+        ranges = {table: self.bounds(table) for table in self.tables}
+        ranges = {table: bounds for table, bounds in ranges.items() if bounds[0] is not None}
+        if not ranges:
+            logging.warning("Nothing to replay in the selected range")
+            return time.time()
+
+        # Shift by whole slots so the replayed rows land at the present, on slot boundaries
+        first = min(bounds[0] for bounds in ranges.values())
+        shift = datetime.fromtimestamp(time.time() // SLOT_SECONDS * SLOT_SECONDS) - first
+        logging.info(f"Replay {self.run_id}: {len(ranges)} tables from {first}, shifted by {shift}, at {self.speed or 'max'}x")
+
+        started_at = time.time()
+        merged = heapq.merge(*(self.slots(table, *bounds) for table, bounds in ranges.items()), key=lambda item: (item[0], item[1]))
+        for date, table, rows in merged:
+            if self.speed:
+                due = started_at + (date - first).total_seconds() / self.speed
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.stats['max_behind_s'] = max(self.stats['max_behind_s'], -delay)
+            slot = date + shift
+            emitted_at = self.emit(table, slot, rows)
+            if tracker:
+                tracker.emitted(self.tables[table], self.nodes[table], slot, emitted_at, len(rows))
+            self.stats['slots'] += 1
+            self.stats['rows'] += len(rows)
+        elapsed = max(time.time() - started_at, 1e-9)
+        logging.info(f"Replay {self.run_id}: emitted {self.stats['slots']} slots, {self.stats['rows']} rows in {elapsed:.1f}s "
+                     f"({self.stats['rows'] / elapsed:.0f} rows/s, at most {self.stats['max_behind_s']:.1f}s behind schedule)")
+        return started_at
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Replay historical source tables into the pipeline at N x real time")
+    parser.add_argument("tables", nargs="+", help="History tables to replay")
+    parser.add_argument("--start", help="First date_heure to replay (default: the tables' first)")
+    parser.add_argument("--end", help="Replay up to this date_heure, excluded (default: the tables' last)")
+    parser.add_argument("--speed", type=float, default=replay_settings['speed'], help="Time compression factor, 0 for as fast as possible")
+    parser.add_argument("--target-week", type=int, help="Week number of the replayed tables' names")
+    parser.add_argument("--target-year", type=int, help="Year of the replayed tables' names")
+    parser.add_argument("--poll", type=float, default=replay_settings['poll_seconds'], help="Stage watermark polling interval")
+    parser.add_argument("--drain", type=float, default=replay_settings['drain_seconds'], help="Seconds to wait for the stages after the last slot")
+    parser.add_argument("--no-track", action="store_true", help="Only emit, without following the stages")
+    args = parser.parse_args(argv)
+
+    tables = {}
+    for table in args.tables:
+        if parse_table_name(table) is None:
+            parser.error(f"{table} matches no known table family")
+        tables[table] = target_name(table, args.target_week, args.target_year)
+        if tables[table] == table and replay_settings['target_config'] == replay_settings['history_config']:
+            parser.error(f"Replaying {table} into itself; set REPLAY_TARGET_MYSQL_* or --target-week/--target-year")
+
+    tracker = None
+    if not args.no_track:
+        tracker = StageTracker(DESTINATION_CONFIG, replay_settings['kpi_config'], args.poll)
+        tracker.start()
+    replay = Replay(tables, args.start, args.end, args.speed, replay_settings['history_config'], replay_settings['target_config'])
+    started_at = replay.run(tracker)
+    if tracker is None:
+        return 0
+
+    drained = tracker.drain(args.drain)
+    tracker.stop()
+    for stage, result in tracker.report(started_at).items():
+        latency = result['latency_s']
+        print(f"{stage:12s} slots {latency.get('count', 0)}, latency p50 {latency.get('p50', '-')}s, p95 {latency.get('p95', '-')}s, "
+              f"p99 {latency.get('p99', '-')}s, max {latency.get('max', '-')}s, {result['rows_per_s']} rows/s, "
+              f"{result['not_reached']} slots not reached")
+    if not drained:
+        print(f"Not every slot reached every stage within {args.drain:.0f}s of the last emission")
+    return 0 if drained else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,94 @@
+import time
+import logging
+from typing import Dict, Optional, Any
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def next_boundary(now: float, granularity_minutes: int) -> float:
+    """Return the next measurement boundary (epoch seconds) strictly after `now`.
+
+    Args:
+        now: Current time in epoch seconds.
+        granularity_minutes: Measurement period (5 or 15).
+
+    Returns:
+        Epoch seconds of the next multiple of the period.
+    """
+    period = granularity_minutes * 60
+    return (int(now // period) + 1) * period
+
+
+class PollSchedule:
+    """Per-table adaptive polling schedule.
+
+    A poll that returns rows is followed by a quick re-poll to drain the slot.
+    The first empty poll after that waits for the next measurement boundary
+    (plus a settle delay for the source to finish writing). Further empty polls
+    retry with a doubling delay; once the delay exceeds the measurement period
+    the table is treated as idle and may skip boundaries, up to `max_backoff_seconds`.
+    """
+
+    def __init__(self, settle_seconds: int = 15, retry_seconds: int = 5, max_backoff_seconds: int = 900):
+        self.settle_seconds = settle_seconds
+        self.retry_seconds = retry_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.state: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, table: str, granularity_minutes: Optional[int], now: Optional[float] = None):
+        """Start tracking a table; it is due immediately."""
+        if table in self.state:
+            return
+        self.state[table] = {
+            'granularity': granularity_minutes or 15,
+            'next_due': now if now is not None else time.time(),
+            'idle_polls': 0
+        }
+        logging.info(f"Scheduling table '{table}' every {self.state[table]['granularity']} minutes")
+
+    def remove(self, table: str):
+        """Stop tracking a table."""
+        self.state.pop(table, None)
+
+    def due(self, now: Optional[float] = None) -> list:
+        """Return tables whose next poll time has passed, most overdue first."""
+        now = now if now is not None else time.time()
+        ready = [(s['next_due'], t) for t, s in self.state.items() if s['next_due'] <= now]
+        return [t for _, t in sorted(ready)]
+
+    def seconds_until_next(self, now: Optional[float] = None) -> float:
+        """Seconds until the earliest scheduled poll (0 if one is already due)."""
+        if not self.state:
+            return float(self.retry_seconds)
+        now = now if now is not None else time.time()
+        return max(0.0, min(s['next_due'] for s in self.state.values()) - now)
+
+    def record(self, table: str, rows: int, now: Optional[float] = None) -> float:
+        """Update the schedule after polling a table.
+
+        Args:
+            table: Table that was polled.
+            rows: Number of new rows found.
+            now: Poll completion time (defaults to time.time()).
+
+        Returns:
+            Epoch seconds of the next poll for this table.
+        """
+        now = now if now is not None else time.time()
+        entry = self.state[table]
+        period = entry['granularity'] * 60
+        boundary_due = next_boundary(now, entry['granularity']) + self.settle_seconds
+        if rows > 0:
+            entry['idle_polls'] = 0
+            entry['next_due'] = now + self.retry_seconds
+        else:
+            entry['idle_polls'] += 1
+            if entry['idle_polls'] == 1:
+                entry['next_due'] = boundary_due
+            else:
+                delay = min(self.retry_seconds * (2 ** (entry['idle_polls'] - 2)), self.max_backoff_seconds)
+                entry['next_due'] = now + delay
+                if delay < period:
+                    entry['next_due'] = min(entry['next_due'], boundary_due)
+        return entry['next_due']
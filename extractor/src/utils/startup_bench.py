@@ -0,0 +1,90 @@
+"""Startup-time benchmark for short-lived service invocations.
+
+Starts a fresh interpreter N times and measures the wall time until the
+service's entry modules are imported (and, with --connect, until the first
+query against the source database returned). Exits with status 1 when the
+median exceeds the target, so it can gate CI or image builds.
+
+    python src/utils/startup_bench.py --runs 20 --connect
+    python src/utils/startup_bench.py --importtime   # slowest imports of one run
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from typing import List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULES = ['orchestrator'] if os.path.exists(os.path.join(HERE, 'orchestrator.py')) else ['transformer']
+READY = "__startup_ready__"
+
+CHILD = """
+import sys
+sys.path.insert(0, {here!r})
+for module in {modules!r}:
+    __import__(module)
+if {connect!r}:
+    import config
+    from tools import connect_database
+    conn = connect_database(getattr(config, 'SOURCE_CONFIG', None) or config.SOURCE_DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1")
+    cursor.fetchone()
+print({ready!r}, flush=True)
+"""
+
+
+def measure(modules: List[str], connect: bool) -> float:
+    """Seconds from spawning the interpreter until it reports ready."""
+    code = CHILD.format(here=HERE, modules=modules, connect=connect, ready=READY)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in proc.stdout:
+        if line.strip() == READY:
+            elapsed = time.perf_counter() - start
+            proc.wait()
+            return elapsed
+    proc.wait()
+    raise RuntimeError(f"Benchmark child exited with status {proc.returncode} before becoming ready")
+
+
+def slowest_imports(modules: List[str], top: int = 15) -> List[str]:
+    """Run once under -X importtime and return the slowest imports by cumulative time."""
+    code = CHILD.format(here=HERE, modules=modules, connect=False, ready=READY)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return [f"{us / 1000:8.1f} ms  {name}" for us, name in rows[:top]]
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Measure service startup time")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="Entry modules to import")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--connect", action="store_true", help="Include connecting and a first SELECT 1")
+    parser.add_argument("--target-ms", type=float, default=300.0)
+    parser.add_argument("--importtime", action="store_true", help="Show the slowest imports instead")
+    args = parser.parse_args(argv)
+
+    if args.importtime:
+        print("\n".join(slowest_imports(args.modules)))
+        return 0
+
+    measure(args.modules, args.connect)  # warm the OS file cache and __pycache__
+    samples = sorted(measure(args.modules, args.connect) * 1000 for _ in range(args.runs))
+    median = statistics.median(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    print(f"startup of {', '.join(args.modules)}{' + first query' if args.connect else ''} over {args.runs} runs: "
+          f"median {median:.1f} ms, p95 {p95:.1f} ms, max {samples[-1]:.1f} ms (target {args.target_ms:.0f} ms)")
+    return 0 if median <= args.target_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,17 +1,33 @@
 import MySQLdb
-import pandas as pd
 import re
 import sys
 import json
 import os
+import fcntl
 from typing import List, Dict, Any, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential
-from config import files_paths as output_paths
+from config import files_paths as output_paths, CREATE_DATE_INDEX, LOAD_UNIQUE_KEY, TRACK_SLOT_CHANGES, indicator_settings
+from indicators import IndicatorCatalog
+from profiling import timed
 import logging
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# MySQL errors raised by slow or interrupted queries: lock wait timeout, server gone
+# away, connection lost during query, max_execution_time exceeded
+TIMEOUT_ERROR_CODES = {1205, 2006, 2013, 3024}
+
+class CheckpointConflict(Exception):
+    """The checkpoint moved since the batch was extracted (another replica loaded it)."""
+
+# Indicator dictionaries shared (memory-mapped) by every process of the host
+INDICATORS = IndicatorCatalog(indicator_settings['directory'], indicator_settings['reload_seconds'])
+
+# Precompiled table-name fragments
+YEAR_PATTERN = re.compile(r'_A(\d{4})$', re.IGNORECASE)
+WEEK_PATTERN = re.compile(r'_S(\d+)_', re.IGNORECASE)
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 def connect_database(config: Dict[str, Any]):
     """Connect to the database using mysqlclient with retries.
@@ -161,7 +177,7 @@ def filter_tables(table_names: List[str], pattern: re.Pattern) -> List[str]:
     Returns:
         Filtered list of table names.
     """
-    filtered = [table for table in table_names if re.match(pattern, table)]
+    filtered = [table for table in table_names if pattern.match(table)]
     logging.info(f"Filtered {len(filtered)} tables matching pattern {pattern.pattern}")
     return filtered
 
@@ -176,17 +192,17 @@ def filter_by_year(tables: List[str], start_year: int) -> List[str]:
         Filtered list of table names.
     """
     filtered_tables = []
+    skipped = 0
     for table in tables:
-        match = re.search(r'_A(\d{4})$', table, re.IGNORECASE)
+        match = YEAR_PATTERN.search(table)
         if match:
-            year = int(match.group(1))
-            if year >= start_year:
+            if int(match.group(1)) >= start_year:
                 filtered_tables.append(table)
-                logging.info(f"Matched table '{table}' with year {year} >= {start_year}")
             else:
-                logging.info(f"Skipped table '{table}' - year {year} < {start_year}")
+                skipped += 1
         else:
             logging.warning(f"Skipped table '{table}' - no year found in format '_AXXXX'")
+    logging.info(f"Matched {len(filtered_tables)} tables with year >= {start_year}, skipped {skipped} older tables")
     return filtered_tables
 
 def sort_by_year_and_week(tables: List[str]) -> List[str]:
@@ -200,8 +216,8 @@ def sort_by_year_and_week(tables: List[str]) -> List[str]:
     """
     try:
         sorted_tables = sorted(tables, key=lambda x: (
-            int(re.search(r'_A(\d{4})$', x, re.IGNORECASE).group(1)),
-            int(re.search(r'_S(\d+)_', x, re.IGNORECASE).group(1))
+            int(YEAR_PATTERN.search(x).group(1)),
+            int(WEEK_PATTERN.search(x).group(1))
         ))
         logging.info(f"Sorted {len(sorted_tables)} tables by year and week")
         return sorted_tables
@@ -252,29 +268,46 @@ def process_tables_names(table_names: List[str], patterns: Dict[str, re.Pattern]
     logging.info(f"Returning unified sorted list: {unified_sorted_tables}")
     return unified_sorted_tables
 
-def load_indicator_csv(table: str) -> Dict[int, str]:
-    """Load indicator data from CSV with headers into a dictionary.
-    
+def process_catalog_tables(catalog, start_year: int) -> List[str]:
+    """Select, sort and store table names from a TableCatalog.
+
+    Same output files and ordering as process_tables_names, without re-running
+    regexes over the full table listing.
+
     Args:
-        table: Table name to derive the CSV filename from.
-    
+        catalog: TableCatalog holding parsed table descriptors.
+        start_year: Minimum year to include.
+
     Returns:
-        Dictionary mapping ID_indicateur to indicateur.
+        Unified sorted list of table names.
     """
-    base_table_name = re.sub(r'_s\d+_a\d{4}$', '', table, flags=re.IGNORECASE)
-    csv_path = f"./data/indicators/indicateur_{base_table_name}.csv"
-    if not os.path.exists(csv_path):
-        logging.warning(f"Indicator CSV not found: {csv_path}, returning empty dict")
-        return {}
-    
-    try:
-        df = pd.read_csv(csv_path, dtype={'ID_indicateur': int, 'indicateur': str, 'type': str})
-        indicator_map = dict(zip(df['ID_indicateur'], df['indicateur']))
-        logging.info(f"Loaded indicator map from {csv_path} with {len(indicator_map)} entries")
-        return indicator_map
-    except Exception as e:
-        logging.error(f"Error loading CSV {csv_path}: {e}")
-        return {}
+    return store_catalog_tables([catalog], start_year)
+
+def store_catalog_tables(catalogs: List[Any], start_year: int) -> List[str]:
+    """Store the per-family table files for the union of several TableCatalogs.
+
+    Sources loading into the same destination share the result_*.txt files
+    read by the transformer, so each refresh writes every source's tables,
+    not only the refreshing source's.
+
+    Args:
+        catalogs: TableCatalogs of every source (a table listed by several is kept once).
+        start_year: Minimum year to include.
+
+    Returns:
+        Unified sorted list of table names.
+    """
+    unified = {}
+    for family in ('5min', '15min', 'mgw'):
+        descriptors = {d.name: d for catalog in catalogs for d in catalog.query(family=family, start_year=start_year)}
+        family_tables = [d.name for d in sorted(descriptors.values(), key=lambda d: (d.sort_key, d.name))]
+        store_txt(family_tables, output_paths[family])
+        logging.info(f"Found {len(family_tables)} {family} tables, saved to {output_paths[family]}")
+        unified.update(descriptors)
+
+    unified_sorted_tables = [d.name for d in sorted(unified.values(), key=lambda d: (d.sort_key, d.name))]
+    logging.info(f"Total tables found: {len(unified_sorted_tables)}")
+    return unified_sorted_tables
 
 def load_last_extracted(filename: str = output_paths['last_extracted']) -> Dict[str, Any]:
     """Load the last extracted data for each table from a JSON file.
@@ -301,6 +334,7 @@ def load_last_extracted(filename: str = output_paths['last_extracted']) -> Dict[
         logging.error(f"Invalid JSON in {filename}: {e}, returning empty dict")
         return {}
 
+@timed('save_checkpoint')
 def save_last_extracted(last_extracted: Dict[str, Any], filename: str = output_paths['last_extracted']):
     """Save the last extracted data for each table to a JSON file.
     
@@ -317,7 +351,40 @@ def save_last_extracted(last_extracted: Dict[str, Any], filename: str = output_p
         logging.error(f"Error saving last extracted to {filename}: {e}")
         raise
 
-def extract_table_data(table: str, cursor, offset: int, batch_size: int = 5000) -> Optional[List[tuple]]:
+@timed('save_checkpoint')
+def update_last_extracted(table: str, entry: Dict[str, Any], filename: str = output_paths['last_extracted']) -> Dict[str, Any]:
+    """Merge one table's checkpoint into the JSON file under an exclusive file lock.
+
+    Safe to call from several processes at once (e.g. parallel Airflow tasks):
+    the file is re-read while the lock is held, so other tables' entries are kept.
+
+    Args:
+        table: Table whose checkpoint changed.
+        entry: Fields to set on that table's checkpoint.
+        filename: Path to the JSON file (default from config).
+
+    Returns:
+        The table's merged checkpoint.
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(f"{filename}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            last_extracted = load_last_extracted(filename)
+            last_extracted.setdefault(table, {}).update(entry)
+            tmp_filename = f"{filename}.tmp"
+            with open(tmp_filename, 'w') as f:
+                json.dump(last_extracted, f, indent=4)
+            os.replace(tmp_filename, filename)
+            return last_extracted[table]
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def is_timeout_error(error: Exception) -> bool:
+    """True for MySQL errors caused by a slow or interrupted query."""
+    return isinstance(error, MySQLdb.OperationalError) and bool(error.args) and error.args[0] in TIMEOUT_ERROR_CODES
+
+def extract_table_data(table: str, cursor, offset: int, batch_size: int = 5000, timeout_ms: int = 0) -> Optional[List[tuple]]:
     """Extract raw data from table in batches based on offset.
     
     Args:
@@ -325,12 +392,18 @@ def extract_table_data(table: str, cursor, offset: int, batch_size: int = 5000)
         cursor: Database cursor to execute queries.
         offset: Starting row offset for the batch.
         batch_size: Number of rows to fetch per batch (default: 5000).
+        timeout_ms: Server-side execution limit for the query (0 for none).
     
     Returns:
         List of tuples (date_heure, indicateur, valeur) or None if no data.
+
+    Raises:
+        MySQLdb.Error: If the query failed; timeouts (see is_timeout_error) let the
+            caller retry with a smaller batch.
     """
+    hint = f"/*+ MAX_EXECUTION_TIME({timeout_ms}) */ " if timeout_ms else ""
     query = f"""
-        SELECT date_heure, ID_indicateur, valeur
+        SELECT {hint}date_heure, ID_indicateur, valeur
         FROM {table}
         ORDER BY date_heure
         LIMIT {batch_size} OFFSET {offset}
@@ -340,58 +413,232 @@ def extract_table_data(table: str, cursor, offset: int, batch_size: int = 5000)
         raw_data = cursor.fetchall()
         logging.info(f"Executed query for {table} at offset {offset}, fetched {len(raw_data)} rows")
     except MySQLdb.Error as e:
-        logging.error(f"SQL error for table {table}: {e}")
-        return None
+        if is_timeout_error(e):
+            logging.warning(f"Query on {table} timed out at offset {offset} with batch size {batch_size}: {e}")
+        else:
+            # Not None: callers treat None as the end of the table
+            logging.error(f"SQL error for table {table}: {e}")
+        raise
     
     if not raw_data:
         logging.info(f"No data fetched for table {table} at offset {offset}")
         return None
     
-    indicator_map = load_indicator_csv(table)
-    if not indicator_map:
+    return map_indicators(table, raw_data)
+
+def map_indicators(table: str, raw_data: List[tuple]) -> Optional[List[tuple]]:
+    """Replace indicator IDs with their names.
+
+    Args:
+        table: Source table, selecting the indicator CSV.
+        raw_data: List of tuples (date_heure, ID_indicateur, valeur).
+
+    Returns:
+        List of tuples (date_heure, indicateur, valeur) or None without a mapping.
+    """
+    result = INDICATORS.map_rows(table, raw_data)
+    if result is None:
         logging.error(f"Cannot proceed without indicator mapping for {table}")
         return None
     
-    result = []
-    for date_heure, id_indicateur, valeur in raw_data:
-        indicateur = indicator_map.get(id_indicateur, "Unknown")
-        result.append((date_heure, indicateur, valeur))
-    
     logging.info(f"Processed {len(result)} rows for {table} with indicator mapping")
     return result
 
-def load_batch_into_database(batch: List[tuple], target_db, target_table: str):
+def create_checkpoint_table(cursor):
+    """Create the destination-side checkpoint table if it doesn't exist."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS etl_checkpoints (
+            table_name VARCHAR(255) NOT NULL PRIMARY KEY,
+            `offset` BIGINT NOT NULL DEFAULT 0,
+            last_date DATETIME NULL,
+            completed BOOLEAN NOT NULL DEFAULT FALSE,
+            binlog_file VARCHAR(255) NULL,
+            binlog_pos BIGINT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+def create_quarantine_table(cursor):
+    """Create the table receiving rows rejected by batch validation."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS etl_quarantine (
+            id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            table_name VARCHAR(255) NOT NULL,
+            Date DATETIME NULL,
+            indicateur VARCHAR(255) NULL,
+            valeur FLOAT NULL,
+            reason VARCHAR(50) NOT NULL,
+            quarantined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_table_date (table_name, Date)
+        )
+    """)
+
+def create_slot_changes_table(cursor):
+    """Create the table listing (table, Date) slots loaded since the transformer last saw them."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS etl_slot_changes (
+            table_name VARCHAR(255) NOT NULL,
+            slot DATETIME NOT NULL,
+            version BIGINT NOT NULL DEFAULT 1,
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, slot)
+        )
+    """)
+
+def record_slot_changes(cursor, table: str, batch: List[tuple]):
+    """Mark the Date slots of a batch as changed (no commit).
+
+    `version` is bumped on every load touching a slot, so a consumer only clears
+    the marker if nothing new arrived while it was recomputing the slot.
+    """
+    slots = sorted({row[0] for row in batch})
+    cursor.executemany("""
+        INSERT INTO etl_slot_changes (table_name, slot) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, [(table, slot) for slot in slots])
+
+def load_checkpoint(target_db, table: str) -> Optional[Dict[str, Any]]:
+    """Read a table's checkpoint from the destination database.
+
+    Returns:
+        Dictionary with offset, last_date, completed and binlog ((file, position)
+        of the last change-data-capture event loaded, or None), or None if never loaded.
+    """
+    cursor = target_db.cursor()
+    try:
+        cursor.execute("SELECT `offset`, last_date, completed, binlog_file, binlog_pos FROM etl_checkpoints WHERE table_name = %s", (table,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return {
+            "offset": row[0],
+            "last_date": str(row[1]) if row[1] else None,
+            "completed": bool(row[2]),
+            "binlog": (row[3], row[4]) if row[3] else None
+        }
+    finally:
+        cursor.close()
+
+def load_completed_checkpoints(target_db) -> set:
+    """Return the checkpoint names marked completed in the destination."""
+    cursor = target_db.cursor()
+    try:
+        cursor.execute("SELECT table_name FROM etl_checkpoints WHERE completed")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def load_incomplete_checkpoints(target_db) -> set:
+    """Return the checkpoint names not marked completed in the destination."""
+    cursor = target_db.cursor()
+    try:
+        cursor.execute("SELECT table_name FROM etl_checkpoints WHERE NOT completed")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def load_binlog_positions(target_db) -> Dict[str, tuple]:
+    """Return the (file, position) of the last binlog event loaded for every table."""
+    cursor = target_db.cursor()
+    try:
+        cursor.execute("SELECT table_name, binlog_file, binlog_pos FROM etl_checkpoints WHERE binlog_file IS NOT NULL")
+        return {table: (binlog_file, binlog_pos) for table, binlog_file, binlog_pos in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def save_checkpoint(cursor, table: str, offset: int, last_date: Any = None, completed: bool = False,
+                    binlog: Optional[tuple] = None):
+    """Upsert a table's checkpoint (no commit, so it joins the caller's transaction)."""
+    binlog_file, binlog_pos = binlog or (None, None)
+    cursor.execute("""
+        INSERT INTO etl_checkpoints (table_name, `offset`, last_date, completed, binlog_file, binlog_pos)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE `offset` = VALUES(`offset`), last_date = COALESCE(VALUES(last_date), last_date),
+            completed = VALUES(completed), binlog_file = COALESCE(VALUES(binlog_file), binlog_file),
+            binlog_pos = COALESCE(VALUES(binlog_pos), binlog_pos)
+    """, (table, offset, last_date, completed, binlog_file, binlog_pos))
+
+def load_batch_into_database(batch: List[tuple], target_db, target_table: str, offset: Optional[int] = None,
+                             binlog: Optional[tuple] = None, checkpoint_key: Optional[str] = None,
+                             expected_offset: Optional[int] = None, quarantine: Optional[List[tuple]] = None):
     """Load a batch of data into the target database.
-    
+
+    When `offset` is given, the table's checkpoint in etl_checkpoints is
+    advanced in the same transaction as the rows, so a crash can never leave
+    rows loaded without their checkpoint (or the reverse), and a resumed run
+    does not insert the batch twice.
+
     Args:
         batch: List of tuples (date_heure, indicateur, valeur) to load.
         target_db: Target database connection.
         target_table: Name of the table to load into.
+        offset: Source offset reached after this batch.
+        binlog: (file, position) of the last binlog event in the batch, for CDC loads.
+        checkpoint_key: Checkpoint name when it differs from the table (e.g. 'source/table').
+        expected_offset: Checkpoint offset the batch was extracted from; if the stored
+            offset differs, nothing is loaded and CheckpointConflict is raised.
+        quarantine: Rows rejected by validation, as (date_heure, indicateur, valeur, reason),
+            stored in etl_quarantine in the same transaction.
+
+    With LOAD_UNIQUE_KEY, "Unknown" rows are quarantined whatever the validation
+    policy: they all share one indicateur, so the upsert would keep one per slot.
     """
     cursor = target_db.cursor()
     try:
         cursor.execute(f"SHOW TABLES LIKE '{target_table}'")
         if not cursor.fetchone():
+            if LOAD_UNIQUE_KEY:
+                index_clause = ",\n                    UNIQUE KEY uq_date_indicateur (Date, indicateur)"
+            elif CREATE_DATE_INDEX:
+                index_clause = ",\n                    INDEX idx_date_indicateur (Date, indicateur)"
+            else:
+                index_clause = ""
+            # `id` gives readers a stable insertion order (the streaming transformer pages on it)
             create_query = f"""
-                CREATE TABLE {target_table} (
+                CREATE TABLE IF NOT EXISTS {target_table} (
+                    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
                     Date DATETIME,
                     indicateur VARCHAR(255),
-                    valeur FLOAT
+                    valeur FLOAT{index_clause}
                 )
             """
             cursor.execute(create_query)
             target_db.commit()
             logging.info(f"Created table {target_table}")
 
-        columns = ['Date', 'indicateur', 'valeur']
-        placeholders = ', '.join(['%s'] * len(batch[0]))
-        insert_query = f"INSERT INTO {target_table} ({', '.join(columns)}) VALUES ({placeholders})"
-        cursor.executemany(insert_query, batch)
+        if expected_offset is not None:
+            cursor.execute("SELECT `offset` FROM etl_checkpoints WHERE table_name = %s FOR UPDATE", (checkpoint_key or target_table,))
+            row = cursor.fetchone()
+            stored = row[0] if row else 0
+            if stored != expected_offset:
+                target_db.rollback()
+                raise CheckpointConflict(f"Checkpoint of {target_table} is at {stored}, batch was extracted from {expected_offset}")
+
+        if LOAD_UNIQUE_KEY and any(row[1] == 'Unknown' for row in batch):
+            quarantine = list(quarantine or []) + [row + ('unknown',) for row in batch if row[1] == 'Unknown']
+            batch = [row for row in batch if row[1] != 'Unknown']
+
+        if batch:
+            columns = ['Date', 'indicateur', 'valeur']
+            placeholders = ', '.join(['%s'] * len(columns))
+            insert_query = f"INSERT INTO {target_table} ({', '.join(columns)}) VALUES ({placeholders})"
+            if LOAD_UNIQUE_KEY:
+                insert_query += " ON DUPLICATE KEY UPDATE valeur = VALUES(valeur)"
+            cursor.executemany(insert_query, batch)
+            if TRACK_SLOT_CHANGES:
+                record_slot_changes(cursor, target_table, batch)
+        if quarantine:
+            cursor.executemany(
+                "INSERT INTO etl_quarantine (table_name, Date, indicateur, valeur, reason) VALUES (%s, %s, %s, %s, %s)",
+                [(target_table,) + row for row in quarantine]
+            )
+        if offset is not None:
+            save_checkpoint(cursor, checkpoint_key or target_table, offset, (batch or quarantine)[-1][0], binlog=binlog)
         target_db.commit()
-        logging.info(f"Successfully loaded {len(batch)} rows into {target_table}")
+        logging.info(f"Successfully loaded {len(batch)} rows into {target_table}" + (f" ({len(quarantine)} quarantined)" if quarantine else ""))
     except MySQLdb.Error as e:
         logging.error(f"Error loading batch into {target_table}: {e}")
         target_db.rollback()
         raise
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
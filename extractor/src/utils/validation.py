@@ -0,0 +1,158 @@
+import os
+import json
+import logging
+import threading
+from itertools import compress
+from operator import itemgetter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from catalog import parse_table_name
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+ROW_CHECKS = ('null', 'negative', 'unknown', 'out_of_range')
+
+
+class ValidationResult(NamedTuple):
+    rows: List[tuple]  # rows to load
+    quarantined: List[tuple]  # (date_heure, indicateur, valeur, reason)
+    issues: Dict[str, int]
+
+
+def load_ranges(path: str) -> Dict[str, Tuple[float, float]]:
+    """Read {counter prefix: [min, max]} value ranges; a missing file means no range checks."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {prefix: (float(low), float(high)) for prefix, (low, high) in json.load(f).items()}
+
+
+class BatchValidator:
+    """Column-wise data-quality checks on extracted (date_heure, indicateur, valeur) batches.
+
+    A batch is converted to numpy columns once and every check is a mask over
+    them: null and negative values, "Unknown" indicators, values outside the
+    configured per-counter ranges, timestamps going backwards and missing
+    slots (also across batches of the same table). The slot interval is the
+    granularity in the table's name (5 or 15 minutes), or mgw_slot_seconds
+    for tables without one. Rows failing a
+    row check are quarantined or kept depending on the policy; timestamp
+    problems are only reported.
+    """
+
+    def __init__(self, policy: str = 'quarantine', max_bad_ratio: float = 0.2, max_unknown_rate: float = 0.01,
+                 mgw_slot_seconds: int = 900, ranges: Optional[Dict[str, Tuple[float, float]]] = None):
+        if policy not in ('report', 'quarantine', 'reject'):
+            raise ValueError(f"Unknown validation policy: {policy}")
+        self.policy = policy
+        self.max_bad_ratio = max_bad_ratio
+        self.max_unknown_rate = max_unknown_rate
+        self.mgw_slot_seconds = mgw_slot_seconds
+        self.ranges = ranges or {}
+        self.last_ts: Dict[str, int] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> 'BatchValidator':
+        return cls(settings['policy'], settings['max_bad_ratio'], settings['max_unknown_rate'],
+                   settings['mgw_slot_seconds'], load_ranges(settings['ranges_path']))
+
+    def slot_seconds(self, table: str) -> int:
+        """Expected interval between a table's slots, from the granularity in its name."""
+        descriptor = parse_table_name(table)
+        if descriptor is None or descriptor.granularity is None:
+            return self.mgw_slot_seconds
+        return descriptor.granularity * 60
+
+    def check(self, table: str, data: List[tuple]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Run every check. Returns the per-row masks and the batch's issue counts."""
+        import numpy as np  # deferred: only loaded once validation actually runs
+
+        count = len(data)
+        dates = list(map(itemgetter(0), data))
+        names = np.fromiter(map(itemgetter(1), data), dtype=object, count=count)
+        vals = np.fromiter((np.nan if v is None else v for v in map(itemgetter(2), data)), dtype=float, count=count)
+
+        # Batches hold few distinct timestamps: convert those, and index rows into them
+        distinct = sorted(dict.fromkeys(dates))
+        position = {date: i for i, date in enumerate(distinct)}
+        codes = np.fromiter(map(position.__getitem__, dates), dtype=np.int64, count=count)
+        slots = np.array(distinct, dtype='datetime64[s]').astype(np.int64)
+
+        masks = {
+            'null': np.isnan(vals),
+            'negative': vals < 0,
+            'unknown': names == 'Unknown',
+            'out_of_range': np.zeros(count, dtype=bool)
+        }
+        if self.ranges:
+            prefixes = np.fromiter((name.partition('.')[0] for name in names), dtype=object, count=count)
+            for prefix, (low, high) in self.ranges.items():
+                masks['out_of_range'] |= (prefixes == prefix) & ((vals < low) | (vals > high))
+
+        first, newest = int(slots[codes[0]]), int(slots[-1])
+        with self.lock:
+            previous = self.last_ts.get(table)
+            self.last_ts[table] = newest if previous is None else max(previous, newest)
+        non_monotonic = int((np.diff(codes) < 0).sum()) + int(previous is not None and first < previous)
+        if previous is not None:
+            slots = np.concatenate(([previous], slots[slots > previous]))
+        slot_seconds = self.slot_seconds(table)
+        gaps = np.diff(slots)
+        gaps = gaps[gaps > slot_seconds]
+
+        issues = {name: int(mask.sum()) for name, mask in masks.items()}
+        issues['non_monotonic'] = non_monotonic
+        issues['gaps'] = len(gaps)
+        issues['missing_slots'] = int((gaps // slot_seconds - 1).sum())
+        return masks, issues
+
+    def validate(self, table: str, data: List[tuple]) -> ValidationResult:
+        """Check a batch and split it into rows to load and rows to quarantine."""
+        masks, issues = self.check(table, data)
+        bad = masks['null'] | masks['negative'] | masks['unknown'] | masks['out_of_range']
+        bad_count = int(bad.sum())
+        unknown_rate = issues['unknown'] / len(data)
+
+        if bad_count or issues['non_monotonic'] or issues['gaps']:
+            logging.warning(
+                f"Validation of {len(data)} rows from {table}: " + ', '.join(f"{name}={count}" for name, count in issues.items() if count)
+            )
+        if unknown_rate > self.max_unknown_rate:
+            logging.warning(f"Unknown-indicator rate of {table} is {unknown_rate:.2%} (limit {self.max_unknown_rate:.2%}); is its indicator dictionary current?")
+
+        rows, quarantined = data, []
+        rejected = self.policy == 'reject' and bad_count > self.max_bad_ratio * len(data)
+        if rejected:
+            logging.error(f"Rejecting batch of {len(data)} rows from {table}: {bad_count} bad rows")
+            rows, quarantined = [], [row + ('batch_rejected',) for row in data]
+        elif bad_count and self.policy != 'report':
+            rows = list(compress(data, ~bad))
+            quarantined = [data[i] + (self.reason(masks, i),) for i in bad.nonzero()[0]]
+
+        with self.lock:
+            stats = self.stats.setdefault(table, dict.fromkeys(('batches', 'rows', 'quarantined', 'rejected_batches') + tuple(issues), 0))
+            stats['batches'] += 1
+            stats['rows'] += len(data)
+            stats['quarantined'] += len(quarantined)
+            stats['rejected_batches'] += int(rejected)
+            for name, count in issues.items():
+                stats[name] += count
+        return ValidationResult(rows, quarantined, issues)
+
+    @staticmethod
+    def reason(masks: Dict[str, Any], i: int) -> str:
+        return next(name for name in ROW_CHECKS if masks[name][i])
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            return {table: dict(stats) for table, stats in self.stats.items()}
+
+    def log_metrics(self):
+        totals: Dict[str, int] = {}
+        for stats in self.metrics().values():
+            for name, count in stats.items():
+                totals[name] = totals.get(name, 0) + count
+        if totals:
+            logging.info("Validation: " + ', '.join(f"{name}={count}" for name, count in totals.items()))
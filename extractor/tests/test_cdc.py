@@ -0,0 +1,147 @@
+"""Replays the recorded binlog fixture through CdcReader.run against an in-memory loader.
+
+The fixture (fixtures/binlog_inserts.jsonl, written by cdc.record_fixture) holds
+three 5-minute slots of inserts into CALIS_APG43_5_S10_A2024 and
+MEIND_APG43_5_S10_A2024, interleaved with inserts into an untracked table, a
+table older than start_year, and heartbeats.
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "utils"))
+
+import cdc  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "binlog_inserts.jsonl")
+CALIS = 'CALIS_APG43_5_S10_A2024'
+MEIND = 'MEIND_APG43_5_S10_A2024'
+INDICATORS = {101: 'ChasNCHAFRMSUCC', 102: 'ChasNCHAFRMTOT', 103: 'SecNAUTFTCSUCC'}
+
+
+class FakeCursor:
+    def __init__(self, checkpoints):
+        self.checkpoints = checkpoints
+        self.rows = []
+
+    def execute(self, query, params=()):
+        if query.lstrip().startswith("SELECT table_name, binlog_file"):
+            self.rows = [(table, cp['binlog'][0], cp['binlog'][1]) for table, cp in self.checkpoints.items() if cp.get('binlog')]
+        elif "INSERT INTO etl_checkpoints" in query:
+            table, offset, _, _, binlog_file, binlog_pos = params
+            self.checkpoints.setdefault(table, {'offset': offset})['binlog'] = (binlog_file, binlog_pos)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeDb:
+    def __init__(self, checkpoints):
+        self.checkpoints = checkpoints
+
+    def cursor(self):
+        return FakeCursor(self.checkpoints)
+
+    def commit(self):
+        pass
+
+
+class FakeLoader:
+    """Loader keeping rows and checkpoints in memory; `checkpoints` survives a simulated restart."""
+
+    def __init__(self, checkpoints=None):
+        self.checkpoints = {} if checkpoints is None else checkpoints
+        self.db = FakeDb(self.checkpoints)
+        self.cursor = self.db.cursor()
+        self.batches = []
+
+    def load_batch_into_database(self, table, data, offset=None, binlog=None, expected_offset=None, quarantine=None):
+        self.batches.append((table, list(data), offset, binlog))
+        self.checkpoints[table] = {'offset': offset, 'binlog': binlog}
+
+    def get_checkpoint(self, table):
+        return self.checkpoints.get(table)
+
+    def rows(self, table):
+        return [row for name, data, _, _ in self.batches if name == table for row in data]
+
+
+def map_rows(table, raw_data, unmapped=()):
+    if table in unmapped:
+        return None
+    return [(date, INDICATORS[indicator_id], value) for date, indicator_id, value in raw_data]
+
+
+class CdcFixtureTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(cdc, 'map_indicators', side_effect=map_rows),
+            mock.patch.object(cdc, 'update_last_extracted'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def replay(self, loader, flush_rows=5000):
+        reader = cdc.CdcReader(loader, flush_rows=flush_rows, flush_seconds=3600)
+        reader.run(cdc.read_fixture(FIXTURE))
+        return reader
+
+    def test_loads_tracked_tables_and_saves_the_stream_position(self):
+        loader = FakeLoader()
+        reader = self.replay(loader)
+
+        self.assertEqual(len(loader.rows(CALIS)), 9)
+        self.assertEqual(len(loader.rows(MEIND)), 6)
+        self.assertEqual({table for table, _, _, _ in loader.batches}, {CALIS, MEIND})
+        self.assertEqual(loader.rows(CALIS)[0], ('2024-03-04 10:00:00', 'ChasNCHAFRMSUCC', 120.0))
+        self.assertEqual(loader.checkpoints[CALIS]['offset'], 9)
+        last = list(cdc.read_fixture(FIXTURE))[-1]
+        self.assertEqual(loader.checkpoints[cdc.STREAM_CHECKPOINT]['binlog'], last.position)
+        self.assertEqual(reader.stats['events'], 12)  # heartbeats are not counted
+
+    def test_small_batches_keep_offsets_contiguous(self):
+        loader = FakeLoader()
+        self.replay(loader, flush_rows=2)
+
+        offsets = [offset for table, _, offset, _ in loader.batches if table == CALIS]
+        sizes = [len(data) for table, data, _, _ in loader.batches if table == CALIS]
+        self.assertEqual(offsets, [sum(sizes[:i + 1]) for i in range(len(sizes))])
+        self.assertEqual(len(loader.rows(CALIS)), 9)
+
+    def test_restart_skips_events_already_loaded(self):
+        first = FakeLoader()
+        self.replay(first)
+
+        second = FakeLoader(first.checkpoints)
+        reader = self.replay(second)
+        self.assertEqual(second.batches, [])
+        self.assertEqual(reader.stats['skipped'], 6)
+
+    def test_unmapped_rows_hold_the_stream_position_until_loaded(self):
+        loader = FakeLoader()
+        with mock.patch.object(cdc, 'map_indicators', side_effect=lambda table, raw: map_rows(table, raw, {MEIND})):
+            reader = self.replay(loader)
+
+        self.assertEqual(loader.rows(MEIND), [])
+        self.assertEqual(len(reader.pending[MEIND]['rows']), 6)
+        first_meind = next(event for event in cdc.read_fixture(FIXTURE) if event.table == MEIND)
+        events = list(cdc.read_fixture(FIXTURE))
+        before_meind = events[events.index(first_meind) - 1].position
+        self.assertEqual(loader.checkpoints[cdc.STREAM_CHECKPOINT]['binlog'], before_meind)
+
+        # Restart once the mapping exists: MEIND is loaded, CALIS is not loaded twice
+        restarted = FakeLoader(loader.checkpoints)
+        self.replay(restarted)
+        self.assertEqual(len(restarted.rows(MEIND)), 6)
+        self.assertEqual(restarted.rows(CALIS), [])
+        self.assertEqual(restarted.checkpoints[cdc.STREAM_CHECKPOINT]['binlog'], events[-1].position)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class QueryCache:
+    """LRU cache of query results with a TTL.
+
+    Each entry remembers the watermark versions of the nodes it covers; a
+    lookup with different versions is a miss, so results are invalidated as
+    soon as the transformer commits new data for one of those nodes, and only
+    for those nodes.
+    """
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Hashable, Tuple[float, tuple, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, versions: tuple) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, cached_versions, value = entry
+                if cached_versions == versions and expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, versions: tuple, value: Any):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, versions, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
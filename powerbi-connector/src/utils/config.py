@@ -0,0 +1,42 @@
+from dotenv import load_dotenv
+from typing import Dict, Any
+import os
+
+# Database connection parameters
+load_dotenv()
+
+# KPI database (the transformer's destination) connection parameters
+DEST_DB_HOST = os.getenv("DEST_MYSQL_HOST")
+DEST_DB_USER = os.getenv("DEST_MYSQL_USER")
+DEST_DB_PASSWORD = os.getenv("DEST_MYSQL_PASSWORD")
+DEST_DB_NAME = "5min_kpi"
+DEST_DB_PORT = int(os.getenv("DEST_MYSQL_PORT", default=3306))
+
+# KPI database config
+DEST_DB_CONFIG = {
+    'host': DEST_DB_HOST,
+    'user': DEST_DB_USER,
+    'password': DEST_DB_PASSWORD,
+    'port': DEST_DB_PORT,
+    'database': DEST_DB_NAME
+}
+
+# Storage layout written by the transformer: 'wide' (*_details tables) or 'long' (kpi_fact)
+STORAGE_LAYOUT = os.getenv("TRANSFORMER_STORAGE_LAYOUT", default="wide")
+
+# KPI read API settings
+api_settings: Dict[str, Any] = {
+    'host': os.getenv("KPI_API_HOST", default="0.0.0.0"),
+    'port': int(os.getenv("KPI_API_PORT", default=8080)),
+    'connections': int(os.getenv("KPI_API_CONNECTIONS", default=4)),  # MySQL connections shared by request threads
+    'cache_size': int(os.getenv("KPI_API_CACHE_SIZE", default=2048)),  # cached query results
+    'cache_ttl_seconds': float(os.getenv("KPI_API_CACHE_TTL", default=300)),
+    'watermark_poll_seconds': float(os.getenv("KPI_API_WATERMARK_POLL", default=1.0)),
+    'max_points': int(os.getenv("KPI_API_MAX_POINTS", default=50000))  # rows returned by one series query
+}
+
+# Time-series granularities and the tables serving them
+ROLLUP_TABLES = {
+    'hour': 'kpi_rollup_hourly',
+    'day': 'kpi_rollup_daily'
+}
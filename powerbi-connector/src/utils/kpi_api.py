@@ -0,0 +1,325 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from config import DEST_DB_CONFIG, STORAGE_LAYOUT, ROLLUP_TABLES, api_settings
+from tools import ConnectionPool
+from cache import QueryCache
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class KpiStore:
+    """Read-side queries over the transformer's KPI tables, for either storage layout.
+
+    The schema (detail tables and their columns, or the kpi/node codes of the
+    long layout) is discovered once at startup, so request queries go straight
+    to the indexed table of the requested KPI.
+    """
+
+    def __init__(self, pool: ConnectionPool, layout: str = STORAGE_LAYOUT, max_points: int = 50000):
+        self.pool = pool
+        self.layout = layout
+        self.max_points = max_points
+        self.suffixes: Dict[int, Tuple[str, Optional[str]]] = {}
+        if layout == 'long':
+            self.kpi_codes = {kpi: code for code, kpi in pool.query("SELECT code, kpi FROM kpi_dim")}
+            self.node_codes = {node: code for code, node in pool.query("SELECT code, node FROM node_dim")}
+            self.kpi_names = {code: kpi for kpi, code in self.kpi_codes.items()}
+        else:
+            self.detail_tables = self.discover_detail_tables()
+
+    def discover_detail_tables(self) -> Dict[str, Dict[str, Any]]:
+        """Map each *_details table to its columns (KPI-specific or family table)."""
+        rows = self.pool.query("""
+            SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s
+        """, ('%\\_details',))
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table, column in rows:
+            tables.setdefault(table, {'columns': set()})['columns'].add(column)
+        for info in tables.values():
+            info['family'] = 'kpi' in info['columns']
+        self.kpi_tables: Dict[str, str] = {}
+        self.kpi_misses: set = set()  # KPIs found in no family table since the last new data
+        logging.info(f"Discovered {len(tables)} KPI detail tables")
+        return tables
+
+    def detail_table(self, kpi: str) -> Optional[str]:
+        """Detail table of a KPI: its own table, or the family table holding its rows.
+
+        Found tables are memoized. A KPI without rows is remembered as missing
+        until the transformer writes new data (see new_data), so unknown KPIs do
+        not scan the family tables on every request, and a KPI written later
+        is still served.
+        """
+        if kpi not in self.kpi_tables:
+            table = f"{kpi.lower()}_details"
+            if table not in self.detail_tables:
+                if kpi in self.kpi_misses:
+                    return None
+                families = [t for t, info in self.detail_tables.items() if info['family']]
+                table = next((t for t in families if self.pool.query(f"SELECT 1 FROM {t} WHERE kpi = %s LIMIT 1", (kpi,))), None)
+                if table is None:
+                    self.kpi_misses.add(kpi)
+                    return None
+            self.kpi_tables[kpi] = table
+        return self.kpi_tables[kpi]
+
+    def new_data(self):
+        """Called when a watermark moved: KPIs missing so far may have rows now."""
+        if self.layout != 'long':
+            self.kpi_misses = set()
+
+    def has_kpi(self, kpi: str) -> bool:
+        if self.layout == 'long':
+            return kpi in self.kpi_codes
+        return self.detail_table(kpi) is not None
+
+    def suffix(self, suffix_id: Optional[int]) -> Tuple[str, Optional[str]]:
+        """(suffix, operator) of a suffix_dim ID, loading unseen IDs on demand."""
+        if not suffix_id:
+            return '', None
+        if suffix_id not in self.suffixes:
+            for sid, suffix, operator in self.pool.query("SELECT id, suffix, operator FROM suffix_dim WHERE id >= %s", (suffix_id,)):
+                self.suffixes[sid] = (suffix, operator)
+        return self.suffixes.get(suffix_id, ('', None))
+
+    def detail_select(self, table: str) -> str:
+        """Columns and joins giving (Date, kpi, suffix, operator, value) rows of a detail table."""
+        columns = self.detail_tables[table]['columns']
+        kpi = "d.kpi" if self.detail_tables[table]['family'] else f"'{table[:-len('_details')]}'"
+        if 'suffix_id' in columns:
+            return (f"SELECT s.Date, {kpi}, COALESCE(sd.suffix, ''), sd.operator, d.value FROM kpi_summary s "
+                    f"JOIN {table} d ON d.kpi_id = s.Id LEFT JOIN suffix_dim sd ON sd.id = d.suffix_id")
+        suffix = "d.suffix" if 'suffix' in columns else "''"
+        operator = "d.operator" if 'operator' in columns else "NULL"
+        return f"SELECT s.Date, {kpi}, {suffix}, {operator}, d.value FROM kpi_summary s JOIN {table} d ON d.kpi_id = s.Id"
+
+    def series(self, node: str, kpi: str, start: str, end: str, granularity: str = '5min') -> List[Dict[str, Any]]:
+        """Values of one KPI for one node in [start, end], one item per (timestamp, suffix)."""
+        if granularity in ROLLUP_TABLES:
+            rows = self.pool.query(f"""
+                SELECT period_start, kpi, suffix, operator, value FROM {ROLLUP_TABLES[granularity]}
+                WHERE node = %s AND kpi = %s AND period_start BETWEEN %s AND %s
+                ORDER BY period_start LIMIT %s
+            """, (node, kpi, start, end, self.max_points))
+        elif self.layout == 'long':
+            if node not in self.node_codes:
+                return []
+            rows = [
+                (ts, kpi, *self.suffix(suffix_id), value)
+                for ts, suffix_id, value in self.pool.query("""
+                    SELECT ts, suffix_id, value FROM kpi_fact
+                    WHERE node = %s AND kpi_code = %s AND ts BETWEEN %s AND %s
+                    ORDER BY ts LIMIT %s
+                """, (self.node_codes[node], self.kpi_codes[kpi], start, end, self.max_points))
+            ]
+        else:
+            table = self.detail_table(kpi)
+            kpi_filter = " AND d.kpi = %s" if self.detail_tables[table]['family'] else ""
+            rows = self.pool.query(
+                f"{self.detail_select(table)} WHERE s.Node = %s AND s.Date BETWEEN %s AND %s{kpi_filter} ORDER BY s.Date LIMIT %s",
+                (node, start, end) + ((kpi,) if kpi_filter else ()) + (self.max_points,)
+            )
+            # KPI-specific tables only know the lowercased name
+            rows = [(row[0], kpi) + tuple(row[2:]) for row in rows]
+        return [as_point(row) for row in rows]
+
+    def slot_values(self, node: str, date: str) -> List[Dict[str, Any]]:
+        """Every KPI value of one node at one timestamp."""
+        if self.layout == 'long':
+            if node not in self.node_codes:
+                return []
+            rows = [
+                (ts, self.kpi_names.get(kpi_code), *self.suffix(suffix_id), value)
+                for ts, kpi_code, suffix_id, value in self.pool.query(
+                    "SELECT ts, kpi_code, suffix_id, value FROM kpi_fact WHERE node = %s AND ts = %s",
+                    (self.node_codes[node], date)
+                )
+            ]
+        else:
+            rows = []
+            for table in self.detail_tables:
+                rows.extend(self.pool.query(f"{self.detail_select(table)} WHERE s.Node = %s AND s.Date = %s", (node, date)))
+        return [as_point(row) for row in rows]
+
+
+def as_point(row: tuple) -> Dict[str, Any]:
+    ts, kpi, suffix, operator, value = row
+    return {'ts': str(ts), 'kpi': kpi, 'suffix': suffix or '', 'operator': operator, 'value': value}
+
+
+class Watermarks:
+    """Polls kpi_watermarks and keeps the in-memory latest-value table current.
+
+    The transformer bumps a node's version in the same commit as its KPI rows,
+    so a version change is the signal to drop cached results of that node and
+    reload its latest slot.
+    """
+
+    def __init__(self, pool: ConnectionPool, store: KpiStore, poll_seconds: float = 1.0):
+        self.pool = pool
+        self.store = store
+        self.poll_seconds = poll_seconds
+        self.versions: Dict[str, int] = {}
+        self.last_dates: Dict[str, str] = {}
+        self.latest: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+
+    def version(self, node: str) -> int:
+        return self.versions.get(node, 0)
+
+    def poll(self):
+        moved = False
+        for node, last_date, version in self.pool.query("SELECT node, last_date, version FROM kpi_watermarks"):
+            if self.versions.get(node) == version:
+                continue
+            moved = True
+            last_date = str(last_date)
+            # Rebuild the node's latest values before publishing the new version
+            self.latest[node] = {(p['kpi'], p['suffix']): p for p in self.store.slot_values(node, last_date)}
+            self.last_dates[node] = last_date
+            self.versions[node] = version
+            logging.info(f"Watermark of {node} moved to {last_date} (version {version})")
+        if moved:
+            self.store.new_data()
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Error polling KPI watermarks: {e}")
+            time.sleep(self.poll_seconds)
+
+    def start(self):
+        self.poll()
+        threading.Thread(target=self.run, name="watermarks", daemon=True).start()
+
+    def latest_values(self, node: str, kpi: Optional[str] = None, operator: Optional[str] = None) -> List[Dict[str, Any]]:
+        values = self.latest.get(node, {}).values()
+        kpi = kpi.lower() if kpi else None
+        return [p for p in values if (kpi is None or p['kpi'].lower() == kpi) and (operator is None or p['operator'] == operator)]
+
+
+class KpiApi:
+    """Request handling shared by the HTTP handler threads, with per-route latency samples."""
+
+    def __init__(self, store: KpiStore, watermarks: Watermarks, cache: QueryCache):
+        self.store = store
+        self.watermarks = watermarks
+        self.cache = cache
+        self.latencies: Dict[str, deque] = {}
+
+    def series(self, params: Dict[str, str]) -> Tuple[int, Any]:
+        node, kpi = params.get('node'), params.get('kpi')
+        if not node or not kpi:
+            return 400, {'error': 'node and kpi are required'}
+        granularity = params.get('granularity', '5min')
+        if granularity != '5min' and granularity not in ROLLUP_TABLES:
+            return 400, {'error': f"granularity must be 5min or one of {sorted(ROLLUP_TABLES)}"}
+        if not self.store.has_kpi(kpi):
+            return 404, {'error': f"unknown KPI {kpi}"}
+        try:
+            start = parse_time(params.get('start'), '1970-01-01 00:00:00')
+            end = parse_time(params.get('end'), '9999-12-31 23:59:59')
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        key = ('series', node, kpi, start, end, granularity)
+        versions = (self.watermarks.version(node),)
+        points = self.cache.get(key, versions)
+        if points is None:
+            points = self.store.series(node, kpi, start, end, granularity)
+            self.cache.put(key, versions, points)
+        operator, suffix = params.get('operator'), params.get('suffix')
+        if operator is not None or suffix is not None:
+            points = [p for p in points if (operator is None or p['operator'] == operator) and (suffix is None or p['suffix'] == suffix)]
+        return 200, {'node': node, 'kpi': kpi, 'granularity': granularity, 'points': points}
+
+    def latest(self, params: Dict[str, str]) -> Tuple[int, Any]:
+        node = params.get('node')
+        if not node:
+            return 400, {'error': 'node is required'}
+        return 200, {
+            'node': node,
+            'ts': self.watermarks.last_dates.get(node),
+            'values': self.watermarks.latest_values(node, params.get('kpi'), params.get('operator'))
+        }
+
+    def health(self, params: Dict[str, str]) -> Tuple[int, Any]:
+        return 200, {
+            'watermarks': {node: {'last_date': self.watermarks.last_dates[node], 'version': version}
+                           for node, version in self.watermarks.versions.items()},
+            'cache': self.cache.stats(),
+            'latency_ms': {route: percentiles(samples) for route, samples in self.latencies.items()}
+        }
+
+    def handle(self, route: str, params: Dict[str, str]) -> Tuple[int, Any]:
+        handler = {'/kpi': self.series, '/latest': self.latest, '/health': self.health}.get(route)
+        if handler is None:
+            return 404, {'error': f"unknown route {route}"}
+        start = time.perf_counter()
+        try:
+            return handler(params)
+        finally:
+            self.latencies.setdefault(route, deque(maxlen=10000)).append((time.perf_counter() - start) * 1000)
+
+
+def parse_time(value: Optional[str], default: str) -> str:
+    """Normalize a 'YYYY-MM-DD[ HH:MM[:SS]]' (or ISO 'T') timestamp."""
+    if not value:
+        return default
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"invalid timestamp {value!r}")
+
+
+def percentiles(samples) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {'count': len(ordered), 'p50': pick(0.50), 'p99': pick(0.99), 'max': round(ordered[-1], 3)}
+
+
+class KpiRequestHandler(BaseHTTPRequestHandler):
+    api: KpiApi = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            status, body = self.api.handle(url.path, params)
+        except Exception as e:
+            logging.error(f"Error serving {self.path}: {e}")
+            status, body = 500, {'error': 'internal error'}
+        payload = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(settings: Dict[str, Any] = api_settings):
+    pool = ConnectionPool(DEST_DB_CONFIG, settings['connections'])
+    store = KpiStore(pool, STORAGE_LAYOUT, settings['max_points'])
+    watermarks = Watermarks(pool, store, settings['watermark_poll_seconds'])
+    watermarks.start()
+    KpiRequestHandler.api = KpiApi(store, watermarks, QueryCache(settings['cache_size'], settings['cache_ttl_seconds']))
+    server = ThreadingHTTPServer((settings['host'], settings['port']), KpiRequestHandler)
+    logging.info(f"KPI API listening on {settings['host']}:{settings['port']} ({STORAGE_LAYOUT} layout)")
+    server.serve_forever()
@@ -0,0 +1,69 @@
+import MySQLdb
+import queue
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def connect_database(config: Dict[str, Any]):
+    """Connect to the database using mysqlclient with retries."""
+    try:
+        conn = MySQLdb.connect(
+            host=config['host'],
+            user=config['user'],
+            passwd=config['password'],
+            port=config['port'],
+            db=config['database'],
+            autocommit=True
+        )
+        logging.info(f"Successfully connected to database: {config['database']} on {config['host']}")
+        return conn
+    except MySQLdb.Error as e:
+        logging.error(f"Database connection error: {e}")
+        raise
+
+
+class ConnectionPool:
+    """Fixed set of autocommit connections handed out to request threads.
+
+    A connection that fails mid-query is closed and its slot left empty; the
+    next request taking the slot opens a replacement.
+    """
+
+    def __init__(self, config: Dict[str, Any], size: int):
+        self.config = config
+        self.idle: "queue.Queue" = queue.Queue()
+        for _ in range(size):
+            self.idle.put(connect_database(config))
+
+    @contextmanager
+    def connection(self):
+        conn = self.idle.get()
+        try:
+            if conn is None:
+                conn = connect_database(self.config)
+            yield conn
+        except MySQLdb.OperationalError:
+            # Drop a connection that failed mid-query; the caller sees the error
+            if conn is not None:
+                try:
+                    conn.close()
+                except MySQLdb.Error:
+                    pass
+            conn = None
+            raise
+        finally:
+            self.idle.put(conn)
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                return list(cursor.fetchall())
+            finally:
+                cursor.close()
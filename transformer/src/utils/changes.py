@@ -0,0 +1,147 @@
+import logging
+from typing import Dict, List, Any, Iterable, Optional
+from config import ENABLE_ROLLUPS
+from tools import counter_values, ensure_summary_index, bump_watermarks
+from rollup import KpiRollup, ROLLUP_TABLES, rebuild_daily
+from profiling import timed
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class SlotChanges:
+    """Reads and clears the extractor's etl_slot_changes markers in the source database."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+
+    def pending(self, tables: List[str]) -> Dict[str, Dict[str, int]]:
+        """Changed slots of `tables`, as {table: {date: version}}."""
+        changes: Dict[str, Dict[str, int]] = {}
+        for i in range(0, len(tables), 500):
+            chunk = tables[i:i + 500]
+            self.cursor.execute(
+                f"SELECT table_name, slot, version FROM etl_slot_changes WHERE table_name IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+            for table, slot, version in self.cursor.fetchall():
+                changes.setdefault(table, {})[str(slot)] = version
+        self.conn.commit()
+        return changes
+
+    def mark(self, table: str, slots: Iterable[str]):
+        """Mark slots as changed, like the extractor does for the slots it loads."""
+        self.cursor.executemany("""
+            INSERT INTO etl_slot_changes (table_name, slot) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE version = version + 1
+        """, [(table, slot) for slot in sorted(set(slots))])
+        self.conn.commit()
+
+    def clear(self, table: str, slots: Dict[str, int]):
+        """Remove markers whose version did not move while the slots were recomputed."""
+        self.cursor.executemany(
+            "DELETE FROM etl_slot_changes WHERE table_name = %s AND slot = %s AND version = %s",
+            [(table, date, version) for date, version in slots.items()]
+        )
+        self.conn.commit()
+
+
+def rebuild_hour(transformer, table: str, node: str, hour: str, computed: Dict[str, List[Dict[str, Any]]]):
+    """Rewrite the hourly rollup rows of one node and hour from the hour's slots (no commit).
+
+    Slots recomputed in this run are taken from `computed`; the others of the
+    hour are recomputed from the source table.
+    """
+    cursor = transformer.source_cursor
+    cursor.execute(f"SELECT DISTINCT Date FROM {table} WHERE Date >= %s AND Date < %s + INTERVAL 1 HOUR",
+                   (f"{hour}:00:00", f"{hour}:00:00"))
+    dates = sorted(str(row[0]) for row in cursor.fetchall())
+
+    hourly = KpiRollup(transformer.dest_conn, transformer.kpi_formulas, {'kpi_rollup_hourly': ROLLUP_TABLES['kpi_rollup_hourly']})
+    for date in dates:
+        results = computed[date] if date in computed else transformer.compute_slot(table, date)
+        for item in results:
+            hourly.add(date, node, item['kpi'], item['suffix'], counter_values(transformer.kpi_formulas[item['kpi']], item['values']),
+                       item['value'])
+    if hourly.pending:
+        hourly.flush(replace=True)
+    else:
+        hourly.cursor.execute("DELETE FROM kpi_rollup_hourly WHERE node = %s AND period_start = %s", (node, f"{hour}:00:00"))
+    hourly.cursor.close()
+
+
+@timed('recompute_slots')
+def recompute_slots(transformer, table: str, slots: List[str]) -> int:
+    """Replace the KPI results of the given slots of a table, and the rollups they feed.
+
+    Slots without stored results are written like in a normal run. Slots that
+    already had results (late or corrected counters) are deleted and rewritten,
+    and their hours are rebuilt from scratch, followed by the days holding them.
+
+    Returns:
+        Number of slots that replaced existing results.
+    """
+    node = transformer.extract_node(table)
+    if not node:
+        return 0
+
+    writer = transformer.create_writer()
+    writer.prepare(slots)
+    computed: Dict[str, List[Dict[str, Any]]] = {}
+    replaced = []
+    for date in sorted(slots):
+        # Delete and rewrite in the same transaction; a slot still holding results
+        # after a crash is treated as a correction again on the next run
+        if transformer.delete_slot(date, node):
+            replaced.append(date)
+        computed[date] = transformer.compute_slot(table, date)
+        writer.write(date, node, computed[date])
+    writer.close()
+
+    corrected_hours = {date[:13] for date in replaced}
+    if ENABLE_ROLLUPS and corrected_hours:
+        try:
+            for hour in sorted(corrected_hours):
+                rebuild_hour(transformer, table, node, hour, computed)
+            for day in sorted({hour[:10] for hour in corrected_hours}):
+                rebuild_daily(transformer.dest_conn, transformer.kpi_formulas, node, day)
+            bump_watermarks(transformer.dest_cursor, {node: max(replaced)})
+            transformer.dest_conn.commit()
+        except Exception as e:
+            logging.error(f"Error rebuilding rollups of {table}: {e}")
+            transformer.dest_conn.rollback()
+            raise
+    return len(replaced)
+
+
+def process_changes(transformer, before: Optional[Dict[str, str]] = None) -> int:
+    """Recompute every slot marked in etl_slot_changes since the last run.
+
+    Markers are cleared only after their slot's results are committed, and only
+    if no newer load touched the slot meanwhile, so an interrupted run or a
+    concurrent correction is picked up again by the next run.
+
+    Args:
+        before: Only recompute the slots of a table older than before[table]
+            (tables missing from it are skipped); the other markers are kept.
+
+    Returns:
+        Number of slots recomputed.
+    """
+    if transformer.storage_layout != 'long':
+        ensure_summary_index(transformer.dest_cursor)
+    changes = SlotChanges(transformer.source_conn)
+    pending = changes.pending(transformer.tables)
+    if before is not None:
+        pending = {table: {date: version for date, version in slots.items() if table in before and date < before[table]}
+                   for table, slots in pending.items()}
+        pending = {table: slots for table, slots in pending.items() if slots}
+    total = corrected = 0
+    for table, slots in sorted(pending.items()):
+        corrected += recompute_slots(transformer, table, list(slots))
+        changes.clear(table, slots)
+        total += len(slots)
+    if total or before is None:
+        logging.info(f"Recomputed {total} changed slots in {len(pending)} tables ({corrected} corrections of existing results)")
+    return total
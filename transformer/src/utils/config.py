@@ -6,6 +6,14 @@ import os
 # Pattern to extract Node
 NOEUD_PATTERN_5_15 = re.compile(r'^(CALIS|MEIND|RAIND)', re.IGNORECASE)
 
+# Single combined pattern used by the table catalog
+TABLE_NAME_PATTERN = re.compile(
+    r'^(?:(?P<node>CALIS|MEIND|RAIND)[-_]APG43[_-](?P<granularity>5|15)'
+    r'|(?P<mgw_node>[A-Za-z0-9]+)MGW)'
+    r'_S(?P<week>\d+)_A(?P<year>\d{4})$',
+    re.IGNORECASE
+)
+
 # Database connection parameters
 load_dotenv()
 
@@ -49,6 +57,26 @@ files_paths: Dict[str, str] = {
     'last_extracted': './data/last_extracted.json'
 }
 
+# Counter filtering settings
+FILTER_MODE = os.getenv("TRANSFORMER_FILTER_MODE", default="like")  # 'like' (prefix LIKE) or 'in' (exact IN-list)
+CREATE_DATE_INDEX = os.getenv("TRANSFORMER_CREATE_INDEX", default="0") == "1"  # add (Date, indicateur) index to source tables
+INDICATORS_DIR = './data/indicators'
+
+# Parallel execution settings
+TRANSFORMER_WORKERS = int(os.getenv("TRANSFORMER_WORKERS", default=1))
+SHARD_SIZE_DATES = int(os.getenv("TRANSFORMER_SHARD_SIZE", default=288))  # one day of 5-minute slots
+WRITE_BATCH_SIZE = int(os.getenv("TRANSFORMER_WRITE_BATCH_SIZE", default=1000))
+
+# Bounded queue between the process pool and the writer; a dropped shard would lose
+# its KPI rows, so only the lossless policies are accepted
+write_stage_settings = {
+    'maxsize': int(os.getenv("TRANSFORMER_WRITE_QUEUE_SIZE", default=4)),
+    'policy': os.getenv("TRANSFORMER_WRITE_QUEUE_POLICY", default="block"),  # block or spill
+    'spill_dir': os.getenv("TRANSFORMER_SPILL_DIR", default="./data/spill/write")
+}
+if write_stage_settings['policy'] not in ('block', 'spill'):
+    raise ValueError(f"TRANSFORMER_WRITE_QUEUE_POLICY must be 'block' or 'spill', got '{write_stage_settings['policy']}'")
+
 # Suffix to operator/network mapping (lowercase keys)
 SUFFIX_OPERATOR_MAPPING = {
     'nw': 'Inwi',
@@ -61,6 +89,34 @@ SUFFIX_OPERATOR_MAPPING = {
     'ns': 'Orange 3G'
 }
 
+# Streaming mode: tail the extracted tables and keep open 5-minute windows in a local state store
+stream_settings = {
+    'state_path': os.getenv("TRANSFORMER_STATE_PATH", default="./data/state/transformer_state.sqlite"),
+    'cache_size': int(os.getenv("TRANSFORMER_STATE_CACHE_SIZE", default=100000)),  # open windows kept in memory
+    'batch_rows': int(os.getenv("TRANSFORMER_STREAM_BATCH_ROWS", default=10000)),
+    'checkpoint_seconds': float(os.getenv("TRANSFORMER_CHECKPOINT_SECONDS", default=10)),
+    'poll_seconds': float(os.getenv("TRANSFORMER_POLL_SECONDS", default=5))
+}
+
+# Storage layout: 'wide' (one *_details table per KPI) or 'long' (single kpi_fact table)
+STORAGE_LAYOUT = os.getenv("TRANSFORMER_STORAGE_LAYOUT", default="wide")
+FACT_PARTITIONED = os.getenv("TRANSFORMER_FACT_PARTITIONED", default="1") == "1"  # weekly RANGE partitions on kpi_fact
+FACT_RETENTION_DAYS = int(os.getenv("TRANSFORMER_FACT_RETENTION_DAYS", default=0))  # drop kpi_fact weeks older than this; 0 keeps all
+
+# Compact node codes for the long layout
+NODE_CODES = {'CALIS': 1, 'MEIND': 2, 'RAIND': 3}
+
+# Hourly/daily rollups maintained alongside the 5-minute results
+ENABLE_ROLLUPS = os.getenv("TRANSFORMER_ROLLUPS", default="1") == "1"
+
+# Incremental runs: only recompute the (table, Date) slots listed in the extractor's etl_slot_changes
+# (needs EXTRACTOR_TRACK_CHANGES=1 on the extractor, otherwise no slot is ever listed)
+INCREMENTAL = os.getenv("TRANSFORMER_INCREMENTAL", default="0") == "1"
+
+# Suffix dimension settings
+USE_SUFFIX_DIM = os.getenv("TRANSFORMER_SUFFIX_DIM", default="0") == "1"  # reference suffix_dim by ID in *_details
+SUFFIX_CACHE_SIZE = int(os.getenv("TRANSFORMER_SUFFIX_CACHE_SIZE", default=4096))
+
 # KPI families
 KPI_FAMILIES = {
     'traffic': [
@@ -69,6 +125,10 @@ KPI_FAMILIES = {
 }
 
 # KPI formulas for 5min data (spaces replaced with underscores)
+# "rollup" tells how hourly/daily rollups aggregate a KPI (rollup.rollup_value):
+#   'ratio' (default)  the formula on summed counters, for sum/sum ratios
+#   'duration'         same, times the number of 5-minute slots, for formulas scaled by the slot length (*300)
+#   'mean'             mean of the 5-minute values, for formulas on gauges (NDEV) or not linear in the counters
 KPI_FORMULAS_5MIN = {
     "TxPaging1": {
         "numerator": ["LocNLAPAG1RESUCC", "LocNLAPAG2RESUCC"],
@@ -162,6 +222,7 @@ KPI_FORMULAS_5MIN = {
         "additional": ["TrunkrouteNDEV", "TrunkrouteNBLOCACC"],
         "Suffix": True,
         "family": "traffic",
+        "rollup": "mean",
         "formula": lambda num, denom, add: ((sum(num) / sum(denom)) / (add[0] - (add[1] / sum(denom)))) * 100 if (sum(denom) != 0 and (add[0] - (add[1] / sum(denom))) != 0) else None
     },
     "TRAF_CircHS": {
@@ -169,6 +230,7 @@ KPI_FORMULAS_5MIN = {
         "denominator": ["TrunkrouteNSCAN", "TrunkrouteNDEV"],
         "Suffix": True,
         "family": "traffic",
+        "rollup": "mean",
         "formula": lambda num, denom: (sum(num) / denom[0]) / denom[1] * 100 if (denom[0] != 0 and denom[1] != 0) else None
     },
     "TRAF_ALOC_E": {
@@ -176,6 +238,7 @@ KPI_FORMULAS_5MIN = {
         "denominator": ["TrunkrouteNSCAN", "TrunkrouteNANSWERSI"],
         "Suffix": True,
         "family": "traffic",
+        "rollup": "duration",
         "formula": lambda num, denom: (sum(num) / denom[0]) / denom[1] * 300 if (denom[0] != 0 and denom[1] != 0) else None
     },
     "TRAF_ALOC_S": {
@@ -183,6 +246,7 @@ KPI_FORMULAS_5MIN = {
         "denominator": ["TrunkrouteNSCAN", "TrunkrouteNANSWERSO"],
         "Suffix": True,
         "family": "traffic",
+        "rollup": "duration",
         "formula": lambda num, denom: (sum(num) / denom[0]) / denom[1] * 300 if (denom[0] != 0 and denom[1] != 0) else None
     },
     "ASR_S": {
@@ -205,6 +269,7 @@ KPI_FORMULAS_5MIN = {
         "additional": ["TrunkrouteNDEV"],
         "Suffix": True,
         "family": "traffic",
+        "rollup": "mean",
         "formula": lambda num, denom, add: add[0] - (sum(num) / sum(denom)) if sum(denom) != 0 else None
     },
     "RouteUtilizationIn": {
@@ -222,6 +287,7 @@ KPI_FORMULAS_5MIN = {
     "Succ_VoIP_Seiz_Attempts": {
         "numerator": ["VoiproIOVERFL"],
         "Suffix": True,
+        "rollup": "mean",
         "formula": lambda num: (1 - sum(num)) * 100
     },
     "ASR_IN": {
@@ -270,12 +336,14 @@ KPI_FORMULAS_5MIN = {
         "numerator": ["VoiproITRALAC"],
         "denominator": ["VoiproNSCAN", "VoiproIANSWER"],
         "Suffix": True,
+        "rollup": "duration",
         "formula": lambda num, denom: (sum(num) / denom[0]) / denom[1] * 300 if (denom[0] != 0 and denom[1] != 0) else None
     },
     "ALOC_OUT": {
         "numerator": ["VoiproOTRALAC"],
         "denominator": ["VoiproNSCAN", "VoiproOANSWER"],
         "Suffix": True,
+        "rollup": "duration",
         "formula": lambda num, denom: (sum(num) / denom[0]) / denom[1] * 300 if (denom[0] != 0 and denom[1] != 0) else None
     },
     "CSFB_MT_Eff": {
@@ -0,0 +1,218 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Any, Set
+from config import NODE_CODES
+from tools import counter_values, bump_watermarks
+from profiling import timed
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def sync_kpi_codes(cursor, kpi_formulas: Dict[str, Any]) -> Dict[str, int]:
+    """Return the kpi_dim code of every KPI, giving the next free codes to KPIs not stored yet (no commit).
+
+    Stored codes never change, so kpi_fact rows keep their meaning when KPIs are
+    added, removed or reordered in the configuration. The locking read
+    serializes concurrent writers adding the same KPIs.
+    """
+    cursor.execute("SELECT code, kpi FROM kpi_dim FOR UPDATE")
+    codes = {kpi: code for code, kpi in cursor.fetchall()}
+    new = [kpi for kpi in kpi_formulas if kpi not in codes]
+    if new:
+        first = max(codes.values(), default=0) + 1
+        cursor.executemany("INSERT INTO kpi_dim (code, kpi) VALUES (%s, %s)", [(first + i, kpi) for i, kpi in enumerate(new)])
+        codes.update((kpi, first + i) for i, kpi in enumerate(new))
+        logging.info(f"Added {len(new)} KPIs to kpi_dim: {new}")
+    return codes
+
+
+def week_partition(date: str) -> tuple:
+    """Return (partition name, first day of the following week) for a 'YYYY-MM-DD ...' date."""
+    day = datetime.strptime(date[:10], "%Y-%m-%d").date()
+    year, week, weekday = day.isocalendar()
+    next_monday = day + timedelta(days=8 - weekday)
+    return f"p{year}w{week:02d}", next_monday.isoformat()
+
+
+def create_fact_tables(cursor, kpi_formulas: Dict[str, Any], partitioned: bool = True):
+    """Create kpi_dim, node_dim and the long-format kpi_fact table.
+
+    kpi_fact holds one row per (ts, node, kpi, suffix) with the KPI value and its
+    summed numerator/denominator. With `partitioned`, it is RANGE-partitioned by
+    week on TO_DAYS(ts) so old weeks can be dropped cheaply.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_dim (
+            code SMALLINT NOT NULL PRIMARY KEY,
+            kpi VARCHAR(50) NOT NULL UNIQUE
+        );
+    """)
+    sync_kpi_codes(cursor, kpi_formulas)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS node_dim (
+            code TINYINT NOT NULL PRIMARY KEY,
+            node VARCHAR(50) NOT NULL UNIQUE
+        );
+    """)
+    cursor.executemany("INSERT IGNORE INTO node_dim (code, node) VALUES (%s, %s)",
+                       [(code, node) for node, code in NODE_CODES.items()])
+
+    partition_clause = "PARTITION BY RANGE (TO_DAYS(ts)) (PARTITION pmax VALUES LESS THAN MAXVALUE)" if partitioned else ""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS kpi_fact (
+            ts DATETIME NOT NULL,
+            node TINYINT NOT NULL,
+            kpi_code SMALLINT NOT NULL,
+            suffix_id INT NOT NULL DEFAULT 0,
+            value DOUBLE,
+            num DOUBLE,
+            den DOUBLE,
+            PRIMARY KEY (ts, node, kpi_code, suffix_id),
+            KEY idx_node_kpi_ts (node, kpi_code, ts)
+        ) {partition_clause};
+    """)
+    logging.info("✅ Tables 'kpi_dim', 'node_dim' and 'kpi_fact' created or already exist.")
+
+
+def existing_partitions(cursor, table: str = 'kpi_fact') -> Dict[str, int]:
+    """Return partition name -> TO_DAYS upper bound (None for pmax) of a table."""
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,))
+    return {name: (None if bound == 'MAXVALUE' else int(bound)) for name, bound in cursor.fetchall()}
+
+
+def to_days(day: str) -> int:
+    """Python equivalent of MySQL TO_DAYS() for a 'YYYY-MM-DD' date."""
+    return datetime.strptime(day, "%Y-%m-%d").date().toordinal() + 365
+
+
+def ensure_week_partition(cursor, date: str, table: str = 'kpi_fact') -> str:
+    """Split the week of `date` out of pmax if it has no partition yet.
+
+    Range partitions can only be added above the highest bound, so a week older
+    than the newest partition stays in the partition already covering it.
+    The ALTER commits the connection's open transaction implicitly: call it
+    before writing, never between writes that must commit together.
+
+    Returns:
+        Name of the partition holding the week.
+    """
+    name, upper = week_partition(date)
+    partitions = existing_partitions(cursor, table)
+    if name in partitions:
+        return name
+    upper_days = to_days(upper)
+    covering = sorted((bound, part) for part, bound in partitions.items() if bound is not None and bound >= upper_days)
+    if covering:
+        return covering[0][1]
+    cursor.execute(f"""
+        ALTER TABLE {table} REORGANIZE PARTITION pmax INTO (
+            PARTITION {name} VALUES LESS THAN ({upper_days}),
+            PARTITION pmax VALUES LESS THAN MAXVALUE
+        )
+    """)
+    logging.info(f"Added partition {name} to {table}")
+    return name
+
+
+def drop_partitions_before(cursor, cutoff: str, table: str = 'kpi_fact') -> List[str]:
+    """Drop every weekly partition that only holds rows older than `cutoff` (YYYY-MM-DD)."""
+    cutoff_days = to_days(cutoff)
+    expired = [name for name, bound in existing_partitions(cursor, table).items() if bound is not None and bound <= cutoff_days]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+        logging.info(f"Dropped {len(expired)} partitions from {table}: {expired}")
+    return expired
+
+
+class KpiFactWriter:
+    """Bulk-append KPI results to kpi_fact (same interface as KpiBatchWriter).
+
+    Week partitions are DDL, which commits implicitly, so they are created by
+    prepare() before anything is written. A write into a week prepare() did not
+    cover flushes the pending rows first, so the DDL only ever ends a
+    transaction at a flush boundary.
+    """
+
+    def __init__(self, conn, kpi_formulas: Dict[str, Any], batch_size: int = 1000, suffix_dim=None, rollup=None, partitioned: bool = True):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.kpi_formulas = kpi_formulas
+        self.kpi_codes = sync_kpi_codes(self.cursor, kpi_formulas)
+        self.conn.commit()
+        self.batch_size = batch_size
+        self.suffix_dim = suffix_dim
+        self.rollup = rollup
+        self.partitioned = partitioned
+        self.known_partitions: Set[str] = set()
+        self.rows: List[tuple] = []
+        self.summary_rows = 0
+        self.detail_rows = 0
+        self.touched: Dict[str, str] = {}
+
+    def prepare(self, dates: Iterable[str]):
+        """Create the week partitions of `dates` that are missing. Call before the transaction writing them."""
+        if not self.partitioned:
+            return
+        for date in sorted(set(dates)):
+            name, _ = week_partition(date)
+            if name not in self.known_partitions:
+                ensure_week_partition(self.cursor, date)
+                self.known_partitions.add(name)
+
+    def write(self, date: str, node: str, results: List[Dict[str, Any]]) -> None:
+        """Queue all KPI results computed for one (date, node) slot."""
+        if self.partitioned and week_partition(date)[0] not in self.known_partitions:
+            if self.rows:
+                self.flush()
+            self.prepare([date])
+
+        node_code = NODE_CODES[node]
+        self.touched[node] = max(self.touched.get(node, date), date)
+        for item in results:
+            kpi_config = self.kpi_formulas[item['kpi']]
+            values = item['values']
+            suffix_id = self.suffix_dim.get_id(item['suffix']) if item['suffix'] else 0
+            num = sum(values.get('numerator', [])) if values.get('numerator') else None
+            den = sum(values.get('denominator', [])) if values.get('denominator') else None
+            self.rows.append((date, node_code, self.kpi_codes[item['kpi']], suffix_id, item['value'], num, den))
+            if self.rollup is not None:
+                self.rollup.add(date, node, item['kpi'], item['suffix'], counter_values(kpi_config, values), item['value'])
+
+        self.summary_rows += 1
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    @timed('write_fact_flush')
+    def flush(self):
+        """Append buffered rows and commit."""
+        try:
+            if self.rows:
+                # REPLACE keeps re-runs of the same slot idempotent on the primary key
+                self.cursor.executemany("""
+                    REPLACE INTO kpi_fact (ts, node, kpi_code, suffix_id, value, num, den)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, self.rows)
+            if self.rollup is not None:
+                self.rollup.flush()
+            bump_watermarks(self.cursor, self.touched)
+            self.conn.commit()
+            self.detail_rows += len(self.rows)
+            if self.rows:
+                logging.info(f"Appended {len(self.rows)} rows to kpi_fact")
+        except Exception as e:
+            logging.error(f"Error appending to kpi_fact: {e}")
+            self.conn.rollback()
+            raise
+        finally:
+            self.rows = []
+            self.touched = {}
+
+    def close(self):
+        """Flush remaining rows and release the cursor."""
+        self.flush()
+        self.cursor.close()
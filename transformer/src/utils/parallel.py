@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+from collections import deque
+from multiprocessing import Pool
+from typing import Dict, List, Any, Tuple
+from config import SHARD_SIZE_DATES, write_stage_settings
+from stage import BoundedStage
+import profiling
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Per-process Transformer holding the worker's own source connection
+_worker_transformer = None
+
+
+def init_worker():
+    """Pool initializer: open a source-only Transformer in each worker process."""
+    global _worker_transformer
+    from transformer import Transformer
+    _worker_transformer = Transformer(connect_dest=False)
+    logging.info(f"Worker {os.getpid()} ready")
+
+
+def transform_shard(shard: Tuple[str, str, List[str]]) -> Dict[str, Any]:
+    """Compute KPI results for one (table, date-range) shard inside a worker."""
+    table, node, dates = shard
+    start = time.perf_counter()
+    profiling.reset()
+    slots = [(date, _worker_transformer.compute_slot(table, date)) for date in dates]
+    return {
+        'timings': profiling.snapshot(),
+        'table': table,
+        'node': node,
+        'slots': slots,
+        'worker': os.getpid(),
+        'results': sum(len(results) for _, results in slots),
+        'seconds': time.perf_counter() - start
+    }
+
+
+def build_shards(transformer, shard_size: int = SHARD_SIZE_DATES) -> List[Tuple[str, str, List[str]]]:
+    """Split every table's sorted distinct dates into fixed-size shards."""
+    shards = []
+    for table in transformer.tables:
+        node = transformer.extract_node(table)
+        if not node:
+            continue
+        dates = sorted(transformer.get_distinct_dates(table))
+        for i in range(0, len(dates), shard_size):
+            shards.append((table, node, dates[i:i + shard_size]))
+    logging.info(f"Built {len(shards)} shards from {len(transformer.tables)} tables")
+    return shards
+
+
+def process_parallel(transformer, workers: int, shard_size: int = SHARD_SIZE_DATES):
+    """Compute shards in a process pool and write them through one batched writer.
+
+    At most `workers * 2` shards are in flight, and finished shards wait in a
+    bounded write stage, so a slow destination stalls the pool instead of
+    growing memory. Results are collected in submission order, so kpi_summary
+    IDs are assigned in the same (table, date) order as a serial run.
+    """
+    shards = build_shards(transformer, shard_size)
+    writer = transformer.create_writer()
+    worker_metrics: Dict[int, Dict[str, float]] = {}
+    max_in_flight = workers * 2
+    start = time.perf_counter()
+
+    def write_shard(shard: Dict[str, Any]):
+        for date, results in shard['slots']:
+            writer.write(date, shard['node'], results)
+
+    os.makedirs(write_stage_settings['spill_dir'], exist_ok=True)
+    write_stage = BoundedStage('write', write_shard, **write_stage_settings)
+    write_stage.start()
+
+    with Pool(processes=workers, initializer=init_worker) as pool:
+        in_flight = deque()
+        pending = iter(shards)
+        done = 0
+        while True:
+            while len(in_flight) < max_in_flight:
+                shard = next(pending, None)
+                if shard is None:
+                    break
+                in_flight.append(pool.apply_async(transform_shard, (shard,)))
+            if not in_flight:
+                break
+
+            shard = in_flight.popleft().get()
+            # The write thread owns the shard once it is queued, so read it first
+            profiling.merge(shard.pop('timings'))
+            done += 1
+
+            metrics = worker_metrics.setdefault(shard['worker'], {'shards': 0, 'slots': 0, 'results': 0, 'seconds': 0.0})
+            metrics['shards'] += 1
+            metrics['slots'] += len(shard['slots'])
+            metrics['results'] += shard['results']
+            metrics['seconds'] += shard['seconds']
+            summary = f"{shard['table']} ({len(shard['slots'])} dates) by worker {shard['worker']} in {shard['seconds']:.2f}s"
+            write_stage.put(shard)
+            logging.info(f"Shard {done}/{len(shards)} done: {summary}, write queue depth {write_stage.depth}")
+
+    write_stage.stop(drain=True)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    for pid, metrics in sorted(worker_metrics.items()):
+        logging.info(f"Worker {pid}: {metrics['shards']} shards, {metrics['slots']} dates, {metrics['results']} KPI results, {metrics['seconds']:.2f}s busy")
+    logging.info(f"Parallel transform finished with {workers} workers in {elapsed:.2f}s ({writer.summary_rows} summaries, {writer.detail_rows} detail rows)")
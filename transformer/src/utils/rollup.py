@@ -0,0 +1,186 @@
+import json
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+from tools import resolve_suffix
+from profiling import timed
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Rollup tables and how a 'YYYY-MM-DD HH:MM:SS' date is truncated for each
+ROLLUP_TABLES: Dict[str, Any] = {
+    'kpi_rollup_hourly': lambda date: f"{date[:13]}:00:00",
+    'kpi_rollup_daily': lambda date: f"{date[:10]} 00:00:00"
+}
+
+
+def create_rollup_tables(cursor):
+    """Create the hourly and daily rollup tables if they don't exist."""
+    for table_name in ROLLUP_TABLES:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                period_start DATETIME NOT NULL,
+                node VARCHAR(50) NOT NULL,
+                kpi VARCHAR(50) NOT NULL,
+                suffix VARCHAR(50) NOT NULL DEFAULT '',
+                operator VARCHAR(50),
+                num_sum DOUBLE,
+                den_sum DOUBLE,
+                counter_sums TEXT,
+                samples INT NOT NULL DEFAULT 0,
+                value DOUBLE,
+                PRIMARY KEY (node, kpi, suffix, period_start),
+                KEY idx_operator_period (operator, period_start),
+                KEY idx_period (period_start)
+            );
+        """)
+        logging.info(f"✅ Table '{table_name}' created or already exists.")
+
+
+# counter_sums entries holding the sum and count of 5-minute values, for 'mean' KPIs
+VALUE_SUM = '__value_sum'
+VALUE_COUNT = '__value_count'
+
+
+def evaluate_kpi(kpi_config: Dict[str, Any], counters: Dict[str, float]) -> Optional[float]:
+    """Apply a KPI formula to summed counters (one value per configured counter)."""
+    values = {field: [counters.get(c, 0.0) for c in kpi_config.get(field, [])] for field in ('numerator', 'denominator', 'additional')}
+    formula = kpi_config['formula']
+    try:
+        if 'additional' in kpi_config:
+            return formula(values['numerator'], values['denominator'], values['additional'])
+        if 'denominator' in kpi_config:
+            return formula(values['numerator'], values['denominator'])
+        return formula(values['numerator'])
+    except ZeroDivisionError:
+        return None
+
+
+def rollup_value(kpi_config: Dict[str, Any], counters: Dict[str, float], samples: int) -> Optional[float]:
+    """KPI value of a rollup period, following the KPI's "rollup" rule (see config.KPI_FORMULAS_5MIN)."""
+    rule = kpi_config.get('rollup', 'ratio')
+    if rule == 'mean':
+        return counters[VALUE_SUM] / counters[VALUE_COUNT] if counters.get(VALUE_COUNT) else None
+    value = evaluate_kpi(kpi_config, counters)
+    if rule == 'duration' and value is not None:
+        value *= samples  # the formula scales by one 5-minute slot; the period spans `samples` of them
+    return value
+
+
+class KpiRollup:
+    """Incrementally maintained hourly/daily KPI rollups.
+
+    Rollups keep the sums of every counter rather than averaged ratios, and the
+    KPI value is re-evaluated from those sums, so ratio KPIs stay exact. KPIs
+    whose formula is not a ratio of sums (gauges such as NDEV, slot-length
+    scaling) are aggregated by their "rollup" rule instead; see rollup_value.
+    New 5-minute results are accumulated in memory and merged into the
+    tables on flush(), inside the caller's transaction.
+    """
+
+    def __init__(self, conn, kpi_formulas: Dict[str, Any], tables: Dict[str, Any] = ROLLUP_TABLES):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.kpi_formulas = kpi_formulas
+        self.tables = tables
+        self.pending: Dict[Tuple[str, str, str, str, str], Dict[str, Any]] = {}
+
+    def add(self, date: str, node: str, kpi: str, suffix: str, counters: Dict[str, float], value: Optional[float] = None):
+        """Accumulate one 5-minute KPI result into its hour and day."""
+        suffix = suffix or ''
+        if value is not None and self.kpi_formulas[kpi].get('rollup') == 'mean':
+            counters = {**counters, VALUE_SUM: value, VALUE_COUNT: 1}
+        for table_name, truncate in self.tables.items():
+            key = (table_name, node, kpi, suffix, truncate(date))
+            entry = self.pending.get(key)
+            if entry is None:
+                entry = self.pending[key] = {'counters': {}, 'samples': 0}
+            for counter, amount in counters.items():
+                entry['counters'][counter] = entry['counters'].get(counter, 0.0) + (amount or 0.0)
+            entry['samples'] += 1
+
+    def load_existing(self, table_name: str, keys: List[Tuple[str, str, str, str]]) -> Dict[tuple, Tuple[Dict[str, float], int]]:
+        """Lock and read the stored sums of the given rollup rows."""
+        existing = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            conditions = ' OR '.join(['(node = %s AND kpi = %s AND suffix = %s AND period_start = %s)'] * len(chunk))
+            self.cursor.execute(
+                f"SELECT node, kpi, suffix, period_start, counter_sums, samples FROM {table_name} WHERE {conditions} FOR UPDATE",
+                [value for key in chunk for value in key]
+            )
+            for node, kpi, suffix, period_start, counter_sums, samples in self.cursor.fetchall():
+                existing[(node, kpi, suffix, str(period_start))] = (json.loads(counter_sums or '{}'), samples)
+        return existing
+
+    @timed('rollup_flush')
+    def flush(self, replace: bool = False):
+        """Merge pending sums into the rollup tables (no commit).
+
+        With replace=True, the pending sums are complete periods: every stored row
+        of their (node, period_start) is deleted and rewritten from the pending sums.
+        """
+        if not self.pending:
+            return
+        try:
+            for table_name in self.tables:
+                keys = [key[1:] for key in self.pending if key[0] == table_name]
+                if replace:
+                    periods = sorted({(node, period_start) for node, _, _, period_start in keys})
+                    self.cursor.executemany(f"DELETE FROM {table_name} WHERE node = %s AND period_start = %s", periods)
+                    existing = {}
+                else:
+                    existing = self.load_existing(table_name, keys)
+                rows = []
+                for key in keys:
+                    node, kpi, suffix, period_start = key
+                    entry = self.pending[(table_name,) + key]
+                    counters, samples = existing.get(key, ({}, 0))
+                    for counter, value in entry['counters'].items():
+                        counters[counter] = counters.get(counter, 0.0) + value
+                    samples += entry['samples']
+
+                    kpi_config = self.kpi_formulas[kpi]
+                    num_sum = sum(counters.get(c, 0.0) for c in kpi_config.get('numerator', []))
+                    den_sum = sum(counters.get(c, 0.0) for c in kpi_config.get('denominator', []))
+                    operator = resolve_suffix(suffix).operator if suffix else None
+                    rows.append((period_start, node, kpi, suffix, operator, num_sum, den_sum,
+                                 json.dumps(counters), samples, rollup_value(kpi_config, counters, samples)))
+
+                self.cursor.executemany(f"""
+                    INSERT INTO {table_name}
+                        (period_start, node, kpi, suffix, operator, num_sum, den_sum, counter_sums, samples, value)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        operator = VALUES(operator), num_sum = VALUES(num_sum), den_sum = VALUES(den_sum),
+                        counter_sums = VALUES(counter_sums), samples = VALUES(samples), value = VALUES(value)
+                """, rows)
+                logging.info(f"Updated {len(rows)} rows in {table_name}")
+        finally:
+            self.pending = {}
+
+
+def rebuild_daily(conn, kpi_formulas: Dict[str, Any], node: str, day: str):
+    """Rewrite a node's daily rollup rows of `day` (YYYY-MM-DD) from its hourly rows (no commit)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT kpi, suffix, counter_sums, samples FROM kpi_rollup_hourly
+            WHERE node = %s AND period_start >= %s AND period_start < %s + INTERVAL 1 DAY
+        """, (node, f"{day} 00:00:00", f"{day} 00:00:00"))
+        hourly = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    daily = KpiRollup(conn, kpi_formulas, {'kpi_rollup_daily': ROLLUP_TABLES['kpi_rollup_daily']})
+    for kpi, suffix, counter_sums, samples in hourly:
+        key = ('kpi_rollup_daily', node, kpi, suffix, f"{day} 00:00:00")
+        entry = daily.pending.setdefault(key, {'counters': {}, 'samples': 0})
+        for counter, value in json.loads(counter_sums or '{}').items():
+            entry['counters'][counter] = entry['counters'].get(counter, 0.0) + value
+        entry['samples'] += samples
+    if daily.pending:
+        daily.flush(replace=True)
+    else:
+        daily.cursor.execute("DELETE FROM kpi_rollup_daily WHERE node = %s AND period_start = %s", (node, f"{day} 00:00:00"))
+    daily.cursor.close()
@@ -0,0 +1,173 @@
+import os
+import time
+import pickle
+import logging
+import tempfile
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Policies applied when the queue is full
+POLICIES = ('block', 'drop_newest', 'drop_oldest', 'spill')
+
+
+class BoundedStage:
+    """Bounded queue with a single consumer thread between two pipeline stages.
+
+    Producers call put(); the consumer thread calls `handler(item)` for every item
+    in FIFO order. When `maxsize` items are queued, the policy decides what happens:
+
+    - 'block': put() waits until the consumer makes room (backpressure).
+    - 'drop_newest' / 'drop_oldest': an item is discarded and counted.
+    - 'spill': items are pickled to `spill_dir` and read back in order once the
+      in-memory queue drains, so memory stays bounded without losing data.
+
+    `saturated` is True once depth reaches `high_watermark` * maxsize, which
+    producers can use as an early slow-down signal.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], None], maxsize: int = 8,
+                 policy: str = 'block', spill_dir: Optional[str] = None, high_watermark: float = 0.8):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown stage policy '{policy}', expected one of {POLICIES}")
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.high_watermark = high_watermark
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix=f"stage-{name}-")
+        self.queue: deque = deque()
+        self.spilled: deque = deque()
+        self.spill_seq = 0
+        self.cond = threading.Condition()
+        self.unfinished = 0
+        self.error: Optional[BaseException] = None
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, float] = {'put': 0, 'done': 0, 'dropped': 0, 'spilled': 0, 'max_depth': 0, 'blocked_seconds': 0.0}
+
+    @property
+    def depth(self) -> int:
+        """Items waiting in memory and on disk."""
+        return len(self.queue) + len(self.spilled)
+
+    @property
+    def saturated(self) -> bool:
+        return len(self.queue) >= self.high_watermark * self.maxsize
+
+    def start(self):
+        """Start the consumer thread (no-op if already running)."""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self.thread.start()
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> bool:
+        """Queue an item, applying the full-queue policy.
+
+        Returns:
+            False if the item (or, for drop_oldest, an older one) was dropped or
+            the blocking put timed out.
+        """
+        self.raise_if_failed()
+        with self.cond:
+            accepted = True
+            if self.policy == 'spill' and (self.spilled or len(self.queue) >= self.maxsize):
+                self._spill(item)
+            else:
+                if len(self.queue) >= self.maxsize:
+                    if self.policy == 'block':
+                        start = time.perf_counter()
+                        ready = self.cond.wait_for(lambda: len(self.queue) < self.maxsize or self.error is not None, timeout)
+                        self.stats['blocked_seconds'] += time.perf_counter() - start
+                        self.raise_if_failed()
+                        if not ready:
+                            self.stats['dropped'] += 1
+                            return False
+                    elif self.policy == 'drop_newest':
+                        self.stats['dropped'] += 1
+                        return False
+                    elif self.policy == 'drop_oldest':
+                        self.queue.popleft()
+                        self.unfinished -= 1
+                        self.stats['dropped'] += 1
+                        accepted = False
+                self.queue.append(item)
+            self.unfinished += 1
+            self.stats['put'] += 1
+            self.stats['max_depth'] = max(self.stats['max_depth'], self.depth)
+            self.cond.notify_all()
+            return accepted
+
+    def join(self):
+        """Wait until every queued item has been handled; re-raise consumer errors."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.unfinished == 0 or self.error is not None)
+        self.raise_if_failed()
+
+    def stop(self, drain: bool = True):
+        """Stop the consumer thread, optionally after handling queued items."""
+        if drain and self.running:
+            self.join()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.log_metrics()
+
+    def metrics(self) -> Dict[str, float]:
+        """Current counters plus queue depth."""
+        return {**self.stats, 'depth': self.depth}
+
+    def log_metrics(self):
+        m = self.metrics()
+        logging.info(f"Stage '{self.name}': depth={m['depth']}, max_depth={m['max_depth']}, put={m['put']}, done={m['done']}, dropped={m['dropped']}, spilled={m['spilled']}, blocked={m['blocked_seconds']:.2f}s")
+
+    def raise_if_failed(self):
+        if self.error is not None:
+            raise RuntimeError(f"Stage '{self.name}' consumer failed: {self.error}") from self.error
+
+    def _spill(self, item: Any):
+        path = os.path.join(self.spill_dir, f"{self.spill_seq:012d}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spill_seq += 1
+        self.spilled.append(path)
+        self.stats['spilled'] += 1
+
+    def _next_item(self) -> Any:
+        """Pop the oldest item: memory first, then spill files (caller holds the lock)."""
+        if self.queue:
+            return self.queue.popleft()
+        path = self.spilled.popleft()
+        with open(path, 'rb') as f:
+            item = pickle.load(f)
+        os.remove(path)
+        return item
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.depth > 0 or not self.running)
+                if self.depth == 0 and not self.running:
+                    return
+                item = self._next_item()
+                self.cond.notify_all()
+            try:
+                self.handler(item)
+            except BaseException as e:
+                logging.error(f"Stage '{self.name}' handler failed: {e}")
+                with self.cond:
+                    self.error = e
+                    self.running = False
+                    self.cond.notify_all()
+                return
+            with self.cond:
+                self.unfinished -= 1
+                self.stats['done'] += 1
+                self.cond.notify_all()
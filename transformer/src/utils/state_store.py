@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+WindowKey = Tuple[str, str, str]  # (table, date, suffix)
+
+
+class WindowStateStore:
+    """Durable per-(table, date, suffix) counter sums for the streaming transformer.
+
+    Open windows live in an in-memory write-back cache; checkpoint() writes the
+    dirty windows, drops the emitted ones and records the consumer offsets in
+    one SQLite transaction, so the state on disk always matches the offsets it
+    was built from. Clean windows beyond `cache_size` are evicted from memory
+    and read back from SQLite on demand.
+
+    Emission is made exactly-once with a write-ahead marker: begin_emit() saves
+    the windows about to be written with a sequence number, the caller commits
+    its output together with that sequence, and checkpoint() clears the marker.
+    After a crash, pending_emit() tells which windows were being written.
+    """
+
+    def __init__(self, path: str, cache_size: int = 100000):
+        self.path = path
+        self.cache_size = cache_size
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.cache: "OrderedDict[WindowKey, Dict[str, float]]" = OrderedDict()
+        self.dirty: set = set()
+        self.deleted: set = set()
+        self.offsets: Dict[str, Any] = {}
+        self.create_tables()
+
+    def create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS window_state (
+                table_name TEXT NOT NULL,
+                date TEXT NOT NULL,
+                suffix TEXT NOT NULL,
+                counters TEXT NOT NULL,
+                PRIMARY KEY (table_name, date, suffix)
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS stream_offsets (source TEXT NOT NULL PRIMARY KEY, position TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS stream_meta (name TEXT NOT NULL PRIMARY KEY, value TEXT NOT NULL)")
+
+    def restore(self) -> Dict[str, Any]:
+        """Load the checkpointed offsets and warm the cache with the open windows."""
+        self.offsets = {source: json.loads(position) for source, position in self.conn.execute("SELECT source, position FROM stream_offsets")}
+        rows = self.conn.execute("SELECT table_name, date, suffix, counters FROM window_state ORDER BY date LIMIT ?", (self.cache_size,))
+        for table, date, suffix, counters in rows:
+            self.cache[(table, date, suffix)] = json.loads(counters)
+        logging.info(f"Restored {len(self.cache)} open windows and {len(self.offsets)} offsets from {self.path}")
+        return dict(self.offsets)
+
+    def get(self, key: WindowKey) -> Optional[Dict[str, float]]:
+        counters = self.cache.get(key)
+        if counters is not None:
+            self.cache.move_to_end(key)
+            return counters
+        if key in self.deleted:
+            return None
+        row = self.conn.execute("SELECT counters FROM window_state WHERE table_name = ? AND date = ? AND suffix = ?", key).fetchone()
+        if row is None:
+            return None
+        counters = self.cache[key] = json.loads(row[0])
+        return counters
+
+    def add(self, key: WindowKey, counter: str, value: float):
+        """Add a counter value to a window's partial sums."""
+        counters = self.get(key)
+        if counters is None:
+            counters = self.cache[key] = {}
+            self.deleted.discard(key)
+        counters[counter] = counters.get(counter, 0.0) + value
+        self.dirty.add(key)
+
+    def windows(self, table: str) -> Iterator[Tuple[str, str, Dict[str, float]]]:
+        """Yield (date, suffix, counters) of every open window of a table, cached or not."""
+        seen = set()
+        for (t, date, suffix), counters in list(self.cache.items()):
+            if t == table:
+                seen.add((date, suffix))
+                yield date, suffix, counters
+        for date, suffix, counters in self.conn.execute("SELECT date, suffix, counters FROM window_state WHERE table_name = ?", (table,)):
+            if (date, suffix) not in seen and (table, date, suffix) not in self.deleted:
+                yield date, suffix, json.loads(counters)
+
+    def discard(self, key: WindowKey):
+        """Forget an emitted window (removed from disk at the next checkpoint)."""
+        self.cache.pop(key, None)
+        self.dirty.discard(key)
+        self.deleted.add(key)
+
+    def sequence(self) -> int:
+        row = self.conn.execute("SELECT value FROM stream_meta WHERE name = 'sequence'").fetchone()
+        return int(row[0]) if row else 0
+
+    def pending_emit(self) -> Optional[Tuple[int, List[WindowKey]]]:
+        """(sequence, windows) of an emission that was started but not checkpointed."""
+        row = self.conn.execute("SELECT value FROM stream_meta WHERE name = 'pending_emit'").fetchone()
+        if row is None:
+            return None
+        pending = json.loads(row[0])
+        return pending['sequence'], [tuple(key) for key in pending['windows']]
+
+    def begin_emit(self, keys: List[WindowKey], offsets: Dict[str, Any]) -> int:
+        """Persist the current state and mark `keys` as being emitted. Returns the emission sequence."""
+        sequence = self.sequence() + 1
+        self.checkpoint(offsets, pending={'sequence': sequence, 'windows': [list(key) for key in keys]})
+        return sequence
+
+    def checkpoint(self, offsets: Dict[str, Any], pending: Optional[Dict[str, Any]] = None):
+        """Write dirty windows, deletions and consumer offsets in one transaction."""
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO window_state (table_name, date, suffix, counters) VALUES (?, ?, ?, ?)",
+                [key + (json.dumps(self.cache[key]),) for key in self.dirty if key in self.cache]
+            )
+            conn.executemany("DELETE FROM window_state WHERE table_name = ? AND date = ? AND suffix = ?", list(self.deleted))
+            conn.executemany("INSERT OR REPLACE INTO stream_offsets (source, position) VALUES (?, ?)",
+                             [(source, json.dumps(position)) for source, position in offsets.items()])
+            if pending is not None:
+                conn.execute("INSERT OR REPLACE INTO stream_meta (name, value) VALUES ('pending_emit', ?)", (json.dumps(pending),))
+                conn.execute("INSERT OR REPLACE INTO stream_meta (name, value) VALUES ('sequence', ?)", (str(pending['sequence']),))
+            else:
+                conn.execute("DELETE FROM stream_meta WHERE name = 'pending_emit'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        written, removed = len(self.dirty), len(self.deleted)
+        self.offsets = dict(offsets)
+        self.dirty = set()
+        self.deleted = set()
+        self.evict()
+        logging.debug(f"Checkpointed {written} windows, removed {removed}, offsets {self.offsets}")
+
+    def evict(self):
+        """Drop the least recently used clean windows beyond cache_size."""
+        while len(self.cache) > self.cache_size:
+            key = next(iter(self.cache))
+            if key in self.dirty:
+                break
+            self.cache.popitem(last=False)
+
+    def close(self):
+        self.conn.close()
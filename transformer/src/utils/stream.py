@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from typing import Dict, List, Optional, Set, Tuple
+from config import stream_settings, files_paths
+from tools import extract_indicateur_suffixe, ensure_row_id
+from changes import SlotChanges, process_changes
+from catalog import TableDescriptor
+from state_store import WindowStateStore, WindowKey
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Compares above every slot date, for the markers of closed tables
+CLOSED_WATERMARK = '9999-12-31 23:59:59'
+
+
+class StreamingTransformer:
+    """Incremental transformer that tails the extracted tables.
+
+    Rows are read in `id` order (the extractor loads them ordered by date) and
+    summed per (table, date, suffix) window in a WindowStateStore. A table's
+    windows close once a later date has been seen for it; closed windows are
+    turned into KPI results with the batch formulas and written with the
+    regular writer.
+
+    The table list is reloaded from result_5min.txt whenever the extractor
+    rewrites it, and only tables that exist in the source are polled. A table
+    superseded by a newer week of the same node gets no new slots, so once it
+    is caught up all of its remaining windows are emitted and the table is
+    marked closed: every row it receives afterwards is a late row.
+
+    Rows arriving for a closed window (late rows) are not summed: their slot is
+    marked in etl_slot_changes, and every checkpoint recomputes the marked
+    slots older than the table's watermark from the source table, like an
+    incremental batch run. Rows rewritten in place under the extractor's
+    LOAD_UNIQUE_KEY keep their id and reach the stream the same way, through
+    the markers of EXTRACTOR_TRACK_CHANGES (which also marks in-order loads,
+    so with it on every slot is recomputed once after being emitted).
+
+    The consumer offset of a table is the last row id read plus its date
+    watermark, checkpointed with the window state. Output commits record an
+    emission sequence in `stream_progress`, so a restart never writes a window
+    twice or loses one.
+    """
+
+    def __init__(self, transformer, store: WindowStateStore, consumer: str = 'transformer',
+                 batch_rows: int = stream_settings['batch_rows'],
+                 checkpoint_seconds: float = stream_settings['checkpoint_seconds']):
+        self.transformer = transformer
+        self.store = store
+        self.consumer = consumer
+        self.batch_rows = batch_rows
+        self.checkpoint_seconds = checkpoint_seconds
+        self.offsets: Dict[str, Dict] = {}
+        self.changes = SlotChanges(transformer.source_conn)
+        self.tables: List[str] = []  # listed tables that exist in the source
+        self.superseded: Set[str] = set()
+        self.ready: Set[str] = set()  # tables known to have the row id
+        self.tables_mtime: Optional[float] = None
+        self.late_rows = 0
+        self.emitted = 0
+
+    def start(self):
+        """Create the progress table, restore the state store and finish an interrupted emission."""
+        cursor = self.transformer.dest_cursor
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stream_progress (
+                consumer VARCHAR(100) NOT NULL PRIMARY KEY,
+                sequence BIGINT NOT NULL
+            )
+        """)
+        self.transformer.dest_conn.commit()
+        self.transformer.create_tables()
+
+        start = time.perf_counter()
+        self.offsets = self.store.restore()
+        pending = self.store.pending_emit()
+        if pending is not None:
+            sequence, keys = pending
+            if self.committed_sequence() >= sequence:
+                logging.info(f"Emission {sequence} was committed before the restart, dropping its {len(keys)} windows")
+                for key in keys:
+                    self.store.discard(key)
+            else:
+                logging.info(f"Re-emitting {len(keys)} windows of interrupted emission {sequence}")
+                self.emit(keys, sequence)
+            self.store.checkpoint(self.offsets)
+        logging.info(f"Streaming state restored in {time.perf_counter() - start:.2f}s")
+
+    def committed_sequence(self) -> int:
+        cursor = self.transformer.dest_cursor
+        cursor.execute("SELECT sequence FROM stream_progress WHERE consumer = %s", (self.consumer,))
+        row = cursor.fetchone()
+        self.transformer.dest_conn.commit()
+        return row[0] if row else 0
+
+    def refresh_tables(self):
+        """Reload the table list if result_5min.txt changed and find the polled and superseded tables."""
+        mtime = os.path.getmtime(files_paths['5min'])
+        if mtime != self.tables_mtime:
+            self.transformer.tables = self.transformer.load_tables()
+            self.transformer.catalog.refresh(self.transformer.tables)
+            self.tables_mtime = mtime
+
+        cursor = self.transformer.source_cursor
+        cursor.execute("SHOW TABLES")
+        existing = {row[0] for row in cursor.fetchall()}
+        self.tables = [table for table in self.transformer.tables if table in existing]
+        for table in self.tables:
+            if table not in self.ready:
+                ensure_row_id(cursor, table)
+                self.ready.add(table)
+        self.transformer.source_conn.commit()
+
+        newest: Dict[tuple, TableDescriptor] = {}
+        for table in self.tables:
+            descriptor = self.transformer.catalog.get(table)
+            if descriptor is None:
+                continue
+            key = (descriptor.family, descriptor.node)
+            if key not in newest or descriptor.sort_key > newest[key].sort_key:
+                newest[key] = descriptor
+        current = {descriptor.name for descriptor in newest.values()}
+        self.superseded = {table for table in self.tables if table not in current and self.transformer.catalog.get(table)}
+
+    def poll_table(self, table: str) -> int:
+        """Read the next rows of a table into the window state. Returns the number of rows read."""
+        position = self.offsets.get(table, {'id': 0, 'watermark': None})
+        # Offsets checkpointed before the id column counted rows; ensure_row_id numbered them in that order
+        last_id = position.get('id', position.get('rows', 0))
+        cursor = self.transformer.source_cursor
+        cursor.execute(f"SELECT id, Date, indicateur, valeur FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                       (last_id, self.batch_rows))
+        rows = cursor.fetchall()
+        self.transformer.source_conn.commit()  # end the snapshot so the next poll sees new rows
+
+        watermark = position['watermark']
+        closed = position.get('closed', False)
+        late = set()
+        for row_id, date, indicateur, valeur in rows:
+            date = str(date)
+            last_id = row_id
+            if closed or (watermark is not None and date < watermark):
+                late.add(date)
+                self.late_rows += 1
+                continue
+            prefix, suffix = extract_indicateur_suffixe(indicateur)
+            self.store.add((table, date, suffix or ''), prefix, float(valeur or 0.0))
+            watermark = date
+        if late:
+            # Committed before the offset moves past the rows, so a crash cannot lose them
+            self.changes.mark(table, late)
+        self.offsets[table] = {'id': last_id, 'watermark': watermark, 'closed': closed}
+        return len(rows)
+
+    def closed_windows(self, drained: Set[str] = frozenset()) -> List[WindowKey]:
+        """Windows older than their table's watermark, and every window of the `drained` tables."""
+        closed = []
+        for table, position in self.offsets.items():
+            watermark = position['watermark']
+            if watermark is None:
+                continue
+            closed.extend((table, date, suffix) for date, suffix, _ in self.store.windows(table)
+                          if table in drained or date < watermark)
+        return closed
+
+    def emit(self, keys: List[WindowKey], sequence: int):
+        """Write the KPI results of `keys` and the emission sequence in one destination transaction."""
+        slots: Dict[Tuple[str, str], List[tuple]] = {}
+        for key in keys:
+            table, date, suffix = key
+            counters = self.store.get(key) or {}
+            rows = slots.setdefault((table, date), [])
+            rows.extend((f"{prefix}.{suffix}" if suffix else prefix, value) for prefix, value in counters.items())
+
+        # One flush at the end, so the results and the sequence commit together
+        writer = self.transformer.create_writer(batch_size=sys.maxsize)
+        writer.prepare(date for _, date in slots)
+        for (table, date), rows in sorted(slots.items(), key=lambda item: (item[0][1], item[0][0])):
+            node = self.transformer.extract_node(table)
+            if node:
+                writer.write(date, node, self.transformer.compute_rows(rows))
+        writer.cursor.execute("""
+            INSERT INTO stream_progress (consumer, sequence) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE sequence = VALUES(sequence)
+        """, (self.consumer, sequence))
+        writer.close()
+
+        for key in keys:
+            self.store.discard(key)
+        self.emitted += len(slots)
+        logging.info(f"Emitted {len(slots)} slots ({len(keys)} windows), emission {sequence}")
+
+    def checkpoint(self, drained: Set[str] = frozenset()):
+        """Emit the closed windows, recompute the changed slots they precede, then checkpoint the state.
+
+        `drained` are superseded tables that are caught up: all their windows are
+        emitted and the tables are marked closed in the same checkpoint.
+        """
+        for table in drained:
+            if table in self.offsets:
+                self.offsets[table]['closed'] = True
+        closed = self.closed_windows(drained)
+        if closed:
+            sequence = self.store.begin_emit(closed, self.offsets)
+            self.emit(closed, sequence)
+        # Every slot of a closed table has been emitted, so all its markers can be recomputed
+        watermarks = {table: CLOSED_WATERMARK if position.get('closed') else position['watermark']
+                      for table, position in self.offsets.items() if position['watermark']}
+        process_changes(self.transformer, before=watermarks)
+        self.store.checkpoint(self.offsets)
+
+    def run(self, poll_seconds: float = stream_settings['poll_seconds'], once: bool = False):
+        """Tail every table, checkpointing every `checkpoint_seconds`.
+
+        With once=True, stop after the tables are caught up (open windows stay in the store).
+        """
+        self.start()
+        last_checkpoint = time.monotonic()
+        while True:
+            self.refresh_tables()
+            read = {table: self.poll_table(table) for table in self.tables}
+            consumed = sum(read.values())
+            drained = {table for table in self.superseded
+                       if not read[table] and table in self.offsets and not self.offsets[table].get('closed')}
+            if time.monotonic() - last_checkpoint >= self.checkpoint_seconds or not consumed or drained:
+                self.checkpoint(drained)
+                last_checkpoint = time.monotonic()
+            if not consumed:
+                if once:
+                    logging.info(f"Caught up: {self.emitted} slots emitted, {self.late_rows} late rows recomputed by slot")
+                    return
+                time.sleep(poll_seconds)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Stream KPI computation from the extracted tables")
+    parser.add_argument("--once", action="store_true", help="Stop once every table is caught up")
+    parser.add_argument("--state", default=stream_settings['state_path'], help="State store path")
+    args = parser.parse_args(argv)
+
+    from transformer import Transformer
+    os.makedirs(os.path.dirname(args.state) or '.', exist_ok=True)
+    store = WindowStateStore(args.state, stream_settings['cache_size'])
+    try:
+        StreamingTransformer(Transformer(), store).run(once=args.once)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,55 @@
+import logging
+from collections import OrderedDict
+from typing import Optional
+from config import SUFFIX_CACHE_SIZE
+from tools import resolve_suffix
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class SuffixDimension:
+    """Map suffixes to suffix_dim IDs, inserting unseen suffixes on first use.
+
+    IDs are kept in a bounded LRU so each distinct suffix costs one round-trip
+    per process instead of one string resolution per detail row.
+
+    The connection must be dedicated to the dimension: it is switched to
+    autocommit, so a suffix_dim row is committed before any detail row uses its
+    ID, and a writer transaction rolling back never leaves a cached ID without
+    its row.
+    """
+
+    def __init__(self, conn, max_size: int = SUFFIX_CACHE_SIZE):
+        self.conn = conn
+        self.conn.autocommit(True)
+        self.cursor = conn.cursor()
+        self.max_size = max_size
+        self.ids: "OrderedDict[str, int]" = OrderedDict()
+
+    def get_id(self, suffix: str) -> Optional[int]:
+        """Return the suffix_dim ID for a suffix, creating the row if needed."""
+        if suffix in self.ids:
+            self.ids.move_to_end(suffix)
+            return self.ids[suffix]
+
+        info = resolve_suffix(suffix)
+        try:
+            # LAST_INSERT_ID(id) makes lastrowid return the existing ID on duplicates
+            self.cursor.execute(
+                """
+                INSERT INTO suffix_dim (suffix, operator, type, in_suffix, out_suffix)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+                """,
+                (info.suffix, info.operator, info.type, info.in_suffix, info.out_suffix)
+            )
+            suffix_id = self.cursor.lastrowid
+        except Exception as e:
+            logging.error(f"Error resolving suffix_dim ID for {suffix}: {e}")
+            raise
+
+        self.ids[suffix] = suffix_id
+        if len(self.ids) > self.max_size:
+            self.ids.popitem(last=False)
+        return suffix_id
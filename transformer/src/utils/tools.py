@@ -1,10 +1,14 @@
 import MySQLdb
+import csv
 import json
 import os
-from typing import List, Dict, Any
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple, NamedTuple, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential
 import logging
-from config import KPI_FORMULAS_5MIN, KPI_FAMILIES
+from config import KPI_FORMULAS_5MIN, KPI_FAMILIES, SUFFIX_OPERATOR_MAPPING, SUFFIX_CACHE_SIZE, INDICATORS_DIR
+from indicators import IndicatorIndex, index_path
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -41,12 +45,79 @@ def create_main_table(cursor):
         logging.error(f"Error creating main table: {e}")
         raise
 
-def create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
-    """Create KPI-specific tables based on KPI_FORMULAS and KPI_FAMILIES config."""
+def create_watermark_table(cursor):
+    """Create kpi_watermarks: per node, the newest slot written and a version bumped on every commit."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_watermarks (
+            node VARCHAR(50) NOT NULL PRIMARY KEY,
+            last_date DATETIME NOT NULL,
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        );
+    """)
+    logging.info("✅ Table 'kpi_watermarks' created or already exists.")
+
+def bump_watermarks(cursor, touched: Dict[str, str]):
+    """Advance the watermark of every node in {node: newest date written} (no commit).
+
+    Readers cache KPI results per node version, so any write, including a
+    correction of an old slot, bumps the version.
+    """
+    if not touched:
+        return
+    cursor.executemany("""
+        INSERT INTO kpi_watermarks (node, last_date) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_date = GREATEST(last_date, VALUES(last_date)), version = version + 1
+    """, sorted(touched.items()))
+
+def ensure_summary_index(cursor) -> bool:
+    """Add a (Date, Node) index to kpi_summary if it has none, for per-slot replacement.
+
+    Returns:
+        True if the index was created, False if it already existed.
+    """
+    try:
+        cursor.execute("SHOW INDEX FROM kpi_summary WHERE Key_name = 'idx_date_node'")
+        if cursor.fetchall():
+            return False
+        cursor.execute("CREATE INDEX idx_date_node ON kpi_summary (Date, Node)")
+        logging.info("✅ Created index idx_date_node on 'kpi_summary'.")
+        return True
+    except MySQLdb.Error as e:
+        logging.error(f"Error creating index on kpi_summary: {e}")
+        raise
+
+def create_suffix_dim_table(cursor):
+    """Create the suffix dimension table if it doesn't exist."""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS suffix_dim (
+                id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                suffix VARCHAR(50) NOT NULL,
+                operator VARCHAR(50),
+                type VARCHAR(10),
+                in_suffix VARCHAR(50),
+                out_suffix VARCHAR(50),
+                UNIQUE KEY uq_suffix (suffix)
+            );
+        """)
+        logging.info("✅ Table 'suffix_dim' created or already exists.")
+    except MySQLdb.Error as e:
+        logging.error(f"Error creating suffix_dim table: {e}")
+        raise
+
+def create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES, use_suffix_dim: bool = False):
+    """Create KPI-specific tables based on KPI_FORMULAS and KPI_FAMILIES config.
+
+    With use_suffix_dim, suffix and operator are replaced by a suffix_id column
+    referencing suffix_dim.
+    """
+    suffix_columns = {"suffix_id INT"} if use_suffix_dim else {"suffix VARCHAR(50)", "operator VARCHAR(50)"}
+    suffix_fk = ",\n                FOREIGN KEY (suffix_id) REFERENCES suffix_dim(id)" if use_suffix_dim else ""
     try:
         # Create family-based tables
         for family, kpis in KPI_FAMILIES.items():
-            columns_set = {"kpi_id INT NOT NULL", "suffix VARCHAR(50)", "operator VARCHAR(50)", "kpi VARCHAR(50) NOT NULL", "type VARCHAR(10)"}
+            columns_set = {"kpi_id INT NOT NULL", "kpi VARCHAR(50) NOT NULL", "type VARCHAR(10)"} | suffix_columns
             # Collect all unique counters for the family
             all_fields = set()
             for kpi in kpis:
@@ -60,7 +131,7 @@ def create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
             CREATE TABLE IF NOT EXISTS {family}_details (
                 id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
                 {columns_str},
-                FOREIGN KEY (kpi_id) REFERENCES kpi_summary(Id)
+                FOREIGN KEY (kpi_id) REFERENCES kpi_summary(Id){suffix_fk}
             );
             """
             cursor.execute(create_query)
@@ -71,9 +142,14 @@ def create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
             if config.get('family') in KPI_FAMILIES:
                 continue  # Skip KPIs already handled in family tables
             columns_set = {"kpi_id INT NOT NULL"}
-            if config.get('Suffix', False):
-                columns_set.add("suffix VARCHAR(50)")
-            columns_set.add("operator VARCHAR(50)")
+            has_suffix = config.get('Suffix', False)
+            if use_suffix_dim:
+                if has_suffix:
+                    columns_set.update(suffix_columns)
+            else:
+                if has_suffix:
+                    columns_set.add("suffix VARCHAR(50)")
+                columns_set.add("operator VARCHAR(50)")
             all_fields = (
                 config.get('numerator', []) +
                 config.get('denominator', []) +
@@ -87,7 +163,7 @@ def create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
             CREATE TABLE IF NOT EXISTS {kpi}_details (
                 id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
                 {columns_str},
-                FOREIGN KEY (kpi_id) REFERENCES kpi_summary(Id)
+                FOREIGN KEY (kpi_id) REFERENCES kpi_summary(Id){suffix_fk if has_suffix else ""}
             );
             """
             cursor.execute(create_query)
@@ -96,11 +172,13 @@ def create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
         logging.error(f"Error creating KPI tables: {e}")
         raise
 
-def create_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
+def create_tables(cursor, KPI_FORMULAS, KPI_FAMILIES, use_suffix_dim: bool = False):
     """Create all necessary tables in the database."""
     try:
         create_main_table(cursor)
-        create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES)
+        if use_suffix_dim:
+            create_suffix_dim_table(cursor)
+        create_kpi_tables(cursor, KPI_FORMULAS, KPI_FAMILIES, use_suffix_dim)
         logging.info("✅ All tables created successfully.")
     except MySQLdb.Error as e:
         logging.error(f"Error creating tables: {e}")
@@ -109,6 +187,94 @@ def create_tables(cursor, KPI_FORMULAS, KPI_FAMILIES):
         logging.error(f"Unexpected error creating tables: {e}")
         raise
 
+def ensure_date_indicateur_index(cursor, table: str) -> bool:
+    """Add a composite (Date, indicateur) index to a table if it has none.
+
+    Returns:
+        True if the index was created, False if it already existed.
+    """
+    try:
+        cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = 'idx_date_indicateur'")
+        if cursor.fetchall():
+            return False
+        cursor.execute(f"CREATE INDEX idx_date_indicateur ON {table} (Date, indicateur)")
+        logging.info(f"✅ Created index idx_date_indicateur on '{table}'.")
+        return True
+    except MySQLdb.Error as e:
+        logging.error(f"Error creating index on {table}: {e}")
+        raise
+
+def ensure_row_id(cursor, table: str) -> bool:
+    """Add the auto-increment `id` primary key to an extracted table created without it.
+
+    Existing rows are numbered in their storage (insertion) order.
+
+    Returns:
+        True if the column was added, False if it already existed.
+    """
+    try:
+        cursor.execute(f"SHOW COLUMNS FROM {table} LIKE 'id'")
+        if cursor.fetchall():
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST")
+        logging.info(f"✅ Added row id to '{table}'.")
+        return True
+    except MySQLdb.Error as e:
+        logging.error(f"Error adding row id to {table}: {e}")
+        raise
+
+def load_indicator_prefixes(table: str) -> Dict[str, Tuple[Tuple[int, str], ...]]:
+    """Group the indicator dictionary of a table's base name by counter prefix.
+
+    The result is cached per dictionary file version (inode, mtime, size), so
+    counters added by the extractor's indicator sync, which replaces the
+    index file, are picked up by the next call.
+
+    Args:
+        table: Table name (e.g. calis_apg43_5_s06_a2024).
+
+    Returns:
+        Mapping of counter prefix to (ID_indicateur, indicateur) pairs, or an
+        empty dict if no dictionary exists for the table.
+    """
+    base_table_name = re.sub(r'_s\d+_a\d{4}$', '', table, flags=re.IGNORECASE).upper()
+    # Binary index kept current by the extractor's indicator sync, else the CSV export
+    for path in (index_path(INDICATORS_DIR, base_table_name), os.path.join(INDICATORS_DIR, f"indicateur_{base_table_name}.csv")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        return read_indicator_prefixes(path, (stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    logging.warning(f"Indicator CSV not found: {path}")
+    return {}
+
+@lru_cache(maxsize=64)
+def read_indicator_prefixes(path: str, version: Tuple[int, int, int]) -> Dict[str, Tuple[Tuple[int, str], ...]]:
+    """Group an indicator index or CSV by counter prefix (`version` only keys the cache)."""
+    grouped: Dict[str, List[Tuple[int, str]]] = {}
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                name = row['indicateur']
+                grouped.setdefault(name.split('.')[0], []).append((int(row['ID_indicateur']), name))
+    else:
+        index = IndicatorIndex(path)
+        for indicator_id, name, _ in index.items():
+            grouped.setdefault(name.split('.')[0], []).append((indicator_id, name))
+        index.close()
+    logging.info(f"Loaded {len(grouped)} counter prefixes from {path}")
+    return {prefix: tuple(entries) for prefix, entries in grouped.items()}
+
+def resolve_indicateur_names(table: str, prefixes: List[str]) -> List[str]:
+    """Resolve counter prefixes to the exact indicateur names known for a table.
+
+    Returns:
+        Sorted list of names, or an empty list if the table has no dictionary.
+    """
+    prefix_map = load_indicator_prefixes(table)
+    names = {name for prefix in prefixes for _, name in prefix_map.get(prefix, ())}
+    return sorted(names)
+
 def extract_noeud(pattern, texts):
     """Extracts prefixes from the provided list of texts using the given regex pattern."""
     matches = []
@@ -129,4 +295,83 @@ def extract_indicateur_suffixe(indicateur):
     if len(parts) == 2:
         return parts[0], parts[1]
     
-    return parts[0], None
\ No newline at end of file
+    return parts[0], None
+
+class SuffixInfo(NamedTuple):
+    """Operator and direction parsed from an indicateur suffix."""
+    suffix: str
+    operator: str
+    type: Optional[str]
+    in_suffix: Optional[str]
+    out_suffix: Optional[str]
+
+@lru_cache(maxsize=SUFFIX_CACHE_SIZE)
+def resolve_suffix(suffix: str) -> SuffixInfo:
+    """Resolve a suffix into operator, type and in/out parts (memoized per distinct suffix)."""
+    normalized_suffix = suffix.lower()
+    operator = "Unknown"
+    # Special case: NW and IE/IS means Inwi International
+    if 'nw' in normalized_suffix and ('ie' in normalized_suffix or 'is' in normalized_suffix):
+        operator = "Inwi International"
+    else:
+        # Fallback: check for other operator codes
+        for op_suffix in SUFFIX_OPERATOR_MAPPING.keys():
+            if op_suffix in normalized_suffix:
+                operator = SUFFIX_OPERATOR_MAPPING[op_suffix]
+                break
+    if operator == "Unknown":
+        logging.warning(f"No known operator found in suffix: {suffix} (normalized: {normalized_suffix})")
+
+    parts = suffix.split('-')
+    if len(parts) == 2:
+        suffix_type, in_suffix, out_suffix = 'E-S', parts[0], parts[1]
+    elif len(parts) == 1:
+        suffix_type, in_suffix, out_suffix = None, suffix, suffix
+    else:
+        suffix_type, in_suffix, out_suffix = None, None, None
+    return SuffixInfo(suffix, operator, suffix_type, in_suffix, out_suffix)
+
+def counter_values(kpi_config: Dict[str, Any], group_values: Dict[str, List[float]]) -> Dict[str, float]:
+    """Map each configured counter to its value in a suffix group."""
+    counters = {}
+    for field in ['numerator', 'denominator', 'additional']:
+        if field in kpi_config:
+            for i, prefix in enumerate(kpi_config[field]):
+                value = sum(group_values[field][i:i+1]) if i < len(group_values[field]) else 0
+                counters[prefix] = value
+    return counters
+
+def build_kpi_detail_row(kpi_config: Dict[str, Any], kpi: str, kpi_id: int, suffix: str, group_values: Dict[str, List[float]], kpi_value: float, kpi_type: str = None, suffix_dim=None) -> Tuple[str, Dict[str, Any]]:
+    """Build the details table name and column/value map for one KPI result.
+
+    When a SuffixDimension is given, the suffix is stored as suffix_id instead
+    of the suffix and operator strings.
+    """
+    table_name = f"{kpi_config.get('family', kpi).lower()}_details"
+
+    # Use a dictionary to store column-value pairs
+    column_value_map = {"kpi_id": kpi_id}
+    if kpi_config.get('family'):
+        column_value_map["kpi"] = kpi
+
+    has_suffix = kpi_config.get('Suffix', False) and suffix
+    if suffix_dim is not None:
+        if has_suffix:
+            column_value_map["suffix_id"] = suffix_dim.get_id(suffix)
+        elif kpi_config.get('Suffix', False):
+            column_value_map["suffix_id"] = None
+    elif has_suffix:
+        column_value_map["suffix"] = suffix
+        column_value_map["operator"] = resolve_suffix(suffix).operator
+    else:
+        column_value_map["operator"] = None
+
+    # Add type for family-based tables
+    if kpi_config.get('family'):
+        column_value_map["type"] = kpi_type if kpi_type else 'E-S'  # Default to 'E-S' if type not specified
+
+    # Aggregate values for each unique column
+    column_value_map.update(counter_values(kpi_config, group_values))
+
+    column_value_map["value"] = kpi_value
+    return table_name, column_value_map
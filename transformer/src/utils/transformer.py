@@ -1,30 +1,46 @@
-import pandas as pd
+from __future__ import annotations
+import time
 import logging
-from typing import Dict, List, Any
-from config import SOURCE_DB_CONFIG, DEST_DB_CONFIG, KPI_FORMULAS_5MIN, NOEUD_PATTERN_5_15, files_paths, SUFFIX_OPERATOR_MAPPING, KPI_FAMILIES
-from tools import connect_database, create_tables, extract_noeud, extract_indicateur_suffixe
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, TYPE_CHECKING
+from config import SOURCE_DB_CONFIG, DEST_DB_CONFIG, KPI_FORMULAS_5MIN, NOEUD_PATTERN_5_15, files_paths, KPI_FAMILIES, TRANSFORMER_WORKERS, WRITE_BATCH_SIZE, USE_SUFFIX_DIM, FILTER_MODE, CREATE_DATE_INDEX, ENABLE_ROLLUPS, STORAGE_LAYOUT, FACT_PARTITIONED, FACT_RETENTION_DAYS, INCREMENTAL, NODE_CODES
+from tools import connect_database, create_tables, create_suffix_dim_table, create_watermark_table, extract_noeud, extract_indicateur_suffixe, build_kpi_detail_row, resolve_indicateur_names, ensure_date_indicateur_index, ensure_summary_index
+from catalog import TableCatalog
+from writer import KpiBatchWriter
+from suffix_dim import SuffixDimension
+from rollup import KpiRollup, create_rollup_tables
+from fact import KpiFactWriter, create_fact_tables, drop_partitions_before
+from profiling import timed, profile_run, log_report
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 class Transformer:
     
-    def __init__(self):
+    def __init__(self, connect_dest: bool = True):
         self.source_conn = connect_database(SOURCE_DB_CONFIG)
         self.source_cursor = self.source_conn.cursor()
-        self.dest_conn = connect_database(DEST_DB_CONFIG)
-        self.dest_cursor = self.dest_conn.cursor()
+        self.dest_conn = connect_database(DEST_DB_CONFIG) if connect_dest else None
+        self.dest_cursor = self.dest_conn.cursor() if connect_dest else None
         self.kpi_formulas = KPI_FORMULAS_5MIN
         self.kpi_families = KPI_FAMILIES
         self.noeud_pattern = NOEUD_PATTERN_5_15
         self.tables = self.load_tables()
+        self.catalog = TableCatalog(self.tables)
+        self.storage_layout = STORAGE_LAYOUT
+        use_suffix_dim = USE_SUFFIX_DIM or self.storage_layout == 'long'
+        # Own autocommit connection, outside the writers' transactions
+        self.suffix_dim = SuffixDimension(connect_database(DEST_DB_CONFIG)) if (use_suffix_dim and connect_dest) else None
 
     def load_tables(self) -> List[str]:
         """Load table names from result_5min.txt."""
         try:
             with open(files_paths['5min'], 'r') as f:
                 tables = [line.strip() for line in f if line.strip()]
-            logging.info(f"Loaded {len(tables)} tables from {files_paths['5min']}: {tables}")
+            logging.info(f"Loaded {len(tables)} tables from {files_paths['5min']}")
             return tables
         except Exception as e:
             logging.error(f"Error loading tables from file: {e}")
@@ -33,7 +49,18 @@ class Transformer:
     def create_tables(self):
         """Create tables in the destination database."""
         try:
-            create_tables(self.dest_cursor, self.kpi_formulas, self.kpi_families)
+            if self.storage_layout == 'long':
+                create_suffix_dim_table(self.dest_cursor)
+                create_fact_tables(self.dest_cursor, self.kpi_formulas, FACT_PARTITIONED)
+                self.dest_conn.commit()
+                if FACT_PARTITIONED and FACT_RETENTION_DAYS > 0:
+                    # DDL, so outside any write transaction
+                    drop_partitions_before(self.dest_cursor, (datetime.now() - timedelta(days=FACT_RETENTION_DAYS)).strftime("%Y-%m-%d"))
+            else:
+                create_tables(self.dest_cursor, self.kpi_formulas, self.kpi_families, USE_SUFFIX_DIM)
+            if ENABLE_ROLLUPS:
+                create_rollup_tables(self.dest_cursor)
+            create_watermark_table(self.dest_cursor)
             self.dest_conn.commit()
             logging.info("Tables created successfully in destination database.")
         except Exception as e:
@@ -41,6 +68,13 @@ class Transformer:
             self.dest_conn.rollback()
             raise
 
+    def ensure_source_indexes(self):
+        """Add the (Date, indicateur) index to every source table that lacks it."""
+        for table in self.tables:
+            ensure_date_indicateur_index(self.source_cursor, table)
+        self.source_conn.commit()
+
+    @timed('get_distinct_dates')
     def get_distinct_dates(self, table: str) -> List[str]:
         """Retrieve distinct Date values from a table in the source database."""
         try:
@@ -55,6 +89,9 @@ class Transformer:
 
     def extract_node(self, table: str) -> str:
         """Extract Node from table name."""
+        descriptor = self.catalog.get(table)
+        if descriptor:
+            return descriptor.node
         matches = extract_noeud(self.noeud_pattern, [table])
         if matches:
             node = matches[0][1]
@@ -63,6 +100,7 @@ class Transformer:
         logging.warning(f"No node found in table name: {table}")
         return None
 
+    @timed('filter_indicateur_values')
     def filter_indicateur_values(self, table: str, date: str, kpi: str = None, family: str = None) -> pd.DataFrame:
         """Filter indicateur values for a specific KPI or family and date from the source database."""
         if family:
@@ -78,16 +116,27 @@ class Transformer:
             kpi_config = self.kpi_formulas[kpi]
             prefixes = kpi_config.get('numerator', []) + kpi_config.get('denominator', []) + kpi_config.get('additional', [])
         
+        names = resolve_indicateur_names(table, prefixes) if FILTER_MODE == 'in' else []
         try:
-            query = f"""
-                SELECT indicateur, valeur
-                FROM {table}
-                WHERE Date = %s AND ({' OR '.join(['indicateur LIKE %s' for _ in prefixes])})
-            """
-            params = [date] + [f"{prefix}%" for prefix in prefixes]
+            if names:
+                # Exact IN-list lets MySQL use the (Date, indicateur) index as a range lookup
+                query = f"""
+                    SELECT indicateur, valeur
+                    FROM {table}
+                    WHERE Date = %s AND indicateur IN ({', '.join(['%s'] * len(names))})
+                """
+                params = [date] + names
+            else:
+                query = f"""
+                    SELECT indicateur, valeur
+                    FROM {table}
+                    WHERE Date = %s AND ({' OR '.join(['indicateur LIKE %s' for _ in prefixes])})
+                """
+                params = [date] + [f"{prefix}%" for prefix in prefixes]
             self.source_cursor.execute(query, params)
             data = self.source_cursor.fetchall()
             
+            import pandas as pd  # deferred so short-lived tasks that skip work never load it
             df = pd.DataFrame(data, columns=['indicateur', 'valeur'])
             if df.empty:
                 logging.warning(f"No data found for {kpi or family} on {date} in {table}")
@@ -98,6 +147,7 @@ class Transformer:
             logging.error(f"Error filtering indicateur values for {kpi or family} from {table}: {e}")
             raise
 
+    @timed('group_by_suffix')
     def group_by_suffix(self, df: pd.DataFrame, kpi: str) -> List[Dict[str, Any]]:
         """Group filtered data by suffix if applicable, with type logic for families."""
         kpi_config = self.kpi_formulas[kpi]
@@ -211,6 +261,7 @@ class Transformer:
         logging.info(f"Grouped data by suffix for {kpi}: {[item['suffix'] for item in result]}")
         return result
 
+    @timed('calculate_group_values')
     def calculate_group_values(self, df: pd.DataFrame, kpi_config: Dict) -> Dict[str, List[float]]:
         """Calculate values for numerator, denominator, and additional fields."""
         result = {
@@ -228,6 +279,7 @@ class Transformer:
                 result['additional'].append(float(row['valeur']))
         return result
 
+    @timed('calculate_kpi')
     def calculate_kpi(self, kpi: str, group_values: Dict[str, List[float]]) -> float:
         """Calculate KPI value using the formula."""
         kpi_config = self.kpi_formulas[kpi]
@@ -249,6 +301,7 @@ class Transformer:
             logging.error(f"Error calculating {kpi}: {e}")
             return None
 
+    @timed('insert_kpi_summary')
     def insert_kpi_summary(self, date: str, node: str) -> int:
         """Insert into kpi_summary in the destination database and return the generated ID."""
         try:
@@ -264,48 +317,10 @@ class Transformer:
             self.dest_conn.rollback()
             raise
 
+    @timed('insert_kpi_details')
     def insert_kpi_details(self, kpi: str, kpi_id: int, suffix: str, group_values: Dict[str, List[float]], kpi_value: float, kpi_type: str = None):
         """Insert into KPI details table in the destination database, including operator and type."""
-        kpi_config = self.kpi_formulas[kpi]
-        table_name = f"{kpi_config.get('family', kpi).lower()}_details"
-        
-        # Use a dictionary to store column-value pairs
-        column_value_map = {"kpi_id": kpi_id}
-        if kpi_config.get('family'):
-            column_value_map["kpi"] = kpi
-        
-        if kpi_config.get('Suffix', False) and suffix:
-            column_value_map["suffix"] = suffix
-            # Parse suffix to determine operator
-            normalized_suffix = suffix.lower()
-            operator = "Unknown"
-            # Special case: NW and IE/IS means Inwi International
-            if 'nw' in normalized_suffix and ('ie' in normalized_suffix or 'is' in normalized_suffix):
-                operator = "Inwi International"
-            else:
-                # Fallback: check for other operator codes
-                for op_suffix in SUFFIX_OPERATOR_MAPPING.keys():
-                    if op_suffix in normalized_suffix:
-                        operator = SUFFIX_OPERATOR_MAPPING[op_suffix]
-                        break
-            column_value_map["operator"] = operator
-            if operator == "Unknown":
-                logging.warning(f"No known operator found in suffix: {suffix} (normalized: {normalized_suffix})")
-        else:
-            column_value_map["operator"] = None
-
-        # Add type for family-based tables
-        if kpi_config.get('family'):
-            column_value_map["type"] = kpi_type if kpi_type else 'E-S'  # Default to 'E-S' if type not specified
-
-        # Aggregate values for each unique column
-        for field in ['numerator', 'denominator', 'additional']:
-            if field in kpi_config:
-                for i, prefix in enumerate(kpi_config[field]):
-                    value = sum(group_values[field][i:i+1]) if i < len(group_values[field]) else 0
-                    column_value_map[prefix] = value
-
-        column_value_map["value"] = kpi_value
+        table_name, column_value_map = build_kpi_detail_row(self.kpi_formulas[kpi], kpi, kpi_id, suffix, group_values, kpi_value, kpi_type, self.suffix_dim)
 
         # Convert to lists for SQL insertion
         columns = list(column_value_map.keys())
@@ -324,56 +339,162 @@ class Transformer:
             self.dest_conn.rollback()
             raise
 
-    def process(self):
-        """Main process to handle all tables."""
-        self.create_tables()
-        
-        for table in self.tables:
-            node = self.extract_node(table)
-            if not node:
-                continue
-                
-            dates = self.get_distinct_dates(table)
-            for date in dates:
-                kpi_summary_id = self.insert_kpi_summary(date, node)
-                
-                # Process family-based KPIs (Traffic)
-                for family, kpis in self.kpi_families.items():
-                    df = self.filter_indicateur_values(table, date, family=family)
-                    for kpi in kpis:
-                        # Filter df for this KPI's counters
-                        kpi_config = self.kpi_formulas[kpi]
-                        prefixes = kpi_config.get('numerator', []) + kpi_config.get('denominator', []) + kpi_config.get('additional', [])
-                        kpi_df = df[df['indicateur'].str.startswith(tuple(prefixes))]
-                        grouped_data = self.group_by_suffix(kpi_df, kpi)
-                        
-                        for group in grouped_data:
-                            suffix = group['suffix']
-                            group_values = group['values']
-                            kpi_type = group.get('type')
-                            kpi_value = self.calculate_kpi(kpi, group_values)
-                            self.insert_kpi_details(kpi, kpi_summary_id, suffix, group_values, kpi_value, kpi_type)
-
-                # Process non-family KPIs
-                for kpi in self.kpi_formulas.keys():
-                    if self.kpi_formulas[kpi].get('family') in self.kpi_families:
-                        continue  # Skip KPIs already processed in family
-                    df = self.filter_indicateur_values(table, date, kpi=kpi)
-                    grouped_data = self.group_by_suffix(df, kpi)
-                    
-                    for group in grouped_data:
-                        suffix = group['suffix']
-                        group_values = group['values']
-                        kpi_type = group.get('type')
-                        kpi_value = self.calculate_kpi(kpi, group_values)
-                        self.insert_kpi_details(kpi, kpi_summary_id, suffix, group_values, kpi_value, kpi_type)
+    def compute_slot(self, table: str, date: str) -> List[Dict[str, Any]]:
+        """Compute every KPI result for one (table, date) slot without writing anything."""
+        return self.compute_results(lambda kpi=None, family=None: self.filter_indicateur_values(table, date, kpi=kpi, family=family))
+
+    def compute_rows(self, rows: List[tuple]) -> List[Dict[str, Any]]:
+        """Compute every KPI result of one slot from its (indicateur, valeur) rows."""
+        import pandas as pd
+        df = pd.DataFrame(rows, columns=['indicateur', 'valeur'])
+
+        def select(kpi=None, family=None):
+            kpis = self.kpi_families[family] if family else [kpi]
+            prefixes = set()
+            for k in kpis:
+                config = self.kpi_formulas[k]
+                prefixes.update(config.get('numerator', []) + config.get('denominator', []) + config.get('additional', []))
+            return df[df['indicateur'].str.startswith(tuple(prefixes))]
+
+        return self.compute_results(select)
+
+    def compute_results(self, select) -> List[Dict[str, Any]]:
+        """Compute KPI results from `select(kpi=..., family=...)`, which returns the matching rows as a DataFrame."""
+        results = []
+
+        # Process family-based KPIs (Traffic)
+        for family, kpis in self.kpi_families.items():
+            df = select(family=family)
+            for kpi in kpis:
+                # Filter df for this KPI's counters
+                kpi_config = self.kpi_formulas[kpi]
+                prefixes = kpi_config.get('numerator', []) + kpi_config.get('denominator', []) + kpi_config.get('additional', [])
+                kpi_df = df[df['indicateur'].str.startswith(tuple(prefixes))]
+                for group in self.group_by_suffix(kpi_df, kpi):
+                    results.append(self.build_result(kpi, group))
+
+        # Process non-family KPIs
+        for kpi in self.kpi_formulas.keys():
+            if self.kpi_formulas[kpi].get('family') in self.kpi_families:
+                continue  # Skip KPIs already processed in family
+            df = select(kpi=kpi)
+            for group in self.group_by_suffix(df, kpi):
+                results.append(self.build_result(kpi, group))
+
+        return results
+
+    def build_result(self, kpi: str, group: Dict[str, Any]) -> Dict[str, Any]:
+        """Calculate the KPI value for one suffix group."""
+        return {
+            'kpi': kpi,
+            'suffix': group['suffix'],
+            'type': group.get('type'),
+            'values': group['values'],
+            'value': self.calculate_kpi(kpi, group['values'])
+        }
+
+    def process(self, workers: int = TRANSFORMER_WORKERS):
+        """Main process to handle all tables.
+
+        With workers > 1, (table, date-range) shards are computed in a process
+        pool; see parallel.process_parallel. With TRANSFORMER_INCREMENTAL=1 only
+        the slots changed since the last run are recomputed; see
+        changes.process_changes. With ETL_PROFILE=1 a per-stage timing
+        breakdown is logged at the end.
+        """
+        start = time.perf_counter()
+        try:
+            with profile_run("transformer"):
+                self.create_tables()
+                if CREATE_DATE_INDEX:
+                    self.ensure_source_indexes()
+
+                if INCREMENTAL:
+                    from changes import process_changes
+                    process_changes(self)
+                    return
+
+                if workers > 1:
+                    from parallel import process_parallel
+                    process_parallel(self, workers)
+                    return
+
+                for table in self.tables:
+                    self.process_table(table)
+        finally:
+            log_report("Transformer", time.perf_counter() - start)
+
+    def create_writer(self, batch_size: int = WRITE_BATCH_SIZE) -> KpiBatchWriter:
+        """Create a batched writer for the configured storage layout, with rollups if enabled."""
+        rollup = KpiRollup(self.dest_conn, self.kpi_formulas) if ENABLE_ROLLUPS else None
+        if self.storage_layout == 'long':
+            return KpiFactWriter(self.dest_conn, self.kpi_formulas, batch_size, self.suffix_dim, rollup, FACT_PARTITIONED)
+        return KpiBatchWriter(self.dest_conn, self.kpi_formulas, batch_size, self.suffix_dim, rollup)
+
+    def delete_slot(self, date: str, node: str) -> bool:
+        """Delete the stored KPI results of one (date, node) slot (no commit).
+
+        Returns:
+            True if the slot had results.
+        """
+        if self.storage_layout == 'long':
+            self.dest_cursor.execute("DELETE FROM kpi_fact WHERE ts = %s AND node = %s", (date, NODE_CODES[node]))
+            return self.dest_cursor.rowcount > 0
+
+        self.dest_cursor.execute("SELECT Id FROM kpi_summary WHERE Date = %s AND Node = %s", (date, node))
+        ids = [row[0] for row in self.dest_cursor.fetchall()]
+        if not ids:
+            return False
+        placeholders = ', '.join(['%s'] * len(ids))
+        detail_tables = sorted({f"{kpi_config.get('family', kpi).lower()}_details" for kpi, kpi_config in self.kpi_formulas.items()})
+        for table_name in detail_tables:
+            self.dest_cursor.execute(f"DELETE FROM {table_name} WHERE kpi_id IN ({placeholders})", ids)
+        self.dest_cursor.execute(f"DELETE FROM kpi_summary WHERE Id IN ({placeholders})", ids)
+        return True
+
+    def process_table(self, table: str, start_date: str = None, end_date: str = None, replace: bool = False) -> int:
+        """Transform one table, optionally limited to dates in [start_date, end_date].
+
+        Dates are compared as 'YYYY-MM-DD HH:MM:SS' strings. With replace=True
+        (reprocessing a range), slots that already have results are deleted and
+        rewritten, with their rollups, instead of being inserted again.
+
+        Returns:
+            Number of (date, node) slots written.
+        """
+        node = self.extract_node(table)
+        if not node:
+            return 0
+
+        dates = [
+            date for date in sorted(self.get_distinct_dates(table))
+            if (start_date is None or date >= start_date) and (end_date is None or date <= end_date)
+        ]
+        if replace:
+            from changes import recompute_slots
+            if self.storage_layout != 'long':
+                ensure_summary_index(self.dest_cursor)
+            replaced = recompute_slots(self, table, dates)
+            logging.info(f"Transformed {len(dates)} dates from {table} ({replaced} replaced existing results)")
+            return len(dates)
+        writer = self.create_writer()
+        writer.prepare(dates)
+        for date in dates:
+            writer.write(date, node, self.compute_slot(table, date))
+        writer.close()
+        logging.info(f"Transformed {len(dates)} dates from {table}")
+        return len(dates)
 
     def __del__(self):
         """Cleanup database connections."""
         self.source_cursor.close()
         self.source_conn.close()
-        self.dest_cursor.close()
-        self.dest_conn.close()
+        if self.dest_conn is not None:
+            self.dest_cursor.close()
+            self.dest_conn.close()
+        if self.suffix_dim is not None:
+            self.suffix_dim.cursor.close()
+            self.suffix_dim.conn.close()
         logging.info("Database connections closed.")
 
 if __name__ == "__main__":
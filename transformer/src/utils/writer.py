@@ -0,0 +1,103 @@
+import logging
+from typing import Dict, Iterable, List, Any, Tuple
+from tools import build_kpi_detail_row, bump_watermarks
+from profiling import timed
+
+# Logging setup
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def counters_of(kpi_config: Dict[str, Any], row: Dict[str, Any]) -> Dict[str, float]:
+    """Pick the counter columns of a detail row."""
+    names = kpi_config.get('numerator', []) + kpi_config.get('denominator', []) + kpi_config.get('additional', [])
+    return {name: row[name] for name in names if name in row}
+
+
+class KpiBatchWriter:
+    """Buffer KPI detail rows and write them with executemany.
+
+    kpi_summary rows are inserted one at a time, in the order write() is called,
+    so their auto-increment IDs follow the caller's (table, date) order.
+    Detail rows are grouped by (table, columns) and flushed every `batch_size` rows.
+    An optional KpiRollup is updated in the same transaction.
+    """
+
+    def __init__(self, conn, kpi_formulas: Dict[str, Any], batch_size: int = 1000, suffix_dim=None, rollup=None):
+        self.conn = conn
+        self.suffix_dim = suffix_dim
+        self.rollup = rollup
+        self.cursor = conn.cursor()
+        self.kpi_formulas = kpi_formulas
+        self.batch_size = batch_size
+        self.buffers: Dict[Tuple[str, Tuple[str, ...]], List[list]] = {}
+        self.pending = 0
+        self.summary_rows = 0
+        self.detail_rows = 0
+        self.touched: Dict[str, str] = {}
+
+    def prepare(self, dates: Iterable[str]):
+        """Nothing to create before writing; see KpiFactWriter.prepare."""
+
+    def insert_summary(self, date: str, node: str) -> int:
+        """Insert one kpi_summary row and return its ID."""
+        self.cursor.execute("INSERT INTO kpi_summary (Date, Node) VALUES (%s, %s)", (date, node))
+        self.summary_rows += 1
+        return self.cursor.lastrowid
+
+    def write(self, date: str, node: str, results: List[Dict[str, Any]]) -> int:
+        """Queue all KPI results computed for one (date, node) slot.
+
+        Args:
+            date: Measurement timestamp.
+            node: Node name.
+            results: Items with kpi, suffix, type, values and value keys.
+
+        Returns:
+            The kpi_summary ID assigned to the slot.
+        """
+        kpi_id = self.insert_summary(date, node)
+        self.touched[node] = max(self.touched.get(node, date), date)
+        for item in results:
+            table_name, row = build_kpi_detail_row(
+                self.kpi_formulas[item['kpi']], item['kpi'], kpi_id,
+                item['suffix'], item['values'], item['value'], item['type'], self.suffix_dim
+            )
+            key = (table_name, tuple(row.keys()))
+            self.buffers.setdefault(key, []).append(list(row.values()))
+            self.pending += 1
+            if self.rollup is not None:
+                self.rollup.add(date, node, item['kpi'], item['suffix'], counters_of(self.kpi_formulas[item['kpi']], row),
+                                item['value'])
+
+        if self.pending >= self.batch_size:
+            self.flush()
+        return kpi_id
+
+    @timed('write_details_flush')
+    def flush(self):
+        """Write all buffered detail rows and commit."""
+        try:
+            for (table_name, columns), rows in self.buffers.items():
+                placeholders = ', '.join(['%s'] * len(columns))
+                query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+                self.cursor.executemany(query, rows)
+            if self.rollup is not None:
+                self.rollup.flush()
+            bump_watermarks(self.cursor, self.touched)
+            self.conn.commit()
+            self.detail_rows += self.pending
+            if self.pending:
+                logging.info(f"Flushed {self.pending} KPI detail rows into {len(self.buffers)} table batches")
+        except Exception as e:
+            logging.error(f"Error flushing KPI detail rows: {e}")
+            self.conn.rollback()
+            raise
+        finally:
+            self.buffers = {}
+            self.pending = 0
+            self.touched = {}
+
+    def close(self):
+        """Flush remaining rows and release the cursor."""
+        self.flush()
+        self.cursor.close()